@@ -1,13 +1,42 @@
 import os
-from flask import Flask, request, jsonify, send_file
+import queue
+import threading
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
-from utils import risk_engine, trait_engine
-from utils.dna_parser import parse_raw_dna_file
+from werkzeug.utils import secure_filename
+from utils.dna_parser import parse_raw_dna_file, genome_from_genotypes
+from utils.genome_arrays import chrom_code
+from utils.genome_merge import merge_genomes
+from utils.genome_qc import QCError, genome_sex
+from utils.genome_summary import summarize_genome
+from utils.ancestry_estimator import ancestry_report, blend_ancestry
+from utils.haplogroup_engine import assign_haplogroups
+from utils.pgx_engine import call_star_alleles
+from utils.ld_proxies import fill_from_proxies
+from utils.genome_store import query_snps, store_genome
+from utils.panel_manifest import PanelVersionError, decode_panel_payload, is_panel_genome, manifest_document
+from utils.session_store import (
+    UnknownGenome,
+    delete_genome,
+    open_session,
+    session_genome,
+    session_result,
+    touch_session,
+)
 from utils.trait_engine import predict_traits
 from utils.risk_engine import compute_health_risk
-from utils.child_predictor import predict_child
+from utils.prs_engine import compute_prs
+from utils.carrier_engine import detect_carrier_status
+from utils.apoe import compute_apoe_genotype
+from utils.fast_model import FAST_LOCI, run_fast_preview
+from utils.population_freqs import load_freq_table
+from utils.response_encoding import MSGPACK_TYPES, encode_payload, negotiate
+from utils.child_predictor import MODEL_LOCI, predict_child
 from utils.pdf_engine import generate_pdf_report
 from utils.genotype_panel import extract_genotype_panel
+from utils.trio_engine import check_trio
+from utils.partner_simulator import simulate_partners
+from utils.sparse_genome import sparse_genome_from_traits
 
 app = Flask(__name__)
 CSRF_COOKIE_SECURE = True
@@ -36,109 +65,666 @@ def extract_key_snps(genome, snps):
 # ---------------------------------------------------------
 # Helper
 # ---------------------------------------------------------
+@app.errorhandler(QCError)
+def qc_failed(e):
+    """Uploads rejected by the parser's QC stage (see genome_qc)."""
+    return jsonify({"status": "error", "error": str(e), "message": str(e), "qc": e.report}), 422
+
+
+@app.errorhandler(UnknownGenome)
+def unknown_genome(e):
+    """Handles that expired from the session store and were never persisted."""
+    return jsonify({"status": "error", "message": "Unknown or expired genome_id; upload the file again"}), 404
+
+
 def load_genome_from_request(upload):
     """Reads raw DNA file"""
-    filepath = f"upload/{upload.filename}"
-    upload.save(filepath)
+    filepath, = save_uploads([upload])
 
     genome = parse_raw_dna_file(filepath)
     return genome
 
 
+def open_upload(genome, name, results=None):
+    """
+    Persists a parsed upload (for /snp) and keeps it in session, with
+    model loci the chip lacks filled from LD proxies. Returns its genome id.
+    """
+    genome_id = store_genome(genome, name=name, qc_reports=(results or {}).get("qc"))
+    proxies = fill_from_proxies(genome)
+    return open_session(genome_id, genome, {**(results or {}), "proxies": proxies})
+
+
+def genome_from_request_value(value):
+    """
+    A genome passed to an endpoint: a genome id (or {"genome_id": ...})
+    from an earlier upload, or a genotype mapping (see genome_from_genotypes).
+    ValueError for values that are neither.
+    """
+    if isinstance(value, dict) and "genome_id" in value:
+        value = value["genome_id"]
+    if isinstance(value, str):
+        return session_genome(value)
+    return genome_from_genotypes(value)
+
+
+# Engine results of a genome, in the order they are streamed
+# ("health" is composed from prs / carrier / apoe, see report_part)
+REPORT_PARTS = {
+    "traits": predict_traits,
+    "carrier": detect_carrier_status,
+    "apoe": compute_apoe_genotype,
+    "prs": compute_prs,
+    "health": None,
+    "genotype_panel": extract_genotype_panel,
+    "ancestry": ancestry_report,
+    # a panel upload is too sparse for chromosome-level summaries
+    "genome_summary": lambda genome: None if is_panel_genome(genome) else summarize_genome(genome),
+    "haplogroups": assign_haplogroups,
+    "pgx": call_star_alleles,
+    "merge": lambda genome: None,
+    "qc": lambda genome: [genome.qc] if getattr(genome, "qc", None) else [],
+    "proxies": fill_from_proxies,
+}
+
+
+def report_part(genome_id, name):
+    """One result of a session (see REPORT_PARTS), computed once."""
+    if name == "health":
+        return session_result(genome_id, "health", lambda genome: compute_health_risk(
+            genome,
+            prs=report_part(genome_id, "prs"),
+            carriers_info=report_part(genome_id, "carrier"),
+            apoe=report_part(genome_id, "apoe"),
+        ))
+    return session_result(genome_id, name, REPORT_PARTS[name])
+
+
+# Selectable sections of the single-upload report: (response key, report part)
+REPORT_SECTIONS = {
+    "traits": ("traits", "traits"),
+    "health": ("health", "health"),
+    "prs": ("prs", "prs"),
+    "carriers": ("carriers", "carrier"),
+    "apoe": ("apoe", "apoe"),
+    "panel": ("genotype_panel", "genotype_panel"),
+    "ancestry": ("ancestry_detail", "ancestry"),
+    "summary": ("genome_summary", "genome_summary"),
+    "haplogroups": ("haplogroups", "haplogroups"),
+    "pgx": ("pgx", "pgx"),
+    "qc": ("qc", "qc"),
+    "merge": ("merge", "merge"),
+    "proxies": ("proxies", "proxies"),
+}
+# The default JSON report carries prs / carriers / apoe inside health
+# only, as it did before sections; the default stream still sends them
+# as events of their own (see stream_upload)
+DEFAULT_SECTIONS = [s for s in REPORT_SECTIONS if s not in ("prs", "carriers", "apoe")]
+
+# The streamed preview waits for fast-model loci up to this chromosome
+# (HERC2 / OCA2, SLC24A5, MC1R), so it goes out a quarter of the way in
+PREVIEW_MAX_CHROM = 16
+
+
+def requested_sections():
+    """
+    ?sections=traits,health (query, form or JSON field) -> section list;
+    None = the full default report. ValueError for unknown sections.
+    """
+    value = request.args.get("sections") or request.form.get("sections") \
+        or (request.get_json(silent=True) or {}).get("sections")
+    if not value:
+        return None
+    sections = value.split(",") if isinstance(value, str) else list(value)
+    sections = [s.strip().lower() for s in sections if s.strip()]
+    # "risk" is the old name of health
+    sections = ["health" if s == "risk" else s for s in sections]
+    unknown = [s for s in sections if s not in REPORT_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(unknown)} (known: {', '.join(REPORT_SECTIONS)})")
+    return sections
+
+
+def requested_flag(name):
+    """An on/off option given as a query, form or JSON field (stream=1, compact=true, ...)."""
+    value = request.values.get(name)
+    if value is None:
+        value = (request.get_json(silent=True) or {}).get(name)
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
+
+
+def compact_requested():
+    """
+    Compact clients get aliases as references instead of copies: asked
+    for with compact=1, or implied when MessagePack is what gets served.
+    """
+    media, _ = negotiate(request.headers.get("Accept"), request.headers.get("Accept-Encoding"))
+    return requested_flag("compact") or media in MSGPACK_TYPES
+
+
+def genome_report(genome_id, sections=None, compact=False):
+    """
+    Single-genome results of a session; every part is computed once, and
+    only for the requested sections (see REPORT_SECTIONS). compact:
+    "risk" is sent as {"aliases": {"risk": "health"}} instead of a copy.
+    """
+    report = {"status": "ok", "genome_id": genome_id}
+    for section in sections or DEFAULT_SECTIONS:
+        key, part = REPORT_SECTIONS[section]
+        report[key] = report_part(genome_id, part)
+
+    if "ancestry_detail" in report:
+        report["ancestry"] = report["ancestry_detail"]["proportions"]
+    if "health" in report:
+        if compact:
+            report["aliases"] = {"risk": "health"}
+        else:
+            report["risk"] = report["health"]  # backward compatibility alias
+    return report
+
+
+def encoded(payload, status=200):
+    """Response with the encoding the client negotiated (see response_encoding)."""
+    body, headers = encode_payload(
+        payload, request.headers.get("Accept"), request.headers.get("Accept-Encoding")
+    )
+    return Response(body, status=status, headers=headers)
+
+
+def parent_report(genome_id):
+    genome = session_genome(genome_id)
+    return {
+        "genome_id": genome_id,
+        "traits": report_part(genome_id, "traits"),
+        "ancestry": report_part(genome_id, "ancestry")["proportions"],
+        "health": report_part(genome_id, "health"),
+        "key_genotypes": {
+            "rs12913832": genome.get("rs12913832", {}).get("genotype")
+        },
+        "key_snps": {
+            "eye": extract_key_snps(genome, EYE_SNPS),
+            "hair": extract_key_snps(genome, HAIR_SNPS),
+            "skin": extract_key_snps(genome, SKIN_SNPS),
+        },
+        "proxies": report_part(genome_id, "proxies"),
+    }
+
+
 # ---------------------------------------------------------
 # 1) SINGLE DNA UPLOAD – TRAIT + HEALTH
 # ---------------------------------------------------------
+def save_uploads(files):
+    UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+    paths = []
+    for file in files:
+        file_path = os.path.join(UPLOAD_FOLDER, secure_filename(file.filename) or "upload.txt")
+        file.save(file_path)
+        paths.append(file_path)
+    return paths
+
+
+def parse_uploads(paths, names, merge_policy, on_preview_loci=None):
+    """
+    Parses (and merges) one person's files. on_preview_loci: called with
+    the fast-model loci on chromosomes 1-PREVIEW_MAX_CHROM of the first
+    file as soon as the parser is past them (see parse_raw_dna_file).
+    Returns (genome, parsed files, merge report); QCError for files that
+    fail QC, ValueError for files that cannot be merged.
+    """
+    genomes = []
+    for i, path in enumerate(paths):
+        if i == 0 and on_preview_loci is not None:
+            table = load_freq_table()
+            chroms = dict(zip(table["rsids"], table["chroms"]))
+            # only loci up to PREVIEW_MAX_CHROM hold the preview back; the
+            # chromosome 20 modifiers are scored as missing in it
+            watch = {
+                rsid: chroms.get(rsid) for rsid in FAST_LOCI
+                if chrom_code(chroms.get(rsid)) <= PREVIEW_MAX_CHROM
+            }
+            genomes.append(parse_raw_dna_file(path, watch=watch, on_watched=on_preview_loci))
+        else:
+            genomes.append(parse_raw_dna_file(path))
+
+    if len(genomes) == 1:
+        return genomes[0], genomes, None
+    genome, merge_report = merge_genomes(genomes, policy=merge_policy, names=names)
+    return genome, genomes, merge_report
+
+
+def stream_upload(paths, names, merge_policy, sections=None):
+    """
+    NDJSON events for a streamed /upload_dna, one JSON object per line:
+      {"event": "preview", "model": "fast", "traits": {...}}   (past chromosome 16)
+      {"event": "parsed", "genome_id": ..., "snps": ..., "qc": [...], "merge": ..., "proxies": [...]}
+      {"event": "traits" | "carrier" | "apoe" | "prs" | "health" | ..., "data": {...}}
+      {"event": "done", "genome_id": ...}
+    or {"event": "error", "message": ...} when the upload is rejected.
+    sections: only these engines run (see REPORT_SECTIONS); by default
+    every part is sent, health's carrier / apoe / prs inputs included.
+    The preview is sent whenever traits are wanted.
+    The work runs in a thread so events go out as soon as they exist.
+    """
+    events = queue.Queue()
+
+    def emit(event, **payload):
+        events.put(app.json.dumps({"event": event, **payload}) + "\n")
+
+    def preview(calls):
+        emit("preview", model="fast", loci=len(calls), traits=run_fast_preview(calls))
+
+    parts = [REPORT_SECTIONS[s][1] for s in sections] if sections else list(REPORT_PARTS)
+    wanted = [name for name in REPORT_PARTS if name in parts and name not in ("merge", "qc", "proxies")]
+
+    def work():
+        try:
+            genome, genomes, merge_report = parse_uploads(
+                paths, names, merge_policy, on_preview_loci=preview if "traits" in parts else None
+            )
+            genome_id = open_upload(
+                genome,
+                name=", ".join(names),
+                results={"merge": merge_report, "qc": [g.qc for g in genomes]},
+            )
+            emit("parsed", genome_id=genome_id, snps=len(genome), qc=report_part(genome_id, "qc"),
+                 merge=merge_report, proxies=report_part(genome_id, "proxies"))
+            for name in wanted:
+                emit(name, data=report_part(genome_id, name))
+            emit("done", genome_id=genome_id)
+        except QCError as e:
+            emit("error", message=str(e), qc=e.report)
+        except ValueError as e:
+            emit("error", message=str(e))
+        except Exception as e:
+            # the response is already streaming; end it with an error event
+            app.logger.exception("Streamed upload failed")
+            emit("error", message=f"Upload failed: {e}")
+        finally:
+            events.put(None)
+
+    threading.Thread(target=work, daemon=True).start()
+    while True:
+        line = events.get()
+        if line is None:
+            break
+        yield line
+
+
 @app.post("/upload_dna")
 def upload_dna():
+    """
+    Options (query or form fields): sections=traits,health,... (see
+    REPORT_SECTIONS), compact=1, stream=1. Bodies are negotiated from
+    Accept (JSON / MessagePack) and Accept-Encoding (br / gzip).
+    """
+    try:
+        sections = requested_sections()
+    except ValueError as e:
+        return {"status": "error", "error": str(e), "message": str(e)}, 400
+    compact = compact_requested()
+
+    # Results of an earlier upload, by handle (nothing is parsed or scored again)
+    genome_id = request.form.get("genome_id") or (request.get_json(silent=True) or {}).get("genome_id")
+    if genome_id and "file" not in request.files:
+        return encoded(genome_report(genome_id, sections, compact))
+
     if "file" not in request.files:
         return {"error": "No file uploaded"}, 400
 
-    file = request.files["file"]
-    if file.filename == "":
+    # Several files of the same person (e.g. 23andMe + AncestryDNA) are merged
+    files = [f for f in request.files.getlist("file") if f.filename]
+    if not files:
         return {"error": "Empty filename"}, 400
 
-    filename = file.filename
+    paths = save_uploads(files)
+    names = [f.filename for f in files]
+    merge_policy = request.form.get("merge_policy", "first")
+
+    # stream=1 (or Accept: application/x-ndjson): progressive results
+    if requested_flag("stream") or "application/x-ndjson" in request.headers.get("Accept", ""):
+        return Response(stream_upload(paths, names, merge_policy, sections), mimetype="application/x-ndjson")
+
+    try:
+        dna_data, genomes, merge_report = parse_uploads(paths, names, merge_policy)
+    except QCError:
+        raise  # 422 with the QC report (see qc_failed)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    genome_id = open_upload(
+        dna_data,
+        name=", ".join(names),
+        results={"merge": merge_report, "qc": [g.qc for g in genomes]},
+    )
+    return encoded(genome_report(genome_id, sections, compact))
+
+
+@app.get("/panel_manifest")
+def panel_manifest():
+    """
+    The loci the engines read (see panel_manifest), for clients that
+    extract them and send a compact panel to /upload_panel.
+    """
+    manifest = manifest_document()
+    etag = f'"{manifest["version"]}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        return Response(status=304, headers={"ETag": etag})
+
+    response = encoded({"status": "ok", **manifest})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+@app.post("/upload_panel")
+def upload_panel():
+    """
+    Compact panel upload: the manifest's loci extracted client side
+    (application/octet-stream body, or a multipart "panel" field). Same
+    options and report as /upload_dna, with genome_summary null; 409 with
+    the current manifest version when the panel was built against
+    another one.
+    """
+    try:
+        sections = requested_sections()
+    except ValueError as e:
+        return {"status": "error", "error": str(e), "message": str(e)}, 400
+
+    upload = request.files.get("panel")
+    data = upload.read() if upload else request.get_data()
+    name = request.args.get("name") or request.form.get("name") \
+        or (upload.filename if upload and upload.filename else "panel")
+    try:
+        genome = decode_panel_payload(data)
+    except PanelVersionError as e:
+        return jsonify({"status": "error", "message": str(e), "version": manifest_document()["version"]}), 409
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    genome_id = open_upload(genome, name=name, results={"merge": None, "qc": [genome.qc]})
+    return encoded(genome_report(genome_id, sections, compact_requested()))
 
-    UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(file_path)
+# ---------------------------------------------------------
+# 2) DOUBLE UPLOAD – CHILD PREDICTOR (traits/health only)
+# ---------------------------------------------------------
+@app.route("/upload_parent", methods=["POST"])
+def upload_parent():
+    """One parent's file -> genome id for /child and the partner endpoints."""
+    if "file" not in request.files or not request.files["file"].filename:
+        return jsonify({"status": "error", "message": "No file uploaded"}), 400
 
-    dna_data = parse_raw_dna_file(file_path)
-    traits = trait_engine.predict_traits(dna_data)
-    health = risk_engine.compute_health_risk(dna_data)
-    genotype_panel = extract_genotype_panel(dna_data)
+    upload = request.files["file"]
+    genome = load_genome_from_request(upload)
+    genome_id = open_upload(genome, name=upload.filename)
 
-    return {
+    return jsonify({
         "status": "ok",
-        "traits": traits,
-        "health": health,
-        "risk": health,  # backward compatibility alias
-        "genotype_panel": genotype_panel
-    }
+        "genome_id": genome_id,
+        "snp_count": len(genome),
+        # the loci the models read, for clients that show or edit them
+        "genotypes": {rsid: genome[rsid]["genotype"] for rsid in MODEL_LOCI if rsid in genome},
+    })
 
 
-# ---------------------------------------------------------
-# 2) DOUBLE UPLOAD – CHILD PREDICTOR (traits/health only)
-# ---------------------------------------------------------
 @app.route("/upload_parents", methods=["POST"])
 def upload_parents():
-    if "file1" not in request.files or "file2" not in request.files:
+    # each parent is a file (file1 / file2) or an earlier upload's genome id,
+    # optionally with a declared sex (sex1 / sex2, else inferred from the file)
+    try:
+        sexes = (requested_sex(request.form.get("sex1")), requested_sex(request.form.get("sex2")))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    genome_ids = []
+    for field in ("file1", "file2"):
+        upload = request.files.get(field)
+        if upload is not None and upload.filename:
+            genome_ids.append(open_upload(load_genome_from_request(upload), name=upload.filename))
+        elif request.form.get(f"{field}_id"):
+            genome_ids.append(request.form[f"{field}_id"])
+    if len(genome_ids) != 2:
         return jsonify({"error": "Two DNA files required"}), 400
 
-    p1_file = request.files["file1"]
-    p2_file = request.files["file2"]
+    idA, idB = genome_ids
+    parentA_data = parent_report(idA)
+    parentB_data = parent_report(idB)
 
-    parentA = load_genome_from_request(p1_file)
-    parentB = load_genome_from_request(p2_file)
+    child = child_prediction(idA, idB, sexes=sexes)
+    child["ancestry"] = blend_ancestry(parentA_data["ancestry"], parentB_data["ancestry"])
 
-    parentA_data = {
-        "traits": predict_traits(parentA),
-        "health": compute_health_risk(parentA),
-        "key_genotypes": {
-            "rs12913832": parentA.get("rs12913832", {}).get("genotype")
-        },
-        "key_snps": {
-            "eye": extract_key_snps(parentA, EYE_SNPS),
-            "hair": extract_key_snps(parentA, HAIR_SNPS),
-            "skin": extract_key_snps(parentA, SKIN_SNPS),
-        },
+    response = {
+        "parentA": parentA_data,
+        "parentB": parentB_data,
+        "child": child
     }
 
-    parentB_data = {
-        "traits": predict_traits(parentB),
-        "health": compute_health_risk(parentB),
-        "key_genotypes": {
-            "rs12913832": parentB.get("rs12913832", {}).get("genotype")
-        },
-        "key_snps": {
-            "eye": extract_key_snps(parentB, EYE_SNPS),
-            "hair": extract_key_snps(parentB, HAIR_SNPS),
-            "skin": extract_key_snps(parentB, SKIN_SNPS),
-        },
-    }
+    # Optional real child upload -> Mendelian / parentage checks
+    if "child" in request.files and request.files["child"].filename:
+        actual_child = load_genome_from_request(request.files["child"])
+        response["trio"] = check_trio(session_genome(idA), session_genome(idB), actual_child)
+
+    return encoded(response)
 
-    child = predict_child(parentA, parentB)
 
+# ---------------------------------------------------------
+# 2a) CHILD PREDICTION FROM HANDLES / GENOTYPES
+# ---------------------------------------------------------
+# "fast" trades Monte Carlo precision for latency
+CHILD_MODES = {
+    "fast": {"precision": 0.1, "time_budget": 1.0},
+    "hirisplex": {},
+}
+
+
+def requested_sex(value):
+    """A declared parent sex ("male" / "female"), None when not given. ValueError otherwise."""
+    if value in (None, ""):
+        return None
+    if value not in ("male", "female"):
+        raise ValueError(f"Unknown sex '{value}' (use male or female)")
+    return value
+
+
+def child_prediction(parentA, parentB, mode="hirisplex", sexes=(None, None)):
+    """
+    predict_child for two parents given as genome ids or genomes. For two
+    ids the result is kept in parent A's session (a copy is returned).
+    sexes: declared sexes of parent A and B; a parent without one gets
+    the sex QC inferred from their file, if any (see genome_qc.genome_sex).
+    """
+    options = CHILD_MODES.get(mode, {})
+    genomeA = session_genome(parentA) if isinstance(parentA, str) else parentA
+    genomeB = session_genome(parentB) if isinstance(parentB, str) else parentB
+    sexes = tuple(sex or genome_sex(genome) for sex, genome in zip(sexes, (genomeA, genomeB)))
+    if isinstance(parentA, str) and isinstance(parentB, str):
+        child = session_result(
+            parentA, ("child", parentB, mode, sexes),
+            lambda genome: predict_child(genome, genomeB, sexes=sexes, **options),
+        )
+        return dict(child)
+    return predict_child(genomeA, genomeB, sexes=sexes, **options)
+
+
+@app.route("/child", methods=["POST"])
+def child():
+    """
+    {"parent1": genome id | genotypes, "parent2": genome id | genotypes, "mode": "fast" | "hirisplex",
+     "sex1": "male" | "female", "sex2": ...}
+    Parent sexes default to the ones inferred from their files.
+    """
+    data = request.get_json(silent=True) or {}
+    mode = data.get("mode", "fast")
+    if mode not in CHILD_MODES:
+        return jsonify({"status": "error", "message": f"Unknown mode {mode!r}"}), 400
+    try:
+        sexes = (requested_sex(data.get("sex1")), requested_sex(data.get("sex2")))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if not data.get("parent1") or not data.get("parent2"):
+        return jsonify({"status": "error", "message": "parent1 and parent2 required"}), 400
+
+    parents = []
+    for value in (data["parent1"], data["parent2"]):
+        if isinstance(value, dict) and "genome_id" in value:
+            value = value["genome_id"]
+        try:
+            parents.append(value if isinstance(value, str) else genome_from_genotypes(value))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+    prediction = child_prediction(*parents, mode=mode, sexes=sexes)
+    traits = dict(prediction["child_traits"], model_used="HIrisPlex-S")
     return jsonify({
-        "parentA": parentA_data,
-        "parentB": parentB_data,
-        "child": child
+        "status": "ok",
+        "mode": mode,
+        "child": {**prediction, "traits": traits, "health": prediction["child_health"]},
+    })
+
+
+# ---------------------------------------------------------
+# 2b) POPULATION PARTNER SIMULATION
+# ---------------------------------------------------------
+@app.route("/simulate_partner", methods=["POST"])
+def simulate_partner():
+    data = request.get_json(silent=True) or request.form
+
+    genome = None
+    if "file" in request.files and request.files["file"].filename:
+        genome = load_genome_from_request(request.files["file"])
+
+    try:
+        if genome is None and data.get("parent1"):
+            genome = genome_from_request_value(data["parent1"])
+        sim = simulate_partners(
+            genome,
+            population=data.get("population", "EUR"),
+            partners=int(data.get("partners", 2000)),
+            sex=data.get("sex"),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return jsonify({
+        "status": "ok",
+        "population": sim["population"],
+        "genotypes": sim["example_partner"],
+        "simulation": sim,
     })
 
 
+# ---------------------------------------------------------
+# 2c) MANUAL PARTNER (traits entered by hand)
+# ---------------------------------------------------------
+@app.route("/manual_partner", methods=["POST"])
+def manual_partner():
+    data = request.get_json(silent=True) or {}
+
+    try:
+        partner = sparse_genome_from_traits(
+            data.get("traits", {}),
+            population=data.get("population", "EUR"),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    if not partner:
+        return jsonify({"status": "error", "message": "No recognised traits supplied"}), 400
+
+    response = {
+        "status": "ok",
+        "genotypes": {rsid: info["genotype"] for rsid, info in partner.items()},
+        "imputed_population": partner.population,
+    }
+
+    if data.get("parent1"):
+        try:
+            sex = requested_sex(data.get("sex"))
+            parent = genome_from_request_value(data["parent1"])
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        response["child"] = child_prediction(parent, partner, sexes=(sex, None))
+
+    return jsonify(response)
+
+
+# ---------------------------------------------------------
+# 2d) SNP LOOKUP IN A STORED GENOME
+# ---------------------------------------------------------
+@app.route("/snp", methods=["GET", "POST"])
+def snp_lookup():
+    """
+    Batched lookups in a genome stored at upload (see genome_store):
+    GET  /snp?genome_id=...&rsid=rs1,rs2&region=15:28000000-28500000&gene=HERC2
+    POST {"genome_id": ..., "rsids": [...], "regions": [...], "genes": [...]}
+    rsIDs without a call come back under "not_found", or "not_in_panel"
+    for genomes uploaded as a compact panel (see query_snps).
+    """
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        rsids, regions, genes = data.get("rsids"), data.get("regions"), data.get("genes")
+    else:
+        data = request.args
+
+        def listed(name):
+            return [v for arg in request.args.getlist(name) for v in arg.split(",") if v] or None
+
+        rsids, regions, genes = listed("rsid"), request.args.getlist("region") or None, listed("gene")
+
+    genome_id = data.get("genome_id")
+    if not genome_id:
+        return jsonify({"status": "error", "message": "genome_id required"}), 400
+    if not (rsids or regions or genes):
+        return jsonify({"status": "error", "message": "Nothing to look up (rsids, regions or genes)"}), 400
+
+    touch_session(genome_id)
+    try:
+        result = query_snps(genome_id, rsids=rsids, regions=regions, genes=genes)
+    except KeyError:
+        return jsonify({"status": "error", "message": "Unknown genome_id"}), 404
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return jsonify({"status": "ok", **result})
+
+
+# ---------------------------------------------------------
+# 2e) DELETE A GENOME (session and stored copy)
+# ---------------------------------------------------------
+@app.route("/genome/<genome_id>", methods=["DELETE"])
+def delete_genome_route(genome_id):
+    """Forgets a genome id before it expires (see session_store)."""
+    if not delete_genome(genome_id):
+        return jsonify({"status": "error", "message": "Unknown genome_id"}), 404
+    return jsonify({"status": "ok", "genome_id": genome_id, "deleted": True})
+
+
 # ---------------------------------------------------------
 # 3) GENERATE PDF REPORT (for single or parents+child)
 # ---------------------------------------------------------
 @app.route("/generate_pdf", methods=["POST"])
 def generate_pdf():
-    data = request.json
+    data = request.get_json(silent=True) or {}
+
+    # a genome id stands in for the traits / health JSON (and a partner's
+    # id for the child prediction)
+    genome_id = data.get("genome_id")
+    if genome_id:
+        traits = report_part(genome_id, "traits")
+        health = report_part(genome_id, "health")
+    elif "traits" in data and "health" in data:
+        traits = data["traits"]
+        health = data["health"]
+    else:
+        return jsonify({"status": "error", "message": "genome_id or traits + health required"}), 400
 
     user_name = data.get("name", "Anonymous")
-    traits = data["traits"]
-    health = data["health"]
     child = data.get("child")
+    if child is None and genome_id and data.get("partner_id"):
+        child = child_prediction(genome_id, data["partner_id"])
 
     pdf_buffer = generate_pdf_report(
         user_name=user_name,
@@ -165,7 +751,7 @@ def status():
 
 @app.route("/", methods=["GET"])
 def root():
-    return jsonify({"status": "Backend running", "endpoints": ["/status", "/upload_dna", "/upload_parents", "/generate_pdf"]})
+    return jsonify({"status": "Backend running", "endpoints": ["/status", "/upload_dna", "/panel_manifest", "/upload_panel", "/upload_parent", "/upload_parents", "/child", "/simulate_partner", "/manual_partner", "/snp", "/genome/<genome_id>", "/generate_pdf"]})
 
 
 if __name__ == "__main__":
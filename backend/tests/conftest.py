@@ -0,0 +1,44 @@
+"""
+Shared test setup: the backend on sys.path and a throwaway genome store
+(genome_store reads DNA_DATA_DIR when it is imported).
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ["DNA_DATA_DIR"] = tempfile.mkdtemp(prefix="dna-app-tests-")
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def raw_file(tmp_path):
+    """
+    Writes a 23andMe-style file and returns its path. sex: "male" gives
+    hemizygous (homozygous) X calls, "female" heterozygous ones.
+    """
+
+    def write(name="genome.txt", snps=3000, sex="female", seed=1, rows=None):
+        rnd = random.Random(seed)
+        lines = ["# rsid\tchromosome\tposition\tgenotype"]
+        if rows is None:
+            rows = []
+            for i in range(snps):
+                chrom = str(1 + i * 22 // snps)
+                a, b = rnd.sample("ACGT", 2)
+                rows.append((f"rs{100000 + i}", chrom, 1000 + i * 50, rnd.choice((a + a, a + b, b + b))))
+            for i in range(300):
+                a, b = rnd.sample("ACGT", 2)
+                het = sex == "female" and rnd.random() < 0.4
+                rows.append((f"rs{900000 + i}", "X", 3000000 + i * 1000, a + b if het else a + a))
+        lines += ["\t".join(map(str, row)) for row in rows]
+        path = tmp_path / name
+        path.write_text("\n".join(lines) + "\n")
+        return str(path)
+
+    return write
@@ -0,0 +1,97 @@
+"""Genome store: 2-bit packing, store / load round trips and shared panels."""
+
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from utils.genome_arrays import decode_genotype
+from utils.genome_store import (
+    NO_CALL,
+    _pack,
+    _unpack,
+    delete_stored_genome,
+    load_stored_genome,
+    query_rsids,
+    store_genome,
+    stored_arrays,
+)
+
+N = 3000
+
+
+class _Encoded:
+    """Just what store_genome reads of a parsed genome."""
+
+    def __init__(self, a1, a2):
+        self.arrays = {
+            "key": np.arange(1, len(a1) + 1, dtype=np.int64),
+            "chrom": np.ones(len(a1), dtype=np.uint8),
+            "pos": np.arange(1, len(a1) + 1, dtype=np.int64) * 100,
+            "a1": a1,
+            "a2": a2,
+        }
+        self.qc = None
+        self.build = None
+
+
+def _random_genome(seed, alleles=4):
+    rng = np.random.default_rng(seed)
+    a1 = rng.integers(1, alleles + 1, N).astype(np.uint8)
+    a2 = rng.integers(1, alleles + 1, N).astype(np.uint8)
+    missing = rng.random(N) < 0.05
+    a1[missing] = a2[missing] = 0
+    return _Encoded(a1, a2)
+
+
+def _unordered(a1, a2):
+    return np.sort(np.stack([a1, a2]), axis=0)
+
+
+def _store_seed(seed):
+    return store_genome(_random_genome(seed))
+
+
+def test_pack_unpack_round_trip():
+    codes = np.random.default_rng(0).integers(0, 4, 1001).astype(np.uint8)
+    packed = _pack(codes)
+    assert len(packed) == 251
+    assert np.array_equal(_unpack(packed, np.arange(len(codes))), codes)
+    # padding reads as no call
+    assert _unpack(packed, [1003])[0] == NO_CALL
+
+
+def test_store_round_trip_keeps_third_alleles():
+    # two genomes on the same chip with four alleles in play: the second
+    # one has sites the shared panel cannot hold
+    first, second = _random_genome(1), _random_genome(2)
+    ids = [store_genome(first), store_genome(second)]
+    assert load_stored_genome(ids[1])[2]["overrides"]["rows"]
+    for genome, genome_id in zip((first, second), ids):
+        stored = stored_arrays(genome_id)
+        assert np.array_equal(
+            _unordered(stored["a1"], stored["a2"]),
+            _unordered(genome.arrays["a1"], genome.arrays["a2"]),
+        )
+
+    calls = query_rsids(ids[1], ["rs1", "rs2", "rs999999999"])
+    assert [c["rsid"] for c in calls] == ["rs1", "rs2"]
+    for call, i in zip(calls, (0, 1)):
+        a1, a2 = second.arrays["a1"][i], second.arrays["a2"][i]
+        assert call["genotype"] in (decode_genotype(a1, a2), decode_genotype(a2, a1))
+
+    assert delete_stored_genome(ids[0])
+    with pytest.raises(KeyError):
+        stored_arrays(ids[0])
+
+
+def test_concurrent_workers_share_a_panel():
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        ids = pool.map(_store_seed, range(10, 22))
+    for seed, genome_id in zip(range(10, 22), ids):
+        genome = _random_genome(seed)
+        stored = stored_arrays(genome_id)
+        assert np.array_equal(
+            _unordered(stored["a1"], stored["a2"]),
+            _unordered(genome.arrays["a1"], genome.arrays["a2"]),
+        )
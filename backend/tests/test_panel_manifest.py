@@ -0,0 +1,74 @@
+"""Compact panel payloads: encode / decode round trips and rejection."""
+
+import struct
+
+import pytest
+
+from utils.panel_manifest import (
+    HEADER,
+    PanelVersionError,
+    decode_panel_payload,
+    encode_panel_payload,
+    is_panel_genome,
+    load_panel_manifest,
+)
+
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def _same_call(got, sent):
+    """Equal as unordered genotypes, on either strand (the decoder harmonizes)."""
+    alleles = sorted(sent.replace("/", ""))
+    return sorted(got.replace("/", "")) in (alleles, sorted("".join(alleles).translate(COMPLEMENT)))
+
+
+def _calls():
+    manifest = load_panel_manifest()
+    rsids = [i for i in manifest["ids"] if i.startswith("rs")][:20]
+    sites = [i for i in manifest["ids"] if ":" in i][:3]
+    calls = {rsid: genotype for rsid, genotype in zip(rsids, ["AG", "CC", "TT", "GT"] * 5)}
+    calls.update({site: "AA" for site in sites})
+    return calls, sites
+
+
+def test_round_trip():
+    calls, sites = _calls()
+    payload = encode_panel_payload(calls)
+    assert len(payload) == HEADER.size + 5 * len(calls)
+
+    genome = decode_panel_payload(payload)
+    assert is_panel_genome(genome)
+    assert genome.qc["calls"] == len(calls)
+    for ident, genotype in calls.items():
+        assert _same_call(genome[ident]["genotype"], genotype), ident
+    for site in sites:
+        chrom, pos = site.split(":")
+        assert (genome[site]["chrom"], genome[site]["pos"]) == (chrom, int(pos))
+
+
+def test_no_calls_and_unknown_ids():
+    calls, _ = _calls()
+    rsid = next(iter(calls))
+    genome = decode_panel_payload(encode_panel_payload({rsid: "--", "rs0": "AA", "not-an-id": "AG"}))
+    assert genome.qc["calls"] == 1
+    assert genome[rsid]["genotype"] in (None, "-/-")
+
+
+def test_rejects_other_versions_and_bad_lengths():
+    calls, _ = _calls()
+    payload = encode_panel_payload(calls)
+
+    other = bytearray(payload)
+    other[5:21] = b"0" * 16
+    with pytest.raises(PanelVersionError):
+        decode_panel_payload(bytes(other))
+    with pytest.raises(ValueError):
+        decode_panel_payload(payload[:-1])
+    with pytest.raises(ValueError):
+        decode_panel_payload(b"XXXX" + payload[4:])
+
+    # an index past the manifest
+    count = len(load_panel_manifest()["ids"])
+    head = payload[:HEADER.size - 4] + struct.pack("<I", 1)
+    with pytest.raises(ValueError):
+        decode_panel_payload(head + struct.pack("<I", count) + b"\x0b")
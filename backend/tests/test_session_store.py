@@ -0,0 +1,51 @@
+"""Session handles: genomes reopened from the store after eviction."""
+
+import pytest
+
+from app import app
+from utils.genome_qc import genome_sex
+from utils.panel_manifest import encode_panel_payload, load_panel_manifest
+from utils.session_store import UnknownGenome, close_session, delete_genome, session_genome
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_restore_keeps_calls_qc_and_sex(client, raw_file):
+    with open(raw_file(sex="male"), "rb") as f:
+        body = client.post("/upload_dna", data={"file": (f, "genome.txt"), "sections": "qc"}).get_json()
+    genome_id = body["genome_id"]
+    genome = session_genome(genome_id)
+    calls = {rsid: genome[rsid]["genotype"] for rsid in list(genome)[:200]}
+
+    close_session(genome_id)
+    again = client.post("/upload_dna", data={"genome_id": genome_id, "sections": "qc"}).get_json()
+    assert again["qc"] == body["qc"]
+
+    restored = session_genome(genome_id)
+    assert genome_sex(restored) == "male"
+    assert {rsid: restored[rsid]["genotype"] for rsid in calls} == calls
+
+
+def test_restore_keeps_positional_calls_of_panels(client):
+    sites = [i for i in load_panel_manifest()["ids"] if ":" in i][:2]
+    payload = encode_panel_payload({site: "CC" for site in sites})
+    genome_id = client.post(
+        "/upload_panel", data=payload, headers={"Content-Type": "application/octet-stream"}
+    ).get_json()["genome_id"]
+
+    close_session(genome_id)
+    restored = session_genome(genome_id)
+    assert restored.build["source"] == "panel"
+    for site in sites:
+        assert restored[site]["genotype"] == "C/C"
+
+
+def test_deleted_genome_is_gone(client, raw_file):
+    with open(raw_file(), "rb") as f:
+        genome_id = client.post("/upload_dna", data={"file": (f, "genome.txt"), "sections": "qc"}).get_json()["genome_id"]
+    assert delete_genome(genome_id)
+    with pytest.raises(UnknownGenome):
+        session_genome(genome_id)
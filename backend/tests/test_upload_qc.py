@@ -0,0 +1,40 @@
+"""QC at upload: rejected files answer 422 with the QC report."""
+
+import pytest
+
+from app import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def _upload(client, path, **fields):
+    with open(path, "rb") as f:
+        return client.post("/upload_dna", data={"file": (f, "genome.txt"), **fields})
+
+
+def test_junk_file_is_rejected_with_report(client, raw_file):
+    path = raw_file(rows=[(f"rs{i}", "1", i, "ZZ") for i in range(1, 3000)])
+    response = _upload(client, path)
+    assert response.status_code == 422
+    body = response.get_json()
+    assert body["status"] == "error"
+    assert body["qc"]["passed"] is False
+    assert "quality control" in body["message"]
+
+
+def test_junk_file_is_rejected_when_streamed(client, raw_file):
+    path = raw_file(rows=[(f"rs{i}", "1", i, "ZZ") for i in range(1, 3000)])
+    response = _upload(client, path, stream="1", sections="traits")
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 1 and '"event": "error"' in lines[0] and '"qc"' in lines[0]
+
+
+def test_good_file_passes(client, raw_file):
+    response = _upload(client, raw_file(sex="male"), sections="qc")
+    assert response.status_code == 200
+    (report,) = response.get_json()["qc"]
+    assert report["passed"] is True
+    assert report["sex"]["inferred"] == "male"
@@ -0,0 +1,71 @@
+"""VCF input: allele letters, and tabix-indexed BGZF region reads."""
+
+import random
+
+from utils.vcf_reader import (
+    ALL_RECORDS,
+    _allele_letters,
+    _bgzf_compress,
+    load_vcf_index,
+    make_panel,
+    read_vcf,
+)
+
+HEADER = (
+    "##fileformat=VCFv4.2\n"
+    "##contig=<ID=1>\n##contig=<ID=2>\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE\n"
+)
+
+
+def _write_vcf(path, per_chrom=20000, seed=1):
+    """A bgzipped VCF spanning many BGZF blocks; returns {(chrom, pos): (rsid, genotype)}."""
+    rnd = random.Random(seed)
+    calls, lines = {}, []
+    for chrom in ("1", "2"):
+        for i in range(per_chrom):
+            pos = 10000 + 37 * i
+            rsid = f"rs{int(chrom) * 1000000 + i}"
+            ref, alt = rnd.sample("ACGT", 2)
+            gt = rnd.choice(("0/0", "0/1", "1/1"))
+            letters = [ref if a == "0" else alt for a in gt.split("/")]
+            calls[(chrom, pos)] = (rsid, f"{letters[0]}/{letters[1]}")
+            lines.append(f"{chrom}\t{pos}\t{rsid}\t{ref}\t{alt}\t.\tPASS\t.\tGT\t{gt}\n")
+    with open(path, "wb") as f:
+        f.write(_bgzf_compress((HEADER + "".join(lines)).encode()))
+    return calls
+
+
+def test_allele_letters():
+    assert _allele_letters(["A", "G"]) == ["A", "G"]
+    assert _allele_letters(["AT", "A"]) == ["I", "D"]
+    # MNPs, a multi-base REF with ALT "." and three allele lengths have no letters
+    assert _allele_letters(["AT", "GC"]) == [None, None]
+    assert _allele_letters(["AT", "."]) == [None, None]
+    assert _allele_letters(["AT", "A", "ATT"]) == [None, None, None]
+    assert _allele_letters(["A", "<NON_REF>"]) == ["A", None]
+
+
+def test_region_reads_match_streaming(tmp_path):
+    path = str(tmp_path / "sample.vcf.gz")
+    calls = _write_vcf(path)
+    wanted = sorted(calls)[::997]
+    panel = make_panel([(calls[site][0], site[0], site[1]) for site in wanted])
+
+    # first read streams the file and writes its .tbi
+    assert load_vcf_index(path) is None
+    streamed = sorted(read_vcf(path, panel))
+    assert load_vcf_index(path) is not None
+
+    # second read seeks through the index
+    regions = sorted(read_vcf(path, panel))
+    assert regions == streamed
+    assert regions == sorted(
+        (calls[site][0], site[0], site[1], calls[site][1]) for site in wanted
+    )
+
+
+def test_all_records_opt_out(tmp_path):
+    path = str(tmp_path / "sample.vcf.gz")
+    calls = _write_vcf(path, per_chrom=500)
+    assert len(list(read_vcf(path, ALL_RECORDS))) == len(calls)
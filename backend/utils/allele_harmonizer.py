@@ -0,0 +1,175 @@
+"""
+Allele harmonization.
+
+Vendors report genotypes on different strands, so the same SNP can
+arrive as "A/G" from one file and "T/C" from another, and models that
+count effect-allele letters silently score the flipped file as zero.
+
+The ref/alt alleles of the reference SNPs (nih/population_freqs.csv and
+nih/dbsnp_lite.csv) are compiled once into a compact per-rsID table.
+At parse time every call at a table SNP is checked against it in one
+vectorized pass:
+
+- alleles match ref/alt             -> kept
+- complemented alleles match        -> flipped to the table strand
+- A/T or C/G SNP (strand ambiguous) -> kept as reported
+- neither                           -> mismatch, no dosage
+
+Harmonized calls carry an alt-allele dosage code plus the table's
+ref/alt letters, which `call_dosage` uses instead of re-reading the
+genotype string.
+"""
+
+import csv
+import os
+
+import numpy as np
+
+from utils.genome_arrays import ALLELE_CODES, join_sorted, rsid_key
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# In priority order: curated model loci first
+ALLELE_SOURCES = [
+    os.path.join(BASE_DIR, "nih", "population_freqs.csv"),
+    os.path.join(BASE_DIR, "nih", "dbsnp_lite.csv"),
+]
+
+# allele code -> complementary allele code (indel codes map to themselves)
+COMPLEMENT_CODES = np.array([0, 4, 3, 2, 1, 5, 6], dtype=np.uint8)
+COMPLEMENT_LETTERS = str.maketrans("ACGT", "TGCA")
+
+# harmonization status codes
+NOT_IN_TABLE = 0
+MATCHED = 1
+FLIPPED = 2
+AMBIGUOUS = 3
+MISMATCH = 4
+
+NO_DOSAGE = -1
+
+# Compiled once:
+# { "key": int64[N] sorted (see genome_arrays.rsid_key), "ref": uint8[N], "alt": uint8[N] }
+ALLELE_TABLE = {}
+
+
+def load_allele_table():
+    global ALLELE_TABLE
+    if ALLELE_TABLE:
+        return ALLELE_TABLE
+
+    seen = set()
+    keys, refs, alts = [], [], []
+    for path in ALLELE_SOURCES:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r") as f:
+            for row in csv.DictReader(f):
+                key = rsid_key(row.get("rsid") or "")
+                ref = ALLELE_CODES.get((row.get("ref") or "").upper())
+                alt = ALLELE_CODES.get((row.get("alt") or "").upper())
+                if key <= 0 or not ref or not alt or key in seen:
+                    continue
+                seen.add(key)
+                keys.append(key)
+                refs.append(ref)
+                alts.append(alt)
+
+    keys = np.array(keys, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    ALLELE_TABLE = {
+        "key": keys[order],
+        "ref": np.array(refs, dtype=np.uint8)[order],
+        "alt": np.array(alts, dtype=np.uint8)[order],
+    }
+    return ALLELE_TABLE
+
+
+def _fits(a1, a2, ref, alt):
+    return ((a1 == ref) | (a1 == alt)) & ((a2 == ref) | (a2 == alt))
+
+
+def harmonize_arrays(arrays):
+    """
+    arrays: see genome_arrays.encode_calls.
+
+    Returns
+    {
+      "index":  positions in `arrays` of calls at table SNPs,
+      "a1", "a2": harmonized allele codes for those calls,
+      "ref", "alt": table allele codes,
+      "dosage": int8 alt-allele count (NO_DOSAGE when unusable),
+      "status": uint8 status code per call (see above),
+    }
+    """
+    table = load_allele_table()
+    at, hits = join_sorted(table["key"], arrays["key"])
+    ref = table["ref"][at]
+    alt = table["alt"][at]
+    a1 = arrays["a1"][hits]
+    a2 = arrays["a2"][hits]
+
+    called = (a1 != 0) & (a2 != 0)
+    ambiguous = COMPLEMENT_CODES[ref] == alt
+    fits = _fits(a1, a2, ref, alt)
+    c1 = COMPLEMENT_CODES[a1]
+    c2 = COMPLEMENT_CODES[a2]
+    flip = called & ~fits & ~ambiguous & _fits(c1, c2, ref, alt)
+    mismatch = called & ~fits & ~flip
+
+    a1 = np.where(flip, c1, a1)
+    a2 = np.where(flip, c2, a2)
+    dosage = (a1 == alt).astype(np.int8) + (a2 == alt)
+    dosage[~called | mismatch] = NO_DOSAGE
+
+    status = np.full(len(hits), MATCHED, dtype=np.uint8)
+    status[ambiguous] = AMBIGUOUS
+    status[flip] = FLIPPED
+    status[mismatch] = MISMATCH
+
+    return {
+        "index": hits,
+        "a1": a1,
+        "a2": a2,
+        "ref": ref,
+        "alt": alt,
+        "dosage": dosage,
+        "status": status,
+    }
+
+
+def harmonization_summary(result):
+    status = result["status"]
+    return {
+        "checked": int(len(status)),
+        "flipped": int((status == FLIPPED).sum()),
+        "ambiguous": int((status == AMBIGUOUS).sum()),
+        "mismatched": int((status == MISMATCH).sum()),
+    }
+
+
+def call_dosage(call, allele):
+    """
+    Copies (0-2) of `allele` in a call: a genome entry dict or a bare
+    genotype string. Harmonized entries answer from their dosage code;
+    anything else falls back to counting genotype letters.
+    """
+    if not call:
+        return 0
+    allele = allele.upper()
+    if isinstance(call, dict):
+        dosage = call.get("dosage")
+        if dosage is not None:
+            if allele not in (call["ref"], call["alt"]):
+                # effect allele given on the other strand
+                allele = allele.translate(COMPLEMENT_LETTERS)
+            if allele == call["alt"]:
+                return dosage
+            if allele == call["ref"]:
+                return 2 - dosage
+            return 0
+        call = call.get("genotype")
+        if not call:
+            return 0
+    g = call.replace("/", "").replace("|", "").replace(" ", "").upper()
+    return g.count(allele)
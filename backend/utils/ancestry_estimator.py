@@ -0,0 +1,223 @@
+"""
+Ancestry estimation against a compact reference bundle
+(nih/ancestry_reference.npz):
+
+    key        int64[L]   sorted rsID keys (see genome_arrays.rsid_key)
+    ref, alt   uint8[L]   allele codes
+    freqs      float[L,K] alt allele frequency per reference population
+    populations str[K]
+    mean, scale float[L]  centering / scaling of alt dosages
+    loadings   float[L,P] reference PCA loadings
+    centroids  float[K,P] population centroids in PC space
+
+When no bundle ships, it is compiled once from the population
+frequencies (nih/population_freqs.csv): PCA of the standardized
+population dosage profiles gives the loadings, and the populations'
+own projections the centroids.
+
+A genome's alt dosages at the bundle loci are projected onto the
+loadings, and admixture proportions are fitted to the frequencies by
+EM (the supervised ADMIXTURE likelihood, which keeps proportions on
+the simplex). Both work on an N x L dosage matrix, so cohorts are
+estimated in one call.
+"""
+
+import os
+
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_CODES
+from utils.genome_arrays import encode_genome, join_sorted, rsid_key
+from utils.population_freqs import FREQ_PATH, load_freq_table
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+REFERENCE_PATH = os.path.join(BASE_DIR, "nih", "ancestry_reference.npz")
+
+# frequencies are kept off 0 / 1 so one odd call can't zero a likelihood
+FREQ_FLOOR = 0.001
+EM_MAX_ITER = 500
+EM_TOLERANCE = 1e-6
+
+# Compiled once (see module docstring)
+ANCESTRY_REFERENCE = {}
+
+
+# ---------------------------------------------------------
+# Reference bundle
+# ---------------------------------------------------------
+def _compile_reference():
+    table = load_freq_table()
+    populations = sorted(table["freqs"])
+    keys = np.array([rsid_key(r) for r in table["rsids"]], dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    freqs = np.column_stack([table["freqs"][p] for p in populations])[order]
+
+    mean = 2 * freqs.mean(axis=1)
+    p = mean / 2
+    scale = np.sqrt(2 * p * (1 - p))
+    scale[scale == 0] = 1.0
+
+    # population profiles (K x L) in standardized dosage units
+    profiles = ((2 * freqs - mean[:, None]) / scale[:, None]).T
+    _, _, vt = np.linalg.svd(profiles, full_matrices=False)
+    loadings = vt[: len(populations) - 1].T
+
+    return {
+        "key": keys[order],
+        "ref": table["ref"][order],
+        "alt": table["alt"][order],
+        "freqs": freqs,
+        "populations": np.array(populations),
+        "mean": mean,
+        "scale": scale,
+        "loadings": loadings,
+        "centroids": profiles @ loadings,
+    }
+
+
+def load_ancestry_reference():
+    global ANCESTRY_REFERENCE
+    if ANCESTRY_REFERENCE:
+        return ANCESTRY_REFERENCE
+
+    if os.path.exists(REFERENCE_PATH) and (
+        not os.path.exists(FREQ_PATH) or os.path.getmtime(REFERENCE_PATH) >= os.path.getmtime(FREQ_PATH)
+    ):
+        with np.load(REFERENCE_PATH) as data:
+            reference = {k: data[k] for k in data.files}
+    else:
+        reference = _compile_reference()
+        try:
+            np.savez(REFERENCE_PATH, **reference)
+        except OSError:
+            pass
+
+    reference["populations"] = [str(p) for p in reference["populations"]]
+    ANCESTRY_REFERENCE = reference
+    return ANCESTRY_REFERENCE
+
+
+# ---------------------------------------------------------
+# Dosages
+# ---------------------------------------------------------
+def dosage_matrix(genomes, reference=None):
+    """
+    Alt-allele dosages (N x L, NaN where missing) of the genomes at the
+    reference loci. Calls reported on the other strand are flipped;
+    calls fitting neither strand count as missing.
+    """
+    reference = reference or load_ancestry_reference()
+    ref, alt = reference["ref"], reference["alt"]
+    x = np.full((len(genomes), len(ref)), np.nan)
+
+    for row, genome in enumerate(genomes):
+        arrays = encode_genome(genome)
+        at, loci = join_sorted(arrays["key"], reference["key"])
+        a1 = arrays["a1"][at]
+        a2 = arrays["a2"][at]
+        r, a = ref[loci], alt[loci]
+
+        fits = ((a1 == r) | (a1 == a)) & ((a2 == r) | (a2 == a))
+        c1, c2 = COMPLEMENT_CODES[a1], COMPLEMENT_CODES[a2]
+        flip = ~fits & ((c1 == r) | (c1 == a)) & ((c2 == r) | (c2 == a))
+        a1 = np.where(flip, c1, a1)
+        a2 = np.where(flip, c2, a2)
+
+        usable = (fits | flip) & (a1 != 0)
+        x[row, loci[usable]] = (a1[usable] == a[usable]).astype(float) + (a2[usable] == a[usable])
+    return x
+
+
+# ---------------------------------------------------------
+# Projection and admixture
+# ---------------------------------------------------------
+def project(x, reference=None):
+    """
+    PC coordinates (N x P) of dosage rows. Missing loci are mean-imputed
+    and the scores rescaled by L / observed loci.
+    """
+    reference = reference or load_ancestry_reference()
+    z = (x - reference["mean"]) / reference["scale"]
+    observed = (~np.isnan(z)).sum(axis=1)
+    z = np.nan_to_num(z)
+    scores = z @ reference["loadings"]
+    return scores * (z.shape[1] / np.maximum(observed, 1))[:, None]
+
+
+def fit_admixture(x, reference=None):
+    """
+    Admixture proportions (N x K) maximizing the binomial likelihood of
+    the dosages given mixed population frequencies, by EM.
+    """
+    reference = reference or load_ancestry_reference()
+    f = np.clip(reference["freqs"], FREQ_FLOOR, 1 - FREQ_FLOOR)
+    n, k = x.shape[0], f.shape[1]
+
+    observed = ~np.isnan(x)
+    alt = np.where(observed, x, 0.0)
+    ref = np.where(observed, 2 - x, 0.0)
+    alleles = 2 * observed.sum(axis=1, keepdims=True)
+
+    q = np.full((n, k), 1.0 / k)
+    for _ in range(EM_MAX_ITER):
+        mix = q @ f.T
+        update = q * ((alt / mix) @ f + (ref / (1 - mix)) @ (1 - f))
+        update /= np.maximum(alleles, 1)
+        # genomes without a single locus keep the uniform prior
+        update[alleles[:, 0] == 0] = 1.0 / k
+        change = np.abs(update - q).max()
+        q = update
+        if change < EM_TOLERANCE:
+            break
+    return q
+
+
+# ---------------------------------------------------------
+# Main entries
+# ---------------------------------------------------------
+def ancestry_reports(genomes):
+    """Ancestry of every genome in one batch (see ancestry_report)."""
+    reference = load_ancestry_reference()
+    populations = reference["populations"]
+    x = dosage_matrix(genomes, reference)
+    q = fit_admixture(x, reference)
+    pcs = project(x, reference)
+    nearest = np.argmin(
+        ((pcs[:, None, :] - reference["centroids"][None, :, :]) ** 2).sum(axis=2), axis=1
+    )
+    used = (~np.isnan(x)).sum(axis=1)
+
+    return [
+        {
+            "proportions": {p: round(float(v), 4) for p, v in zip(populations, q[i])} if used[i] else {},
+            "pcs": [round(float(v), 4) for v in pcs[i]],
+            "nearest_population": populations[nearest[i]] if used[i] else None,
+            "snps_used": int(used[i]),
+            "snps_total": int(x.shape[1]),
+        }
+        for i in range(len(genomes))
+    ]
+
+
+def ancestry_report(genome):
+    """
+    {
+      "proportions": {"AFR": 0.02, "EUR": 0.91, ...},
+      "pcs": [...], "nearest_population": "EUR",
+      "snps_used": 38, "snps_total": 40
+    }
+    """
+    return ancestry_reports([genome])[0]
+
+
+def estimate_ancestry(genome):
+    """Admixture proportions per reference population."""
+    return ancestry_report(genome)["proportions"]
+
+
+def blend_ancestry(anc1, anc2):
+    """Expected ancestry of a child: the average of both parents."""
+    pops = set(anc1 or {}) | set(anc2 or {})
+    if not anc1 or not anc2:
+        return dict(anc1 or anc2 or {})
+    return {p: round((anc1.get(p, 0.0) + anc2.get(p, 0.0)) / 2, 4) for p in sorted(pops)}
@@ -2,6 +2,12 @@ import csv
 import gzip
 import os
 
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_LETTERS
+from utils.gene_index import gene_ids
+from utils.genome_arrays import chrom_code
+
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 CLINVAR_PATHS = [
@@ -17,11 +23,18 @@ CLINVAR_LOADED_LOGGED = False
 # --------------------------------------------------------------
 # Load ClinVar pathogenic variants (compressed database)
 # Structure:
-# { rsid: { "gene": "CFTR", "variant": "F508del", "type": "pathogenic", "inheritance": "recessive" } }
+# { rsid: { "gene": "CFTR", "variant": "F508del", "type": "pathogenic", "inheritance": "recessive",
+#           "chrom": "7", "pos": 117199644, "ref": "C", "alt": "T" } }
+# (chrom / pos only when the file has GRCh37 Chromosome + Start columns,
+#  ref / alt only when it has the VCF allele columns)
 # --------------------------------------------------------------
 
 CLINVAR_DB = {}
 
+# Pathogenic ClinVar sites by position, for the region panels:
+# (sorted locus keys, [rsid, ...])
+CLINVAR_SITES = None
+
 def load_clinvar():
     global CLINVAR_DB, CLINVAR_WARNED, CLINVAR_LOADED_LOGGED
     if CLINVAR_DB:
@@ -45,6 +58,16 @@ def load_clinvar():
                         "type": row.get("ClinicalSignificance", "").lower(),
                         "inheritance": row.get("ModeOfInheritance", "").lower(),
                     }
+                    start = row.get("PositionVCF") or row.get("Start")
+                    if row.get("Chromosome") and start and start.isdigit() and \
+                            row.get("Assembly", "GRCh37") in ("GRCh37", ""):
+                        CLINVAR_DB[rsid]["chrom"] = row["Chromosome"]
+                        CLINVAR_DB[rsid]["pos"] = int(start)
+                    ref = (row.get("ReferenceAlleleVCF") or row.get("ReferenceAllele") or "").upper()
+                    alt = (row.get("AlternateAlleleVCF") or row.get("AlternateAllele") or "").upper()
+                    if ref and alt and ref != "NA" and alt != "NA":
+                        CLINVAR_DB[rsid]["ref"] = ref
+                        CLINVAR_DB[rsid]["alt"] = alt
             loaded = True
             if not CLINVAR_LOADED_LOGGED:
                 print(f"Loaded ClinVar: {len(CLINVAR_DB)} variants from {path}")
@@ -59,6 +82,21 @@ def load_clinvar():
         CLINVAR_WARNED = True
 
 
+def load_clinvar_sites():
+    global CLINVAR_SITES
+    if CLINVAR_SITES is not None:
+        return CLINVAR_SITES
+
+    load_clinvar()
+    sites = sorted(
+        ((chrom_code(info["chrom"]) << 32) | info["pos"], rsid)
+        for rsid, info in CLINVAR_DB.items()
+        if "patho" in info["type"] and "pos" in info and chrom_code(info["chrom"])
+    )
+    CLINVAR_SITES = (np.array([s[0] for s in sites], dtype=np.int64), [s[1] for s in sites])
+    return CLINVAR_SITES
+
+
 # --------------------------------------------------------------
 # Helper: allele dosage
 # --------------------------------------------------------------
@@ -69,6 +107,24 @@ def dosage(genotype: str, allele: str):
     return g.count(allele.upper())
 
 
+def pathogenic_copies(genotype, cinfo):
+    """
+    Copies (0-2) of a ClinVar variant's alt allele in a call, on either
+    strand; chips report indels as D / I. None when the entry has no
+    alleles or the call fits neither strand.
+    """
+    ref, alt = cinfo.get("ref"), cinfo.get("alt")
+    g = (genotype or "").replace("/", "").replace("|", "").upper()
+    if not ref or not alt or len(g) != 2:
+        return None
+    if len(ref) != 1 or len(alt) != 1:
+        ref, alt = ("I", "D") if len(ref) > len(alt) else ("D", "I")
+    for r, a in ((ref, alt), (ref.translate(COMPLEMENT_LETTERS), alt.translate(COMPLEMENT_LETTERS))):
+        if set(g) <= {r, a}:
+            return g.count(a)
+    return None
+
+
 # --------------------------------------------------------------
 # Gene-specific pathogenic variant lists (extra known SNPs)
 # --------------------------------------------------------------
@@ -99,6 +155,42 @@ DOMINANT_GENES = {
     "TERT": ["rs2736100"],
     "RET": ["rs79011770"]
 }
+
+# --------------------------------------------------------------
+# Region panels: every call inside these genes (see gene_index) is
+# checked against ClinVar pathogenic sites by position, so calls under
+# vendor IDs or other rsIDs are found too. A gene joins a panel by name
+# alone; the rsID lists above stay as known sites for files without
+# positions.
+# --------------------------------------------------------------
+RECESSIVE_REGION_GENES = sorted(GENE_PANELS)
+DOMINANT_REGION_GENES = sorted(DOMINANT_GENES)
+
+
+def region_panel_hits(genome, genes, skip=()):
+    """
+    (gene, rsid, ClinVar entry, alt copies) for calls inside `genes`
+    that sit on a pathogenic ClinVar site not otherwise reported and
+    carry its alt allele.
+    """
+    loci, site_ids = load_clinvar_sites()
+    if not len(loci):
+        return []
+    hits = []
+    for gene in genes:
+        for rsid in gene_ids(genome, gene):
+            if rsid in skip or rsid in CLINVAR_DB:
+                continue
+            info = genome[rsid]
+            key = (chrom_code(info.get("chrom")) << 32) | (info.get("pos") or 0)
+            i = int(np.searchsorted(loci, key))
+            # a site the genome also has under its own rsID is reported there
+            if i < len(loci) and loci[i] == key and site_ids[i] not in genome:
+                cinfo = CLINVAR_DB[site_ids[i]]
+                copies = pathogenic_copies(info.get("genotype"), cinfo)
+                if copies:
+                    hits.append((gene, rsid, cinfo, copies))
+    return hits
 
 
 # --------------------------------------------------------------
@@ -161,6 +253,29 @@ def detect_carrier_status(genome):
                         "genotype": genotype
                     })
 
+    # Region panels (by position)
+    listed = {rsid for snps in GENE_PANELS.values() for rsid in snps}
+    for gene, rsid, cinfo, copies in region_panel_hits(genome, RECESSIVE_REGION_GENES, listed):
+        genotype = genome[rsid].get("genotype")
+        if copies == 1:
+            carriers.append({
+                "gene": gene,
+                "rsid": rsid,
+                "variant": cinfo["variant"],
+                "status": "Carrier (ClinVar, by position)",
+                "genotype": genotype
+            })
+
+    listed = {rsid for snps in DOMINANT_GENES.values() for rsid in snps}
+    for gene, rsid, cinfo, _ in region_panel_hits(genome, DOMINANT_REGION_GENES, listed):
+        dominants.append({
+            "gene": gene,
+            "rsid": rsid,
+            "variant": cinfo["variant"],
+            "status": "Pathogenic (Dominant, by position)",
+            "genotype": genome[rsid].get("genotype")
+        })
+
     # Dominant genes
     for gene, snps in DOMINANT_GENES.items():
         for rsid in snps:
@@ -1,59 +1,47 @@
-import random
-from utils.trait_engine import predict_traits
-from utils.risk_engine import compute_health_risk
-
-
-# --------------------------------------------------------------
-#  Helper: get allele 1 or allele 2 randomly
-# --------------------------------------------------------------
-def split_genotype(geno):
-    """
-    Convert "A/G" -> ["A","G"]
-    """
-    g = geno.replace("/", "").upper()
-    if len(g) != 2:
-        return ["N", "N"]
-    return [g[0], g[1]]
+import math
+import time
+from utils.trait_engine import TRAIT_LOCI, predict_traits
+from utils.risk_engine import HEALTH_LOCI, compute_health_risk
+from utils.sparse_genome import SparseGenome
+from utils.genome_arrays import ALLELE_LETTERS
+from utils.recombination_engine import draw_gamete, layout_rsids, meiosis_layout
+
+# Everything the trait + targeted health engines read
+MODEL_LOCI = sorted(set(TRAIT_LOCI) | set(HEALTH_LOCI))
+
+# Adaptive Monte Carlo settings (see predict_child)
+MIN_SIMULATIONS = 32
+MAX_SIMULATIONS = 2048
+BATCH_SIZE = 32
+DEFAULT_PRECISION = 0.05   # 95% CI half-width on every trait probability
+DEFAULT_TIME_BUDGET = 5.0  # seconds
+CONFIDENCE_Z = 1.96
 
 
 # --------------------------------------------------------------
 #  Make a gamete with recombination
 # --------------------------------------------------------------
-def make_gamete(parent_genome):
+def make_gamete(parent_genome, loci=None, sex=None, layout=None):
     """
     Takes a parent's genome and returns a 'gamete':
     one allele per rsID, after recombination.
-    """
-
-    chrom_map = {}
-    for rsid, info in parent_genome.items():
-        chrom = info["chrom"]
-        pos = info["pos"]
-        geno = info["genotype"]
-
-        if chrom not in chrom_map:
-            chrom_map[chrom] = []
-
-        chrom_map[chrom].append((pos, rsid, geno))
 
-    gamete = {}
-
-    # Perform recombination per chromosome
-    for chrom, snps in chrom_map.items():
-        snps.sort(key=lambda x: x[0])
-        num_xo = random.randint(1, 3)
-        crossover_points = sorted(random.sample(range(len(snps)), num_xo))
-
-        current_side = random.randint(0, 1)
-        xo_index = 0
+    loci: optional list of rsIDs to restrict the gamete to. Loci a
+    SparseGenome does not specify are imputed from its population.
+    sex: "female" / "male" scales the crossover rate (None = sex-averaged).
+    layout: precomputed meiosis_layout(parent_genome, loci), so repeated
+    gametes from the same parent skip the setup.
+    """
+    if layout is None:
+        layout = meiosis_layout(parent_genome, loci)
+    if "rsids" not in layout:
+        layout["rsids"] = layout_rsids(layout)
 
-        for i, (pos, rsid, geno) in enumerate(snps):
-            alleles = split_genotype(geno)
-            gamete[rsid] = alleles[current_side]
+    codes = draw_gamete(layout, sex=sex)
+    gamete = dict(zip(layout["rsids"], (ALLELE_LETTERS[c] for c in codes.tolist())))
 
-            if xo_index < len(crossover_points) and i == crossover_points[xo_index]:
-                current_side = 1 - current_side
-                xo_index += 1
+    if loci is not None and isinstance(parent_genome, SparseGenome):
+        gamete.update(parent_genome.sample_alleles(tuple(loci)))
 
     return gamete
 
@@ -61,14 +49,34 @@ def make_gamete(parent_genome):
 # --------------------------------------------------------------
 #  Combine gametes -> child diploid genome
 # --------------------------------------------------------------
-def make_child_genome(gamA, gamB, parent_template):
+def make_child_genome(gamA, gamB, parent_template, loci=None):
     """
     parent_template: used to retrieve chrom + pos structure
+    loci: restrict the child to these rsIDs; loci missing from either
+    gamete are left out instead of becoming half calls ("A/N")
+    Without loci, template entries neither gamete carries (positional
+    "chrom:pos" ids, calls outside the arrays) are left out as well.
     """
 
     child = {}
 
+    if loci is not None:
+        for rsid in loci:
+            a1 = gamA.get(rsid)
+            a2 = gamB.get(rsid)
+            if not a1 or not a2:
+                continue
+            info = parent_template.get(rsid) or {}
+            child[rsid] = {
+                "genotype": f"{a1}/{a2}",
+                "chrom": info.get("chrom"),
+                "pos": info.get("pos"),
+            }
+        return child
+
     for rsid, info in parent_template.items():
+        if rsid not in gamA and rsid not in gamB:
+            continue
         a1 = gamA.get(rsid, "N")
         a2 = gamB.get(rsid, "N")
 
@@ -84,7 +92,7 @@ def make_child_genome(gamA, gamB, parent_template):
 # --------------------------------------------------------------
 #  Master Child Prediction (traits + health)
 # --------------------------------------------------------------
-def _summarize_trait_results(traits_dict):
+def summarize_trait_results(traits_dict):
     """
     Convert detailed trait dict into {trait: result_string} for aggregation.
     """
@@ -104,7 +112,37 @@ def _summarize_trait_results(traits_dict):
     return summary
 
 
-def predict_child(parentA_genome, parentB_genome, simulations: int = 64):
+def trait_precision(counts, n, z=CONFIDENCE_Z):
+    """
+    Widest Wilson-score confidence half-width per trait, over all of
+    the trait's observed values. Wilson (unlike the plain normal
+    approximation) stays non-zero for values seen 0 or n times.
+    """
+    if n == 0:
+        return {trait: 1.0 for trait in counts}
+
+    z2 = z * z
+    denom = 1 + z2 / n
+    precision = {}
+    for trait, vals in counts.items():
+        widest = 0.0
+        for cnt in vals.values():
+            p = cnt / n
+            half = z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n)) / denom
+            widest = max(widest, half)
+        precision[trait] = widest
+    return precision
+
+
+def predict_child(
+    parentA_genome,
+    parentB_genome,
+    simulations: int = MAX_SIMULATIONS,
+    precision: float = DEFAULT_PRECISION,
+    time_budget: float = DEFAULT_TIME_BUDGET,
+    batch_size: int = BATCH_SIZE,
+    sexes=(None, None),
+):
     """
     Full child simulation:
     - Gamete formation + recombination
@@ -112,35 +150,86 @@ def predict_child(parentA_genome, parentB_genome, simulations: int = 64):
     - Trait prediction
     - Health risk
     - Monte Carlo over recombinations for trait probability summaries
+
+    The Monte Carlo runs in batches and stops once every trait's 95%
+    confidence half-width is <= `precision`, the `time_budget` (seconds,
+    None = unlimited) runs out, or `simulations` children were drawn.
+
+    sexes: ("female" | "male" | None) for parent A and B, used for
+    sex-specific recombination rates.
     """
+    started = time.perf_counter()
+
+    # Sparse (manually entered) partners only define a handful of loci:
+    # the example child is limited to the loci the models read.
+    sparse = isinstance(parentA_genome, SparseGenome) or isinstance(parentB_genome, SparseGenome)
+    example_loci = MODEL_LOCI if sparse else None
+    template = {**parentB_genome, **parentA_genome} if sparse else parentA_genome
+    sexA, sexB = sexes
 
     # Sample one child for a concrete "example" output
-    gamA = make_gamete(parentA_genome)
-    gamB = make_gamete(parentB_genome)
-    child_genome = make_child_genome(gamA, gamB, parentA_genome)
+    gamA = make_gamete(parentA_genome, example_loci, sex=sexA)
+    gamB = make_gamete(parentB_genome, example_loci, sex=sexB)
+    child_genome = make_child_genome(gamA, gamB, template, example_loci)
     traits = predict_traits(child_genome)
     health = compute_health_risk(child_genome)
 
-    # Monte Carlo to approximate distribution across recombination events
+    # Crossovers are drawn in cM, so linkage between trait loci does not
+    # depend on how many other SNPs the parent has: the Monte Carlo only
+    # needs the trait loci. Layouts are built once per parent.
+    sim_loci = TRAIT_LOCI
+    layoutA = meiosis_layout(parentA_genome, sim_loci)
+    layoutB = meiosis_layout(parentB_genome, sim_loci)
+
+    # Adaptive Monte Carlo over recombination events
     counts = {}
-    sims = max(8, min(simulations, 256))
-    for _ in range(sims):
-        sim_gamA = make_gamete(parentA_genome)
-        sim_gamB = make_gamete(parentB_genome)
-        sim_child = make_child_genome(sim_gamA, sim_gamB, parentA_genome)
-        sim_traits = predict_traits(sim_child)
-        summary = _summarize_trait_results(sim_traits)
-        for trait, val in summary.items():
-            counts.setdefault(trait, {})
-            counts[trait][val] = counts[trait].get(val, 0) + 1
+    seen = {}
+    max_sims = max(MIN_SIMULATIONS, min(simulations, MAX_SIMULATIONS))
+    batch_size = max(1, batch_size)
+    sims = 0
+    per_trait = {}
+    stopped_by = "max_simulations"
+
+    while sims < max_sims:
+        for _ in range(min(batch_size, max_sims - sims)):
+            sim_gamA = make_gamete(parentA_genome, sim_loci, sex=sexA, layout=layoutA)
+            sim_gamB = make_gamete(parentB_genome, sim_loci, sex=sexB, layout=layoutB)
+            sim_child = make_child_genome(sim_gamA, sim_gamB, template, sim_loci)
+            # few loci -> children repeat; score each genotype pattern once
+            pattern = tuple(info["genotype"] for info in sim_child.values())
+            summary = seen.get(pattern)
+            if summary is None:
+                summary = seen[pattern] = summarize_trait_results(predict_traits(sim_child))
+            for trait, val in summary.items():
+                counts.setdefault(trait, {})
+                counts[trait][val] = counts[trait].get(val, 0) + 1
+            sims += 1
+
+        per_trait = trait_precision(counts, sims)
+        if sims >= MIN_SIMULATIONS and max(per_trait.values(), default=0.0) <= precision:
+            stopped_by = "precision"
+            break
+        if time_budget is not None and time.perf_counter() - started >= time_budget:
+            stopped_by = "time_budget"
+            break
 
     distribution = {
         trait: {val: round(cnt / sims, 4) for val, cnt in vals.items()}
         for trait, vals in counts.items()
     }
+    achieved = max(per_trait.values(), default=0.0)
 
     return {
         "child_traits": traits,
         "child_health": health,
         "child_trait_distribution": distribution,
+        "child_trait_precision": {
+            "simulations": sims,
+            "target": precision,
+            "achieved": round(achieved, 4),
+            "converged": achieved <= precision,
+            "stopped_by": stopped_by,
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+            "per_trait": {trait: round(p, 4) for trait, p in per_trait.items()},
+        },
     }
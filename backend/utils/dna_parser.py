@@ -2,13 +2,49 @@ import os
 import gzip
 import zipfile
 import csv
+import itertools
 
-SUPPORTED_FORMATS = ["23andme", "ancestry", "myheritage", "ftdna"]
+import numpy as np
+
+from utils.allele_harmonizer import FLIPPED, NO_DOSAGE, harmonization_summary, harmonize_arrays
+from utils.genome_arrays import (
+    ALLELE_LETTERS,
+    CHROM_NAMES,
+    chrom_code,
+    decode_genotype,
+    encode_calls,
+    join_sorted,
+    key_to_rsid,
+    locus_keys,
+    position_index,
+    position_order,
+    rsid_key,
+)
+from utils.recombination_engine import interpolate_cm
+from utils.reference_positions import load_reference_positions
+from utils.rsid_merges import remap_merged_rsids
+from utils.genome_qc import QC_EARLY_ROWS, check_qc, note_duplicates, qc_summary
+from utils.liftover import TARGET_BUILD, can_lift, detect_build_from_header, detect_build_from_loci, lift_calls
+from utils.vcf_reader import read_vcf, read_vcf_header
+
+SUPPORTED_FORMATS = ["23andme", "ancestry", "myheritage", "ftdna", "vcf"]
+
+# AncestryDNA numbers the chromosomes past the autosomes
+ANCESTRY_CHROMS = {"23": "X", "24": "Y", "25": "XY", "26": "MT"}
+
+# packed allele codes (a1 << 3 | a2) -> genotype string, as normalize_genotype("--") for no-calls
+GENOTYPE_STRINGS = np.array(
+    [(max(code >> 3, code & 7) < 7 and decode_genotype(code >> 3, code & 7)) or "-/-" for code in range(64)],
+    dtype=object,
+)
+CHROM_NAME_TABLE = np.array([CHROM_NAMES.get(code) for code in range(256)], dtype=object)
 
 def detect_format(header_line: str):
     """Detects which company format the file uses."""
     line = header_line.lower()
 
+    if line.startswith("##fileformat=vcf"):
+        return "vcf"
     if "23andme" in line:
         return "23andme"
     if "ancestry" in line or "ancestrydna" in line:
@@ -36,7 +72,7 @@ def open_file_auto(path):
                     return z.open(name), name
             raise ValueError("ZIP does not contain a DNA text file.")
 
-    if path.endswith(".gz"):
+    if path.endswith(".gz") or path.endswith(".bgz"):
         return gzip.open(path, "rt"), path
 
     return open(path, "r", errors="ignore"), path
@@ -67,10 +103,11 @@ def parse_row(format_type, row):
             return rsid, chrom, pos, genotype
 
         if format_type == "ancestry":
+            # AncestryDNA: allele1 and allele2 in separate columns
             rsid = row[0]
-            chrom = row[1]
+            chrom = ANCESTRY_CHROMS.get(row[1], row[1])
             pos = int(row[2])
-            genotype = normalize_genotype(row[3])
+            genotype = normalize_genotype(row[3] + row[4] if len(row) > 4 else row[3])
             return rsid, chrom, pos, genotype
 
         if format_type == "myheritage":
@@ -99,43 +136,392 @@ def parse_row(format_type, row):
         return None
 
 
-def parse_raw_dna_file(path: str):
+class Genome(dict):
+    """
+    Parsed genome: the usual { rsid: {genotype, chrom, pos} } dict plus
+    compact arrays built once at parse time.
+
+    arrays:    see genome_arrays.encode_calls, plus "cm" (genetic map
+               position of every SNP, see recombination_engine) and
+               "by_position" (see genome_arrays.position_order)
+    positions: { "locus": sorted int64 (chrom, pos) keys, "ids": [...] }
+               for lookups by position (see genome_arrays.locus_keys)
+    build:     { "detected": 36|37|38, "source": "given"|"header"|"loci"|"assumed"
+                 (or "panel" for compact panel uploads, see panel_manifest),
+                 "positions": build the stored positions are on,
+                 "unmapped": calls that lost their position in liftover }
+    harmonization: { "checked", "flipped", "ambiguous", "mismatched" }
+               counts from allele_harmonizer; harmonized entries also
+               carry "dosage" (alt-allele count), "ref" and "alt"
+    qc:        QC summary of the raw file (see genome_qc)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.arrays = None
+        self.positions = None
+        self.build = None
+        self.harmonization = None
+        self.qc = None
+
+    @classmethod
+    def from_arrays(cls, arrays, extra=None, build=None):
+        """
+        Genome from already encoded arrays (e.g. a merge result), without
+        going back through genotype strings. extra: { id: entry } for
+        calls that have no array key (positional "chrom:pos" IDs).
+
+        The arrays are ready at once; the dict entries and `positions`
+        are built on first use (see _DeferredGenome), so callers that
+        only need the arrays (merge reports, the genome store) never pay
+        for ~1M Python dicts.
+        """
+        genome = _DeferredGenome()
+        genome.build = build
+        if "cm" not in arrays:
+            arrays["cm"] = interpolate_cm(arrays["chrom"], arrays["pos"])
+        result = genome._harmonize_arrays(arrays)
+        position_order(arrays)
+        genome.arrays = arrays
+        genome._pending = (cls, dict(extra or {}), result)
+        return genome
+
+    def _fill_from_arrays(self, extra, result):
+        """Dict entries and `positions` of a genome built by from_arrays."""
+        arrays = self.arrays
+        rsids = [f"rs{k}" if k > 0 else f"i{-k}" for k in arrays["key"].tolist()]
+        genotypes = GENOTYPE_STRINGS[(arrays["a1"].astype(np.intp) << 3) | arrays["a2"]].tolist()
+        chroms = CHROM_NAME_TABLE[arrays["chrom"]].tolist()
+        positions = arrays["pos"].tolist()
+
+        dict.update(self, zip(rsids, [
+            {"genotype": g, "chrom": c, "pos": p}
+            for g, c, p in zip(genotypes, chroms, positions)
+        ]))
+
+        extra = {rsid: info for rsid, info in extra.items() if rsid not in self}
+        self.update(extra)
+        extra_ids = list(extra)
+        extra_loci, extra_order = position_index(
+            [info.get("chrom") for info in extra.values()],
+            [info.get("pos") for info in extra.values()],
+        )
+
+        loci = locus_keys(arrays["chrom"], arrays["pos"])
+        placed = np.flatnonzero(loci)
+        loci = np.concatenate((loci[placed], extra_loci))
+        order = np.argsort(loci, kind="stable")
+        ids = np.array(rsids + extra_ids, dtype=object)
+        index = np.concatenate((placed, len(rsids) + extra_order))[order]
+        self.positions = {"locus": loci[order], "ids": ids[index].tolist()}
+
+        self._harmonize_entries(arrays, result)
+
+    def build_arrays(self, rsids, chroms, positions, genotypes, keys=None):
+        loci, order = position_index(chroms, positions)
+        self.positions = {"locus": loci, "ids": [rsids[i] for i in order]}
+
+        # Reference rsIDs this file carries under another identifier
+        # (vendor "i" IDs, VCF records without an ID) become aliases of
+        # the call at the same position.
+        aliases = self._reference_aliases()
+        for rsid, source in aliases:
+            self[rsid] = self[source]
+        infos = [self[source] for _, source in aliases]
+        alias_ids = [rsid for rsid, _ in aliases]
+        if keys is not None:
+            keys = np.concatenate((keys, np.fromiter(map(rsid_key, alias_ids), dtype=np.int64, count=len(alias_ids))))
+
+        arrays = encode_calls(
+            rsids + alias_ids,
+            chroms + [info["chrom"] for info in infos],
+            positions + [info["pos"] for info in infos],
+            genotypes + [info["genotype"] for info in infos],
+            keys=keys,
+        )
+        arrays["cm"] = interpolate_cm(arrays["chrom"], arrays["pos"])
+        self._harmonize(arrays)
+        position_order(arrays)
+        self.arrays = arrays
+
+    def _harmonize(self, arrays):
+        """
+        Puts calls at reference SNPs on the reference strand and gives
+        them dosage codes (see allele_harmonizer), in the arrays and in
+        the dict entries.
+        """
+        self._harmonize_entries(arrays, self._harmonize_arrays(arrays))
+
+    def _harmonize_arrays(self, arrays):
+        result = harmonize_arrays(arrays)
+        index = result["index"]
+        arrays["a1"][index] = result["a1"]
+        arrays["a2"][index] = result["a2"]
+        arrays["dosage"] = np.full(len(arrays["key"]), NO_DOSAGE, dtype=np.int8)
+        arrays["dosage"][index] = result["dosage"]
+        self.harmonization = harmonization_summary(result)
+        return result
+
+    def _harmonize_entries(self, arrays, result):
+        index = result["index"]
+        for key, a1, a2, ref, alt, dosage, status in zip(
+            arrays["key"][index].tolist(),
+            result["a1"].tolist(),
+            result["a2"].tolist(),
+            result["ref"].tolist(),
+            result["alt"].tolist(),
+            result["dosage"].tolist(),
+            result["status"].tolist(),
+        ):
+            info = self.get(key_to_rsid(key))
+            if info is None:
+                continue
+            if status == FLIPPED:
+                info["genotype"] = decode_genotype(a1, a2)
+            if dosage != NO_DOSAGE:
+                info["dosage"] = dosage
+                info["ref"] = ALLELE_LETTERS[ref]
+                info["alt"] = ALLELE_LETTERS[alt]
+
+    def _reference_aliases(self):
+        """[(reference rsid, identifier in this file)] matched by position."""
+        if self.build and self.build["positions"] != TARGET_BUILD:
+            # reference positions are GRCh37
+            return []
+        reference = load_reference_positions()
+        at, hits = join_sorted(self.positions["locus"], reference["locus"])
+        ids = self.positions["ids"]
+        aliases = []
+        for i, r in zip(at.tolist(), hits.tolist()):
+            rsid = reference["rsids"][r]
+            if rsid not in self and ids[i] in self:
+                aliases.append((rsid, ids[i]))
+        return aliases
+
+    def at(self, chrom, pos):
+        """Call at (chrom, pos), whatever its identifier, or None."""
+        if self.positions is None:
+            return None
+        key = locus_keys([chrom_code(chrom)], [pos])
+        at, _ = join_sorted(self.positions["locus"], key)
+        return self.get(self.positions["ids"][at[0]]) if len(at) else None
+
+    def positional_calls(self):
+        """
+        { id: {genotype, chrom, pos} } of the calls the arrays have no key
+        for (positional "chrom:pos" IDs), e.g. to store them next to the arrays.
+        """
+        ids = (self.positions or {}).get("ids") or []
+        return {
+            i: {"genotype": self[i]["genotype"], "chrom": self[i]["chrom"], "pos": self[i]["pos"]}
+            for i in ids if ":" in i and i in self
+        }
+
+    def invalidate_arrays(self):
+        """Call after adding/replacing calls so array views are rebuilt."""
+        self.arrays = None
+
+
+
+class _DeferredGenome(Genome):
+    """
+    A Genome from Genome.from_arrays whose dict entries and positions are
+    not built yet. The first dict operation (or `positions`) builds them
+    and turns the object into a plain Genome, so lookups cost nothing
+    extra afterwards.
+    """
+
+    _pending = None
+
+    def _materialize(self):
+        cls, extra, result = self._pending
+        del self._pending
+        self.__class__ = cls
+        self._fill_from_arrays(extra, result)
+
+    @property
+    def positions(self):
+        self._materialize()
+        return self.positions
+
+    def positional_calls(self):
+        # the extras from_arrays was given, without building the dict
+        return {
+            i: {"genotype": info.get("genotype"), "chrom": info.get("chrom"), "pos": info.get("pos")}
+            for i, info in self._pending[1].items()
+        }
+
+    @positions.setter
+    def positions(self, value):
+        self.__dict__["positions"] = value
+
+
+def _materializing(name):
+    method = getattr(dict, name)
+
+    def call(self, *args, **kwargs):
+        self._materialize()
+        return method(self, *args, **kwargs)
+
+    call.__name__ = name
+    return call
+
+
+for _name in (
+    "__contains__", "__getitem__", "__setitem__", "__delitem__", "__iter__", "__reversed__",
+    "__len__", "__eq__", "__ne__", "__repr__", "__or__", "__ior__",
+    "get", "keys", "values", "items", "setdefault", "pop", "popitem", "update", "copy", "clear",
+):
+    setattr(_DeferredGenome, _name, _materializing(_name))
+
+
+def parse_raw_dna_file(path: str, panel=None, build=None, watch=None, on_watched=None):
     """
     Main entry: parses ANY DNA file into a unified dictionary.
 
-    Returns:
+    panel: loci to keep in VCFs (rsIDs or (rsid, chrom, pos) tuples);
+    by default the engines' loci, vcf_reader.ALL_RECORDS for every
+    record. Consumer array files are small and always read in full.
+    build: the file's genome build (36/37/38) if known; detected
+    otherwise. Positions are lifted to GRCh37 when a chain file is
+    available (see liftover and Genome.build).
+    watch / on_watched: rsIDs to look out for while reading (or
+    { rsid: chrom }); on_watched gets their raw { rsid: genotype } as
+    soon as all were read, before the rest of the file is parsed and the
+    genome built, e.g. for a preview. With chromosomes given it fires
+    once the (chromosome-sorted) file is past all missing ones, else at
+    the end of the file with those found.
+
+    Returns a Genome (dict subclass, see above):
     {
         "rs123": { "genotype": "A/G", "chrom": "7", "pos": 117199644 }
         ...
     }
     """
-    snp_data = {}
+    snp_data = Genome()
+    rsids, chroms, positions, genotypes = [], [], [], []
+    header = []
+    source = "given" if build else None
 
     reader, name = open_file_auto(path)
     first_line = reader.readline()
     format_type = detect_format(first_line)
 
-    # Skip comment lines starting with '#'
-    while first_line.startswith("#"):
-        first_line = reader.readline()
+    if format_type == "vcf":
+        reader.close()
+        header = read_vcf_header(path)
+        build = build or detect_build_from_header(header)
+        records = read_vcf(path, panel, build=build)
+    else:
+        # Skip comment lines starting with '#'
+        while first_line.startswith("#"):
+            header.append(first_line)
+            first_line = reader.readline()
+        build = build or detect_build_from_header(header)
 
-    # Now read with CSV parser
-    reader = csv.reader(
-        [first_line] + list(reader),
-        delimiter="\t" if "\t" in first_line else ","
-    )
+        # Now read with CSV parser, streaming the rest of the file
+        rows = csv.reader(
+            itertools.chain([first_line], reader),
+            delimiter="\t" if "\t" in first_line else ","
+        )
+        records = (
+            parse_row(format_type, row)
+            for row in rows
+            if row and not row[0].startswith("#")
+        )
 
-    for row in reader:
-        if not row or row[0].startswith("#"):
-            continue
-        parsed = parse_row(format_type, row)
+    # The VCF reader already drops unusable records, so only text
+    # formats get a parsed-rows fraction
+    rows = 0
+    count_rows = format_type != "vcf"
+    pending = set(watch) if on_watched is not None else None
+    watch_chroms = {r: chrom_code(c) for r, c in watch.items()} if isinstance(watch, dict) else {}
+    watched = {}
+    last_chrom = None
+    for parsed in records:
         if parsed:
             rsid, chrom, pos, genotype = parsed
             if rsid and genotype:
-                snp_data[rsid] = {
-                    "genotype": genotype,
-                    "chrom": chrom,
-                    "pos": pos,
-                }
+                rsids.append(rsid)
+                chroms.append(chrom)
+                positions.append(pos)
+                genotypes.append(genotype)
+                if pending is not None:
+                    if rsid in pending:
+                        watched[rsid] = genotype
+                        pending.discard(rsid)
+                    elif watch_chroms and chrom != last_chrom:
+                        last_chrom = chrom
+                        if chrom_code(chrom) > max(watch_chroms.get(r, 99) for r in pending):
+                            pending.clear()
+                    if not pending:
+                        on_watched(watched)
+                        pending = None
+        rows += 1
+        if rows == QC_EARLY_ROWS:
+            # reject junk before reading the rest of the file
+            check_qc(qc_summary(chroms, genotypes, rows if count_rows else None), early=True)
+
+    qc = qc_summary(chroms, genotypes, rows if count_rows else None)
+    snp_data.qc = check_qc(note_duplicates(qc, len(rsids) - len(set(rsids))))
+    snp_data.qc["format"] = format_type
+    # loci still pending at the end of the file: only for files that pass QC
+    if pending is not None:
+        on_watched(watched)
+
+    # Genome build: header hint, else a sample of known loci
+    if build and source is None:
+        source = "header"
+    if build is None:
+        build, _ = detect_build_from_loci(rsids, chroms, positions, load_reference_positions())
+        source = "loci" if build else "assumed"
+    build = build or TARGET_BUILD
+
+    unmapped = 0
+    positions_build = build
+    if build != TARGET_BUILD and can_lift(build, TARGET_BUILD):
+        chroms, positions, genotypes, unmapped = lift_calls(chroms, positions, genotypes, build)
+        positions_build = TARGET_BUILD
+
+    snp_data.build = {
+        "detected": build,
+        "source": source,
+        "positions": positions_build,
+        "unmapped": unmapped,
+    }
+
+    for rsid, chrom, pos, genotype in zip(rsids, chroms, positions, genotypes):
+        snp_data[rsid] = {
+            "genotype": genotype,
+            "chrom": chrom,
+            "pos": pos,
+        }
 
+    # Retired rsIDs dbSNP merged into others are renamed once here, so
+    # engines only ever look up current rsIDs (see rsid_merges)
+    keys = np.fromiter(map(rsid_key, rsids), dtype=np.int64, count=len(rsids))
+    snp_data.qc["merged_rsids"] = remap_merged_rsids(snp_data, rsids, keys, genotypes)
+
+    snp_data.build_arrays(rsids, chroms, positions, genotypes, keys=keys)
+    return snp_data
+
+
+def genome_from_genotypes(genotypes):
+    """
+    Builds a genome dict from a client-supplied mapping such as
+    { "rs12913832": "AG" } or { "rs12913832": {"genotype": "A/G", ...} }.
+    ValueError for anything that is not such a mapping.
+    """
+    if not isinstance(genotypes, dict) and genotypes is not None:
+        raise ValueError("Genotypes must be an object of rsID -> genotype")
+    snp_data = {}
+    for rsid, value in (genotypes or {}).items():
+        info = value if isinstance(value, dict) else {"genotype": value}
+        genotype = normalize_genotype(info.get("genotype"))
+        if rsid and genotype:
+            snp_data[rsid] = {
+                "genotype": genotype,
+                "chrom": info.get("chrom"),
+                "pos": info.get("pos") or 0,
+            }
     return snp_data
@@ -42,6 +42,10 @@ FAST_SNPS = {
 }
 
 
+# Every locus the fast model reads
+FAST_LOCI = sorted({rsid for snps in FAST_SNPS.values() for rsid in snps})
+
+
 ############################################################
 # Utility
 ############################################################
@@ -263,3 +267,8 @@ def run_fast_model(genotypes):
         "tanning": fast_tanning(genotypes),
         "red_hair_probability": fast_red_hair_probability(genotypes),
     }
+
+
+def run_fast_preview(calls):
+    """run_fast_model on raw parser calls ({ rsid: "A/G" }), e.g. mid-parse."""
+    return run_fast_model({rsid: (g or "").replace("/", "") for rsid, g in calls.items()})
@@ -0,0 +1,173 @@
+"""
+Gene annotation interval index.
+
+Gene coordinates (GRCh37, 1-based inclusive) come from local files, in
+priority order (the first to list a gene wins):
+
+- nih/genes.csv          gene,chrom,start,end[,strand]
+- nih/refGene.txt.gz     UCSC refGene dump (transcripts of a gene are
+                         merged into one span per chromosome)
+
+and are compiled once into arrays sorted by start locus (see
+genome_arrays.locus_keys):
+
+    start    int64[G]  start locus keys, sorted
+    end      int64[G]  end locus keys
+    max_end  int64[G]  running maximum of end, so an overlap search can
+                       stop walking back as soon as nothing earlier can
+                       reach the query
+    names    str[G]
+
+Gene -> region is a dict lookup; region -> calls is two binary searches
+on a genome's position-sorted loci (Genome.positions), and position ->
+genes a binary search plus a short walk back.
+"""
+
+import csv
+import gzip
+import os
+
+import numpy as np
+
+from utils.genome_arrays import CHROM_NAMES, chrom_code, locus_keys, position_index
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GENE_SOURCES = [
+    os.path.join(BASE_DIR, "nih", "genes.csv"),
+    os.path.join(BASE_DIR, "nih", "refGene.txt.gz"),
+]
+
+# Loaded once (see module docstring); empty when no source ships
+GENE_INDEX = {}
+
+
+# ---------------------------------------------------------
+# Index
+# ---------------------------------------------------------
+def _read_source(path):
+    """Yields (gene, chrom code, start, end) from one coordinate file."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="ignore") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                try:
+                    yield (row["gene"].strip().upper(), chrom_code(row["chrom"].strip()),
+                           int(row["start"]), int(row["end"]))
+                except (KeyError, AttributeError, ValueError):
+                    continue
+            return
+
+        # refGene: bin, name, chrom, strand, txStart (0-based), txEnd, ..., name2 (12)
+        for row in csv.reader(f, delimiter="\t"):
+            if len(row) < 13:
+                continue
+            try:
+                yield row[12].upper(), chrom_code(row[2]), int(row[4]) + 1, int(row[5])
+            except ValueError:
+                continue
+
+
+def compile_gene_index():
+    spans = {}
+    for path in GENE_SOURCES:
+        if not os.path.exists(path):
+            continue
+        found = {}
+        try:
+            for gene, chrom, start, end in _read_source(path):
+                if not gene or not chrom or start <= 0 or end < start or gene in spans:
+                    continue
+                span = found.get((gene, chrom))
+                found[(gene, chrom)] = (min(span[0], start), max(span[1], end)) if span else (start, end)
+        except (OSError, csv.Error) as e:
+            print(f"Failed reading gene coordinates from {path}: {e}")
+        for (gene, chrom), (start, end) in found.items():
+            spans.setdefault(gene, []).append((chrom, start, end))
+
+    rows = [(gene, chrom, start, end) for gene, regions in spans.items() for chrom, start, end in regions]
+    names = np.array([r[0] for r in rows], dtype=str)
+    chrom = np.array([r[1] for r in rows], dtype=np.int64)
+    start = locus_keys(chrom, np.array([r[2] for r in rows], dtype=np.int64))
+    end = locus_keys(chrom, np.array([r[3] for r in rows], dtype=np.int64))
+    order = np.argsort(start, kind="stable")
+
+    index = {"start": start[order], "end": end[order], "names": names[order]}
+    index["max_end"] = np.maximum.accumulate(index["end"]) if len(order) else index["end"]
+    index["by_name"] = {}
+    for i, gene in enumerate(index["names"].tolist()):
+        index["by_name"].setdefault(gene, []).append(i)
+    return index
+
+
+def load_gene_index():
+    global GENE_INDEX
+    if not GENE_INDEX:
+        GENE_INDEX = compile_gene_index()
+    return GENE_INDEX
+
+
+# ---------------------------------------------------------
+# Lookups
+# ---------------------------------------------------------
+def gene_regions(gene, flank=0):
+    """[(chrom name, start, end), ...] of a gene (usually one), widened by `flank` bp."""
+    index = load_gene_index()
+    regions = []
+    for i in index["by_name"].get((gene or "").strip().upper(), []):
+        start, end = int(index["start"][i]), int(index["end"][i])
+        regions.append((CHROM_NAMES[start >> 32], max((start & 0xFFFFFFFF) - flank, 1), (end & 0xFFFFFFFF) + flank))
+    return regions
+
+
+def genes_at(chrom, pos):
+    """Genes overlapping one position."""
+    index = load_gene_index()
+    code = chrom_code(chrom)
+    if not code or not len(index["start"]):
+        return []
+    key = (code << 32) | int(pos)
+    genes = []
+    i = int(np.searchsorted(index["start"], key, side="right")) - 1
+    while i >= 0 and index["max_end"][i] >= key:
+        if index["end"][i] >= key:
+            genes.append(str(index["names"][i]))
+        i -= 1
+    return genes[::-1]
+
+
+def _position_index(genome):
+    """(sorted locus keys, ids) of a genome; parsed genomes carry it already."""
+    positions = getattr(genome, "positions", None)
+    if positions is None:
+        ids = list(genome.keys())
+        loci, order = position_index([genome[r].get("chrom") for r in ids], [genome[r].get("pos") for r in ids])
+        positions = {"locus": loci, "ids": [ids[i] for i in order]}
+    return positions["locus"], positions["ids"]
+
+
+def region_ids(genome, chrom, start, end):
+    """Ids of the calls with start <= pos <= end on `chrom`, in position order."""
+    code = chrom_code(chrom)
+    if not code:
+        return []
+    loci, ids = _position_index(genome)
+    lo = int(np.searchsorted(loci, (code << 32) | max(int(start), 0), side="left"))
+    hi = int(np.searchsorted(loci, (code << 32) | int(end), side="right"))
+    return ids[lo:hi]
+
+
+def gene_ids(genome, gene, flank=0):
+    """Ids of the calls inside a gene (see gene_regions)."""
+    return [rsid for region in gene_regions(gene, flank) for rsid in region_ids(genome, *region)]
+
+
+def gene_calls(genome, gene, flank=0):
+    """
+    The genome's calls inside a gene, in position order:
+    [{"rsid": "rs80357713", "chrom": "17", "pos": 41276045, "genotype": "C/C"}, ...]
+    """
+    calls = []
+    for rsid in gene_ids(genome, gene, flank):
+        info = genome[rsid]
+        calls.append({"rsid": rsid, "chrom": info.get("chrom"), "pos": info.get("pos"), "genotype": info.get("genotype")})
+    return calls
@@ -0,0 +1,239 @@
+"""
+Compact array view of a parsed genome.
+
+The engines work on the dict produced by `parse_raw_dna_file`, which is
+convenient for single-SNP lookups but too slow for whole-genome work
+(trio checks, merges, summaries). This module encodes a genome into
+parallel numpy arrays sorted by an integer locus key so those engines
+can run as vectorized comparisons.
+"""
+
+import numpy as np
+
+# ---------------------------------------------------------
+# Allele / chromosome codes
+# ---------------------------------------------------------
+# 0 is reserved for "no call" everywhere.
+ALLELE_CODES = {"A": 1, "C": 2, "G": 3, "T": 4, "D": 5, "I": 6}
+ALLELE_LETTERS = "NACGTDI"
+
+CHROM_CODES = {str(i): i for i in range(1, 23)}
+CHROM_CODES.update({"X": 23, "Y": 24, "XY": 25, "MT": 26})
+CHROM_NAMES = dict(map(reversed, CHROM_CODES.items()))
+# aliases: "M", and the numbers AncestryDNA / PLINK use past the autosomes
+CHROM_CODES.update({"M": 26, "23": 23, "24": 24, "25": 25, "26": 26})
+
+AUTOSOMES = np.arange(1, 23)
+
+# genotype string -> (allele1, allele2); filled lazily, only a few dozen
+# distinct strings ever occur
+_GENOTYPE_CACHE = {}
+
+
+def rsid_key(rsid):
+    """
+    Integer key for an identifier:
+    "rs123" -> 123, vendor-internal "i123" -> -123, anything else -> 0.
+    """
+    try:
+        if rsid.startswith("rs"):
+            return int(rsid[2:])
+        if rsid.startswith("i"):
+            return -int(rsid[1:])
+    except (ValueError, AttributeError):
+        pass
+    return 0
+
+
+def key_to_rsid(key):
+    """Inverse of `rsid_key` for non-zero keys."""
+    return f"rs{key}" if key > 0 else f"i{-key}"
+
+
+def chrom_code(chrom):
+    if chrom is None:
+        return 0
+    c = str(chrom).upper()
+    if c.startswith("CHR"):
+        c = c[3:]
+    return CHROM_CODES.get(c, 0)
+
+
+def genotype_codes(genotype):
+    """
+    "A/G" -> (1, 3). Haploid calls ("A") are stored as homozygous,
+    no-calls ("--", "N/N", None) as (0, 0).
+    """
+    cached = _GENOTYPE_CACHE.get(genotype)
+    if cached is not None:
+        return cached
+
+    g = (genotype or "").replace("/", "").replace("|", "").upper()
+    if len(g) == 1:
+        g = g * 2
+    if len(g) != 2:
+        codes = (0, 0)
+    else:
+        a1 = ALLELE_CODES.get(g[0], 0)
+        a2 = ALLELE_CODES.get(g[1], 0)
+        codes = (a1, a2) if a1 and a2 else (0, 0)
+
+    _GENOTYPE_CACHE[genotype] = codes
+    return codes
+
+
+def _packed_genotype(genotype):
+    a1, a2 = genotype_codes(genotype)
+    return (a1 << 3) | a2
+
+
+_CHROM_CACHE = {}
+
+
+def _chrom_code_cached(chrom):
+    code = _CHROM_CACHE.get(chrom)
+    if code is None:
+        code = _CHROM_CACHE[chrom] = chrom_code(chrom)
+    return code
+
+
+def decode_genotype(a1, a2):
+    """(1, 3) -> "A/G"; no-call -> None."""
+    if not a1 or not a2:
+        return None
+    return f"{ALLELE_LETTERS[a1]}/{ALLELE_LETTERS[a2]}"
+
+
+# ---------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------
+def encode_calls(rsids, chroms, positions, genotypes, keys=None):
+    """
+    Encodes parallel call lists into the array layout below, sorted by
+    locus key (`keys`: the rsid_key of every identifier, if already
+    computed):
+    {
+        "key":   int64   (see rsid_key),
+        "chrom": uint8   (see CHROM_CODES),
+        "pos":   int64,
+        "a1":    uint8,
+        "a2":    uint8,
+    }
+    Identifiers without a usable key are dropped.
+    """
+    n = len(rsids)
+    if keys is None:
+        keys = np.fromiter(map(rsid_key, rsids), dtype=np.int64, count=n)
+    chrom = np.fromiter(map(_chrom_code_cached, chroms), dtype=np.uint8, count=n)
+    pos = np.fromiter((p or 0 for p in positions), dtype=np.int64, count=n)
+    # both alleles packed in one byte while iterating, split afterwards
+    packed = np.fromiter(map(_packed_genotype, genotypes), dtype=np.uint8, count=n)
+
+    keep = np.flatnonzero(keys != 0)
+    keep = keep[np.argsort(keys[keep], kind="stable")]
+    # duplicated identifiers: the last call wins, as in the genome dict
+    sorted_keys = keys[keep]
+    last = np.append(sorted_keys[1:] != sorted_keys[:-1], True)[:len(sorted_keys)]
+    keep = keep[last]
+
+    packed = packed[keep]
+    return {
+        "key": keys[keep],
+        "chrom": chrom[keep],
+        "pos": pos[keep],
+        "a1": packed >> 3,
+        "a2": packed & 7,
+    }
+
+
+def encode_genome(genome):
+    """
+    Array view of a genome (see encode_calls). Parsed genomes carry it
+    already (`genome.arrays`); plain dicts are encoded on the fly.
+    """
+    cached = getattr(genome, "arrays", None)
+    if cached is not None:
+        return cached
+
+    infos = genome.values()
+    return encode_calls(
+        list(genome.keys()),
+        [info.get("chrom") for info in infos],
+        [info.get("pos") for info in infos],
+        [info.get("genotype") for info in infos],
+    )
+
+
+def align_genomes(*encoded):
+    """
+    Intersects encoded genomes on their locus keys.
+    Returns (shared_keys, [index array into each genome]).
+    """
+    shared = encoded[0]["key"]
+    for enc in encoded[1:]:
+        shared = np.intersect1d(shared, enc["key"], assume_unique=True)
+
+    indices = [np.searchsorted(enc["key"], shared) for enc in encoded]
+    return shared, indices
+
+
+# ---------------------------------------------------------
+# Position keys
+# ---------------------------------------------------------
+def locus_keys(chrom, pos):
+    """(chrom code, bp) arrays -> one sortable int64 per locus (0 = unplaced)."""
+    chrom = np.asarray(chrom, dtype=np.int64)
+    pos = np.asarray(pos, dtype=np.int64)
+    return np.where((chrom > 0) & (pos > 0), (chrom << 32) | pos, 0)
+
+
+def position_index(chroms, positions):
+    """
+    Sorted (chrom, pos) index over parallel call lists.
+    Returns (sorted locus keys, order) where order[i] is the list index
+    of the i-th sorted call; unplaced calls are left out.
+    """
+    n = len(chroms)
+    chrom = np.fromiter(map(_chrom_code_cached, chroms), dtype=np.uint8, count=n)
+    pos = np.fromiter((p or 0 for p in positions), dtype=np.int64, count=n)
+    loci = locus_keys(chrom, pos)
+    order = np.flatnonzero(loci)
+    order = order[np.argsort(loci[order], kind="stable")]
+    return loci[order], order
+
+
+def position_order(arrays):
+    """
+    Indices into `arrays` of its placed calls in (chrom, pos) order, one
+    per locus (aliases at the same position collapse to the first).
+    Computed once and kept as arrays["by_position"].
+    """
+    order = arrays.get("by_position")
+    if order is None:
+        loci = locus_keys(arrays["chrom"], arrays["pos"])
+        order = np.flatnonzero(loci)
+        order = order[np.argsort(loci[order], kind="stable")]
+        loci = loci[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = loci[1:] != loci[:-1]
+        order = order[first]
+        arrays["by_position"] = order
+    return order
+
+
+def join_sorted(left, right):
+    """
+    Sorted-merge join of two sorted key arrays.
+    Returns (left index, right index) for every right key found in left
+    (the first left entry when a key repeats).
+    """
+    at = np.searchsorted(left, right)
+    hit = at < len(left)
+    hit[hit] = left[at[hit]] == right[hit]
+    return at[hit], np.flatnonzero(hit)
+
+
+def allele_masks(a1, a2):
+    """Bitmask of the alleles present in each genotype (bit n = allele code n)."""
+    one = np.uint8(1)
+    return (one << a1) | (one << a2)
@@ -0,0 +1,198 @@
+"""
+Merging several raw files of the same person (e.g. a 23andMe and an
+AncestryDNA export) into one genome.
+
+All calls are stacked into one set of arrays and sorted by (rsID key,
+file order), so every site's calls sit next to each other and each
+conflict policy is a handful of grouped array operations. Calls that
+only carry a positional ID ("chrom:pos") are matched by position.
+
+Policies for sites where the files disagree:
+- "first":     the first file (in the order given) that called the site
+- "consensus": the call if every file that called it agrees, else no-call
+- "majority":  the most frequent call; ties become no-calls
+"""
+
+import numpy as np
+
+from utils.dna_parser import Genome
+from utils.genome_arrays import chrom_code, encode_genome, locus_keys, rsid_key
+
+MERGE_POLICIES = ("first", "consensus", "majority")
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+def _unordered(a1, a2):
+    """Packed genotype code with A/G and G/A collapsed (0 = no-call)."""
+    lo = np.minimum(a1, a2).astype(np.int16)
+    hi = np.maximum(a1, a2).astype(np.int16)
+    return np.where(lo > 0, (lo << 3) | hi, 0)
+
+
+def _pair_concordance(x, y):
+    _, ix, iy = np.intersect1d(x["key"], y["key"], assume_unique=True, return_indices=True)
+    gx = _unordered(x["a1"][ix], x["a2"][ix])
+    gy = _unordered(y["a1"][iy], y["a2"][iy])
+    both = (gx > 0) & (gy > 0)
+    concordant = int((gx[both] == gy[both]).sum())
+    n_both = int(both.sum())
+    return {
+        "overlap": int(len(ix)),
+        "both_called": n_both,
+        "concordant": concordant,
+        "concordance": round(concordant / n_both, 6) if n_both else None,
+    }
+
+
+def _positional_calls(genome, encoded):
+    """Entries stored under IDs without an array key (e.g. "chrom:pos")."""
+    if len(genome) == len(encoded["key"]):
+        return {}
+    return {i: info for i, info in genome.items() if i[:2] != "rs" and not rsid_key(i)}
+
+
+def _choose(group_start, group_of, called, packed, policy):
+    """Row index chosen per site, and whether the site becomes a no-call."""
+    n_sites = len(group_start)
+
+    if policy == "first":
+        # rows are sorted by (key, not called, file order)
+        return group_start, np.zeros(n_sites, dtype=bool)
+
+    codes = np.where(called, packed, 0)
+    if policy == "consensus":
+        big = np.iinfo(np.int16).max
+        lo = np.minimum.reduceat(np.where(called, codes, big), group_start)
+        hi = np.maximum.reduceat(codes, group_start)
+        disagree = (hi > 0) & (lo != hi)
+        return group_start, disagree
+
+    # majority: count each (site, genotype) among called rows
+    rows = np.flatnonzero(called)
+    if len(rows) == 0:
+        return group_start, np.zeros(n_sites, dtype=bool)
+    pair = group_of[rows].astype(np.int64) * 64 + codes[rows]
+    uniq, first, counts = np.unique(pair, return_index=True, return_counts=True)
+    site = uniq // 64
+    # best count per site, ties detected by a second-best equal count
+    order = np.lexsort((-counts, site))
+    site, counts, first = site[order], counts[order], first[order]
+    head = np.ones(len(site), dtype=bool)
+    head[1:] = site[1:] != site[:-1]
+    tie = np.zeros(len(site), dtype=bool)
+    tie[:-1] = ~head[1:] & (counts[1:] == counts[:-1])
+
+    chosen = group_start.copy()
+    chosen[site[head]] = rows[first[head]]
+    no_call = np.zeros(n_sites, dtype=bool)
+    no_call[site[head & tie]] = True
+    return chosen, no_call
+
+
+# ---------------------------------------------------------
+# Main entry
+# ---------------------------------------------------------
+def merge_genomes(genomes, policy="first", names=None):
+    """
+    genomes: parsed genomes (or plain genome dicts) of one person, in
+    priority order for the "first" policy.
+
+    Returns (merged Genome, report):
+    {
+      "policy": "first",
+      "sources": [{"name": ..., "snps": 701234}, ...],
+      "merged_snps": 912345,
+      "overlap_sites": 487210,
+      "conflicts": 312,
+      "no_calls_from_conflicts": 0,
+      "position_matched": 120,
+      "concordance": [{"files": [0, 1], "overlap": ..., "concordance": 0.9991}, ...]
+    }
+    """
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy '{policy}' (use one of {', '.join(MERGE_POLICIES)})")
+    if len(genomes) < 2:
+        raise ValueError("Need at least two genomes to merge")
+
+    builds = {(g.build or {}).get("positions") for g in genomes if getattr(g, "build", None)}
+    if len(builds) > 1:
+        raise ValueError(f"Genomes are on different builds ({sorted(builds)}); lift them first")
+
+    encoded = [encode_genome(g) for g in genomes]
+    names = names or [f"file{i + 1}" for i in range(len(genomes))]
+
+    key = np.concatenate([e["key"] for e in encoded])
+    source = np.concatenate([np.full(len(e["key"]), i, dtype=np.uint8) for i, e in enumerate(encoded)])
+    a1 = np.concatenate([e["a1"] for e in encoded])
+    a2 = np.concatenate([e["a2"] for e in encoded])
+    called = (a1 != 0) & (a2 != 0)
+
+    order = np.lexsort((source, ~called, key))
+    key, a1, a2, called = key[order], a1[order], a2[order], called[order]
+    packed = _unordered(a1, a2)
+
+    group_head = np.ones(len(key), dtype=bool)
+    group_head[1:] = key[1:] != key[:-1]
+    group_start = np.flatnonzero(group_head)
+    group_of = np.cumsum(group_head) - 1
+    group_size = np.diff(np.append(group_start, len(key)))
+
+    # disagreements between called genotypes at shared sites
+    big = np.iinfo(np.int16).max
+    lo = np.minimum.reduceat(np.where(called, packed, big), group_start)
+    hi = np.maximum.reduceat(np.where(called, packed, 0), group_start)
+    conflict = (hi > 0) & (lo != hi)
+
+    chosen, no_call = _choose(group_start, group_of, called, packed, policy)
+
+    def take(field):
+        stacked = np.concatenate([e[field] for e in encoded])[order]
+        return stacked[chosen]
+
+    merged = {
+        "key": key[chosen],
+        "chrom": take("chrom"),
+        "pos": take("pos"),
+        "a1": np.where(no_call, 0, a1[chosen]).astype(np.uint8),
+        "a2": np.where(no_call, 0, a2[chosen]).astype(np.uint8),
+    }
+    if all("cm" in e for e in encoded):
+        merged["cm"] = take("cm")
+
+    # Positional-only calls: keep those not already placed by a keyed call
+    extra = {}
+    position_matched = 0
+    placed = np.sort(locus_keys(merged["chrom"], merged["pos"]))
+    for genome, e in zip(genomes, encoded):
+        for ident, info in _positional_calls(genome, e).items():
+            locus = locus_keys([chrom_code(info.get("chrom"))], [info.get("pos") or 0])[0]
+            i = np.searchsorted(placed, locus)
+            if locus and i < len(placed) and placed[i] == locus:
+                position_matched += 1
+            elif ident not in extra:
+                extra[ident] = info
+
+    build = next((g.build for g in genomes if getattr(g, "build", None)), None)
+    genome = Genome.from_arrays(merged, extra=extra, build=build)
+
+    concordance = []
+    for i in range(len(encoded)):
+        for j in range(i + 1, len(encoded)):
+            stats = _pair_concordance(encoded[i], encoded[j])
+            concordance.append({"files": [names[i], names[j]], **stats})
+
+    report = {
+        "policy": policy,
+        "sources": [{"name": n, "snps": len(g)} for n, g in zip(names, genomes)],
+        # counted from the arrays: the merged dict is only built on first use
+        "merged_snps": len(merged["key"]) + len(extra),
+        "overlap_sites": int((group_size > 1).sum()),
+        "conflicts": int(conflict.sum()),
+        "no_calls_from_conflicts": int(no_call.sum()),
+        "position_matched": position_matched,
+        "concordance": concordance,
+    }
+    return genome, report
+
@@ -0,0 +1,187 @@
+"""
+Quality control of raw DNA files, computed while they are parsed.
+
+The parser checks the first QC_EARLY_ROWS rows and rejects files that
+are clearly not genotype data (most rows unparseable, hardly any calls,
+impossible heterozygosity) before reading the rest. The full summary is
+computed once at the end from the same call lists, before liftover and
+array building, and kept on the genome as `Genome.qc`.
+
+Counts come from one Counter over (chrom, genotype) pairs, so each
+distinct genotype string is classified once rather than per call.
+"""
+
+from collections import Counter
+
+from utils.genome_arrays import CHROM_NAMES, chrom_code, genotype_codes
+
+# Rows read before the early check
+QC_EARLY_ROWS = 5000
+
+# Hard limits: a file outside these is rejected
+QC_LIMITS = {
+    "min_parsed_fraction": 0.5,  # rows that parse as calls (text formats)
+    "min_call_rate": 0.5,
+    "max_heterozygosity": 0.8,
+    "max_duplicate_fraction": 0.2,  # repeated identifiers (e.g. concatenated files)
+    "min_snps": 1,
+}
+# Rate limits only apply from this many rows / calls on
+QC_MIN_ROWS_FOR_RATES = 1000
+
+# Soft limits: reported as warnings
+QC_WARNINGS = {
+    "min_call_rate": 0.95,
+    "heterozygosity": (0.05, 0.5),
+    "max_duplicate_fraction": 0.01,
+    "min_snps_for_coverage": 100000,  # expect calls on all autosomes above this
+}
+
+# Sex inference from X heterozygosity (non-PAR X) and Y call rate
+MIN_X_CALLS = 100
+MALE_MAX_X_HET = 0.03
+FEMALE_MIN_X_HET = 0.1
+MIN_Y_CALLS = 20
+MALE_MIN_Y_CALL_RATE = 0.5
+
+X, Y = 23, 24
+
+
+class QCError(ValueError):
+    """A file failed QC; `report` holds the QC summary it failed on."""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def _infer_sex(x, y):
+    x_het = _rate(x["het"], x["called"])
+    y_rate = _rate(y["called"], y["snps"])
+
+    sex = "unknown"
+    if x["called"] >= MIN_X_CALLS:
+        if x_het <= MALE_MAX_X_HET:
+            sex = "male"
+        elif x_het >= FEMALE_MIN_X_HET:
+            sex = "female"
+    if sex == "unknown" and y["snps"] >= MIN_Y_CALLS:
+        sex = "male" if y_rate >= MALE_MIN_Y_CALL_RATE else "female"
+
+    return {
+        "inferred": sex,
+        "x_snps": x["called"],
+        "x_heterozygosity": x_het,
+        "y_call_rate": y_rate,
+    }
+
+
+def qc_summary(chroms, genotypes, rows=None):
+    """
+    QC metrics over parallel call lists.
+
+    rows: data rows read (text formats), for the parsed fraction
+    """
+    counts = {}
+    for (chrom, genotype), n in Counter(zip(chroms, genotypes)).items():
+        code = chrom_code(chrom)
+        c = counts.setdefault(code, {"snps": 0, "called": 0, "het": 0})
+        a1, a2 = genotype_codes(genotype)
+        c["snps"] += n
+        if a1:
+            c["called"] += n
+            if a1 != a2:
+                c["het"] += n
+
+    empty = {"snps": 0, "called": 0, "het": 0}
+    autosomes = [counts[c] for c in counts if 1 <= c <= 22]
+    snps = len(genotypes)
+    called = sum(c["called"] for c in counts.values())
+    auto_called = sum(c["called"] for c in autosomes)
+    auto_het = sum(c["het"] for c in autosomes)
+
+    return {
+        "rows": rows,
+        "snps": snps,
+        "parsed_fraction": _rate(snps, rows),
+        "call_rate": _rate(called, snps),
+        "no_call_fraction": _rate(snps - called, snps),
+        "heterozygosity": _rate(auto_het, auto_called),
+        "duplicates": None,
+        "chromosomes": {
+            CHROM_NAMES.get(code, "unplaced"): {
+                "snps": c["snps"],
+                "call_rate": _rate(c["called"], c["snps"]),
+                "heterozygosity": _rate(c["het"], c["called"]),
+            }
+            for code, c in sorted(counts.items())
+        },
+        "sex": _infer_sex(counts.get(X, empty), counts.get(Y, empty)),
+    }
+
+
+def genome_sex(genome):
+    """Sex inferred by QC at parse time ("male" / "female"), None when unknown."""
+    sex = ((getattr(genome, "qc", None) or {}).get("sex") or {}).get("inferred")
+    return sex if sex in ("male", "female") else None
+
+
+def check_qc(report, early=False):
+    """
+    Raises QCError when `report` breaks a hard limit. After the full
+    file (early=False) also fills report["warnings"] and ["passed"].
+    """
+    problems = []
+    snps = report["snps"]
+    parsed = report["parsed_fraction"]
+    het = report["heterozygosity"]
+    duplicates = report["duplicates"]
+    if (report["rows"] or 0) >= QC_MIN_ROWS_FOR_RATES and parsed < QC_LIMITS["min_parsed_fraction"]:
+        problems.append(f"only {parsed:.0%} of rows are genotype calls; wrong or unsupported format?")
+    if snps < QC_LIMITS["min_snps"]:
+        problems.append("no genotype calls found")
+    elif snps >= QC_MIN_ROWS_FOR_RATES:
+        if report["call_rate"] < QC_LIMITS["min_call_rate"]:
+            problems.append(f"call rate {report['call_rate']:.0%} is too low")
+        if het is not None and het > QC_LIMITS["max_heterozygosity"]:
+            problems.append(f"heterozygosity {het:.0%} is not plausible for one person")
+        if duplicates and duplicates / snps > QC_LIMITS["max_duplicate_fraction"]:
+            problems.append(f"{duplicates} calls repeat an identifier; several files combined?")
+
+    if problems:
+        report["passed"] = False
+        where = f" in the first {report['rows'] or report['snps']} rows" if early else ""
+        raise QCError(f"File failed quality control{where}: {'; '.join(problems)}", report)
+
+    if early:
+        return report
+
+    warnings = []
+    if report["call_rate"] < QC_WARNINGS["min_call_rate"]:
+        warnings.append(f"low call rate ({report['call_rate']:.1%})")
+    low, high = QC_WARNINGS["heterozygosity"]
+    if het is not None and not low <= het <= high:
+        warnings.append(f"unusual heterozygosity ({het:.1%})")
+    if duplicates and duplicates / snps > QC_WARNINGS["max_duplicate_fraction"]:
+        warnings.append(f"{duplicates} duplicate identifiers")
+    if report["snps"] >= QC_WARNINGS["min_snps_for_coverage"]:
+        missing = [str(c) for c in range(1, 23) if str(c) not in report["chromosomes"]]
+        if missing:
+            warnings.append(f"no calls on chromosome(s) {', '.join(missing)}; truncated file?")
+
+    report["warnings"] = warnings
+    report["passed"] = True
+    return report
+
+
+def note_duplicates(report, duplicates):
+    """
+    Records calls repeated under the same identifier (later ones win);
+    call before check_qc, which limits them.
+    """
+    report["duplicates"] = duplicates
+    return report
@@ -0,0 +1,490 @@
+"""
+Persistent genome store for lookups after the upload is gone.
+
+Genotypes are stored 2 bits per SNP against a site panel:
+
+    panels/<id>/   shared by every genome with the same site list (the
+                   same chip); id = hash of the sorted rsID keys
+        key      int64[N]  sorted rsID keys (see genome_arrays.rsid_key)
+        chrom    uint8[N]
+        pos      int64[N]
+        alleles  uint8[N]  (allele 1 << 3) | allele 2, 0 = not seen yet
+        locus    int64[M]  sorted (chrom, pos) keys of the placed sites
+        by_locus int64[M]  site row of each locus
+    genomes/<genome id>.npy   uint8[ceil(N / 4)], four 2-bit codes per
+                              byte: 0 = 1/1, 1 = 1/2, 2 = 2/2, 3 = no call
+    genomes/<genome id>.json  panel id and upload metadata: "source"
+                              ("panel" for compact panel uploads), the
+                              QC reports (inferred sex included) and
+                              the positional "chrom:pos" calls, which
+                              have no key in the panel
+
+so a 600k-SNP genome costs ~150 KB on top of its chip's panel. A site
+called with an allele its panel has not seen yet fills the panel's
+empty allele slot. Slots are write-once, and filled under a lock file
+next to the panel (flock, so worker processes queue too) on a fresh
+read of the allele column, which is then atomically replaced: codes
+stored against a panel never change meaning. Calls a panel cannot hold
+(a third allele at a site) go into the genome's metadata as
+"overrides" and win over the packed code when decoding.
+
+Everything is memory-mapped; lookups are binary searches on the key /
+locus arrays plus a gather of the packed codes.
+
+The store lives under DATA_DIR, outside the source tree (env
+DNA_DATA_DIR, else the user's data directory). A genome expires
+STORE_TTL after its last use, kept as its packed file's mtime: loading
+an expired genome deletes it, and store_genome sweeps the rest.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): panel updates are only serialized within the process
+    fcntl = None
+
+import numpy as np
+
+from utils.genome_arrays import (
+    CHROM_NAMES,
+    chrom_code,
+    decode_genotype,
+    encode_genome,
+    join_sorted,
+    key_to_rsid,
+    locus_keys,
+    rsid_key,
+)
+from utils.gene_index import gene_regions
+from utils.genotype_panel import GENE_BLOCKS
+from utils.population_freqs import load_freq_table
+
+DATA_DIR = os.environ.get("DNA_DATA_DIR") or os.path.join(
+    os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share"),
+    "dna-app",
+)
+STORE_DIR = os.path.join(DATA_DIR, "genome_store")
+PANEL_DIR = os.path.join(STORE_DIR, "panels")
+GENOME_DIR = os.path.join(STORE_DIR, "genomes")
+
+PANEL_COLUMNS = ("key", "chrom", "pos", "alleles", "locus", "by_locus")
+NO_CALL = 3
+
+# per-request limits of the query endpoint
+MAX_QUERY_RSIDS = 5000
+MAX_REGION_SNPS = 10000
+
+GENOME_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# a stored genome expires this long after its last use
+STORE_TTL = 2 * 60 * 60
+# store_genome sweeps expired genomes at most this often
+PURGE_INTERVAL = 10 * 60
+_LAST_PURGE = 0.0
+
+# panel id -> { column: array, "mtime": alleles file mtime }
+_PANELS = {}
+# genome id -> (packed codes, metadata); bounded, oldest dropped first
+_GENOMES = {}
+MAX_OPEN_GENOMES = 256
+
+# panel allele updates are read-modify-write (see _panel_lock)
+_STORE_LOCK = threading.Lock()
+
+
+# ---------------------------------------------------------
+# Files
+# ---------------------------------------------------------
+def _save_array(folder, name, values):
+    os.makedirs(folder, exist_ok=True)
+    tmp = os.path.join(folder, f"{name}.tmp.npy")
+    np.save(tmp, values)
+    os.replace(tmp, os.path.join(folder, f"{name}.npy"))
+
+
+def _panel_id(keys):
+    return hashlib.sha1(np.ascontiguousarray(keys, dtype=np.int64).tobytes()).hexdigest()[:24]
+
+
+def _create_panel(panel_id, arrays):
+    folder = os.path.join(PANEL_DIR, panel_id)
+    loci = locus_keys(arrays["chrom"], arrays["pos"])
+    placed = np.flatnonzero(loci)
+    by_locus = placed[np.argsort(loci[placed], kind="stable")]
+    columns = {
+        "key": arrays["key"].astype(np.int64),
+        "chrom": arrays["chrom"].astype(np.uint8),
+        "pos": arrays["pos"].astype(np.int64),
+        "alleles": np.zeros(len(arrays["key"]), dtype=np.uint8),
+        "locus": loci[by_locus],
+        "by_locus": by_locus.astype(np.int64),
+    }
+    # alleles last: its presence marks a complete panel
+    for name in PANEL_COLUMNS:
+        if name != "alleles":
+            _save_array(folder, name, columns[name])
+    _save_array(folder, "alleles", columns["alleles"])
+
+
+@contextlib.contextmanager
+def _panel_lock(panel_id):
+    """Serializes creation and allele updates of a panel across threads and worker processes."""
+    os.makedirs(PANEL_DIR, exist_ok=True)
+    with _STORE_LOCK, open(os.path.join(PANEL_DIR, f"{panel_id}.lock"), "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)  # released when the handle closes
+        yield
+
+
+def load_panel(panel_id):
+    """Memory-mapped panel columns (see module docstring); the allele column is re-read when it changes."""
+    folder = os.path.join(PANEL_DIR, panel_id)
+    alleles_path = os.path.join(folder, "alleles.npy")
+    mtime = os.stat(alleles_path).st_mtime_ns
+
+    panel = _PANELS.get(panel_id)
+    if panel is None:
+        panel = {name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r") for name in PANEL_COLUMNS}
+        panel["mtime"] = mtime
+        _PANELS[panel_id] = panel
+    elif panel["mtime"] != mtime:
+        panel["alleles"] = np.load(alleles_path, mmap_mode="r")
+        panel["mtime"] = mtime
+    return panel
+
+
+# ---------------------------------------------------------
+# 2-bit codes
+# ---------------------------------------------------------
+def _pack(codes):
+    padded = np.full(-(-len(codes) // 4) * 4, NO_CALL, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    return quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+
+
+def _unpack(packed, rows):
+    rows = np.asarray(rows, dtype=np.int64)
+    return (packed[rows >> 2] >> ((rows & 3) * 2).astype(np.uint8)) & 3
+
+
+def _encode_against_panel(alleles, a1, a2):
+    """
+    Codes of calls (a1, a2) against panel alleles, filling empty allele
+    slots. Returns (codes, updated alleles or None, mask of the calls the
+    panel cannot hold, stored as NO_CALL).
+    """
+    p1 = alleles >> 3
+    p2 = alleles & 7
+    called = (a1 != 0) & (a2 != 0)
+
+    new_p1 = np.where((p1 == 0) & called, a1, p1)
+    new_p2 = p2.copy()
+    for a in (a1, a2):
+        fill = called & (new_p2 == 0) & (a != new_p1)
+        new_p2[fill] = a[fill]
+
+    fits = called & ((a1 == new_p1) | (a1 == new_p2)) & ((a2 == new_p1) | (a2 == new_p2))
+    codes = np.full(len(a1), NO_CALL, dtype=np.uint8)
+    codes[fits] = (a1[fits] == new_p2[fits]).astype(np.uint8) + (a2[fits] == new_p2[fits])
+
+    updated = ((new_p1 << 3) | new_p2).astype(np.uint8)
+    changed = not np.array_equal(updated, alleles)
+    return codes, (updated if changed else None), called & ~fits
+
+
+def _decode(panel, packed, meta, rows):
+    """Allele codes (a1, a2) of panel rows (0 = no call), overrides applied."""
+    rows = np.asarray(rows, dtype=np.int64)
+    codes = _unpack(packed, rows)
+    alleles = np.asarray(panel["alleles"][rows])
+    first = alleles >> 3
+    second = alleles & 7
+    called = codes != NO_CALL
+    a1 = np.where(called, np.where(codes == 2, second, first), 0).astype(np.uint8)
+    a2 = np.where(called, np.where(codes == 0, first, second), 0).astype(np.uint8)
+
+    overrides = meta.get("overrides") or {"rows": [], "codes": []}
+    if overrides["rows"]:
+        override_rows = np.array(overrides["rows"], dtype=np.int64)
+        override_codes = np.array(overrides["codes"], dtype=np.uint8)
+        hit = np.isin(rows, override_rows)
+        at = np.searchsorted(override_rows, rows[hit])
+        a1[hit] = override_codes[at] >> 3
+        a2[hit] = override_codes[at] & 7
+    return a1, a2
+
+
+def _genotypes(panel, packed, meta, rows):
+    """Genotype strings (None = no call) of panel rows."""
+    a1, a2 = _decode(panel, packed, meta, rows)
+    return [decode_genotype(x, y) for x, y in zip(a1.tolist(), a2.tolist())]
+
+
+# ---------------------------------------------------------
+# Store / load
+# ---------------------------------------------------------
+def store_genome(genome, name=None, qc_reports=None):
+    """
+    Writes a parsed genome to the store. Returns its genome id.
+    qc_reports: the QC reports of the files it was parsed from.
+    """
+    arrays = encode_genome(genome)
+    panel_id = _panel_id(arrays["key"])
+    genome_id = uuid.uuid4().hex
+
+    folder = os.path.join(PANEL_DIR, panel_id)
+    with _panel_lock(panel_id):
+        if not os.path.exists(os.path.join(folder, "alleles.npy")):
+            _create_panel(panel_id, arrays)
+        # read from disk, not the cache: another worker may have filled slots
+        codes, updated, unfit = _encode_against_panel(
+            np.load(os.path.join(folder, "alleles.npy")), arrays["a1"], arrays["a2"]
+        )
+        if updated is not None:
+            _save_array(folder, "alleles", updated)
+            _PANELS.pop(panel_id, None)
+
+    override_rows = np.flatnonzero(unfit)
+    packed = _pack(codes)
+    build = getattr(genome, "build", None)
+    meta = {
+        "genome_id": genome_id,
+        "panel": panel_id,
+        "name": name,
+        "snps": int(len(codes)),
+        "called": int((codes != NO_CALL).sum() + len(override_rows)),
+        "overrides": {
+            "rows": override_rows.tolist(),
+            "codes": ((arrays["a1"][override_rows].astype(np.uint8) << 3) | arrays["a2"][override_rows]).tolist(),
+        },
+        "build": build.get("positions") if build else None,
+        "source": build.get("source") if build else None,
+        "qc": getattr(genome, "qc", None),
+        "qc_reports": qc_reports,
+        "positional": genome.positional_calls() if hasattr(genome, "positional_calls") else {},
+        "created": int(time.time()),
+    }
+    os.makedirs(GENOME_DIR, exist_ok=True)
+    # metadata first: the packed file marks a complete genome
+    with open(os.path.join(GENOME_DIR, f"{genome_id}.json"), "w") as f:
+        json.dump(meta, f)
+    _save_array(GENOME_DIR, genome_id, packed)
+
+    if time.time() - _LAST_PURGE > PURGE_INTERVAL:
+        purge_expired_genomes()
+    return genome_id
+
+
+def touch_stored_genome(genome_id):
+    """
+    Counts a use of a stored genome (restarts its STORE_TTL). False when
+    it is unknown or already expired (and then deleted).
+    """
+    if not GENOME_ID_PATTERN.match(genome_id or ""):
+        return False
+    path = os.path.join(GENOME_DIR, f"{genome_id}.npy")
+    try:
+        expired = time.time() - os.stat(path).st_mtime > STORE_TTL
+    except OSError:
+        _GENOMES.pop(genome_id, None)
+        return False
+    if expired:
+        delete_stored_genome(genome_id)
+        return False
+    os.utime(path)
+    return True
+
+
+def load_stored_genome(genome_id):
+    """(packed codes, panel, metadata) of a stored genome. KeyError when unknown or expired."""
+    if not touch_stored_genome(genome_id):
+        raise KeyError(genome_id)
+    cached = _GENOMES.get(genome_id)
+    if cached is None:
+        path = os.path.join(GENOME_DIR, f"{genome_id}.npy")
+        with open(os.path.join(GENOME_DIR, f"{genome_id}.json"), "r") as f:
+            meta = json.load(f)
+        cached = (np.load(path, mmap_mode="r"), meta)
+        if len(_GENOMES) >= MAX_OPEN_GENOMES:
+            _GENOMES.pop(next(iter(_GENOMES)))
+        _GENOMES[genome_id] = cached
+    packed, meta = cached
+    return packed, load_panel(meta["panel"]), meta
+
+
+def stored_arrays(genome_id):
+    """
+    A stored genome back in the genome_arrays layout (key, chrom, pos,
+    a1, a2), e.g. for Genome.from_arrays. KeyError when unknown.
+    """
+    packed, panel, meta = load_stored_genome(genome_id)
+    a1, a2 = _decode(panel, packed, meta, np.arange(meta["snps"]))
+    return {
+        "key": np.array(panel["key"]),
+        "chrom": np.array(panel["chrom"]),
+        "pos": np.array(panel["pos"]),
+        "a1": a1,
+        "a2": a2,
+    }
+
+
+def delete_stored_genome(genome_id):
+    """Removes a stored genome. False when there was none."""
+    _GENOMES.pop(genome_id, None)
+    if not GENOME_ID_PATTERN.match(genome_id or ""):
+        return False
+    found = False
+    for ext in ("npy", "json"):
+        try:
+            os.remove(os.path.join(GENOME_DIR, f"{genome_id}.{ext}"))
+            found = True
+        except FileNotFoundError:
+            pass
+    return found
+
+
+def purge_expired_genomes():
+    """Deletes every genome unused for STORE_TTL. Returns how many."""
+    global _LAST_PURGE
+    now = _LAST_PURGE = time.time()
+    purged = 0
+    try:
+        names = os.listdir(GENOME_DIR)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        genome_id, ext = os.path.splitext(name)
+        if ext != ".npy" or not GENOME_ID_PATTERN.match(genome_id):
+            continue
+        try:
+            expired = now - os.stat(os.path.join(GENOME_DIR, name)).st_mtime > STORE_TTL
+        except OSError:
+            continue
+        if expired and delete_stored_genome(genome_id):
+            purged += 1
+    return purged
+
+
+# ---------------------------------------------------------
+# Queries
+# ---------------------------------------------------------
+def _calls(panel, packed, meta, rows, names=None):
+    rows = np.asarray(rows, dtype=np.int64)
+    genotypes = _genotypes(panel, packed, meta, rows)
+    keys = np.asarray(panel["key"][rows]).tolist()
+    chroms = np.asarray(panel["chrom"][rows]).tolist()
+    positions = np.asarray(panel["pos"][rows]).tolist()
+    return [
+        {
+            "rsid": names[i] if names else key_to_rsid(keys[i]),
+            "chrom": CHROM_NAMES.get(chroms[i]),
+            "pos": positions[i] or None,
+            "genotype": genotypes[i],
+        }
+        for i in range(len(rows))
+    ]
+
+
+def query_rsids(genome_id, rsids):
+    """Calls at the given rsIDs (unknown ones are left out)."""
+    packed, panel, meta = load_stored_genome(genome_id)
+    rsids = list(rsids)[:MAX_QUERY_RSIDS]
+    keys = np.array([rsid_key(r) for r in rsids], dtype=np.int64)
+    at, hits = join_sorted(panel["key"], keys)
+    return _calls(panel, packed, meta, at, [rsids[i] for i in hits.tolist()])
+
+
+def query_region(genome_id, chrom, start, end):
+    """Calls with start <= pos <= end on a chromosome, in position order."""
+    packed, panel, meta = load_stored_genome(genome_id)
+    code = chrom_code(chrom)
+    lo = np.searchsorted(panel["locus"], (code << 32) | max(int(start), 0), side="left")
+    hi = np.searchsorted(panel["locus"], (code << 32) | int(end), side="right")
+    truncated = hi - lo > MAX_REGION_SNPS
+    rows = panel["by_locus"][lo:min(hi, lo + MAX_REGION_SNPS)]
+    return {"calls": _calls(panel, packed, meta, rows) if code else [], "truncated": bool(truncated)}
+
+
+GENE_RSIDS = {}
+
+
+def load_gene_rsids():
+    """Gene name -> rsIDs of the app's curated panels and model loci."""
+    global GENE_RSIDS
+    if GENE_RSIDS:
+        return GENE_RSIDS
+
+    genes = {}
+    for block in GENE_BLOCKS:
+        for snp in block["snps"]:
+            genes.setdefault(snp["gene"].upper(), []).append(snp["rsid"])
+    table = load_freq_table()
+    for rsid, gene in zip(table["rsids"], table["genes"]):
+        genes.setdefault(gene.upper(), []).append(rsid)
+    GENE_RSIDS = {gene: sorted(set(rsids)) for gene, rsids in genes.items()}
+    return GENE_RSIDS
+
+
+def query_gene(genome_id, gene):
+    """Calls inside the gene (see gene_index), then its curated loci outside it."""
+    calls = []
+    for chrom, start, end in gene_regions(gene):
+        calls.extend(query_region(genome_id, chrom, start, end)["calls"])
+    seen = {call["rsid"] for call in calls}
+    extra = [rsid for rsid in load_gene_rsids().get((gene or "").upper(), []) if rsid not in seen]
+    return calls + query_rsids(genome_id, extra) if extra else calls
+
+
+def parse_region(region):
+    """{"chrom", "start", "end"} or "15:28000000-28500000" -> (chrom, start, end)."""
+    try:
+        if isinstance(region, str):
+            chrom, span = region.replace(",", "").split(":")
+            start, end = span.split("-")
+        else:
+            chrom, start, end = region["chrom"], region["start"], region["end"]
+        return str(chrom), int(start), int(end)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Bad region {region!r}: expected chrom:start-end")
+
+
+def query_snps(genome_id, rsids=None, regions=None, genes=None):
+    """
+    Batched lookup for the /snp endpoint:
+    {
+      "genome_id": "...",
+      "panel_only": false,
+      "rsids": [{"rsid", "chrom", "pos", "genotype"}, ...],
+      "not_found": ["rs..."],
+      "regions": [{"chrom": "15", "start": ..., "end": ..., "calls": [...], "truncated": false}],
+      "genes": {"HERC2": [...]}
+    }
+    Genomes from panel uploads hold only the manifest's loci (panel_only),
+    so their missing rsIDs are listed as "not_in_panel" instead.
+    KeyError for unknown genomes; ValueError for malformed regions.
+    """
+    _, _, meta = load_stored_genome(genome_id)
+    panel_only = meta.get("source") == "panel"
+    out = {"genome_id": genome_id, "panel_only": panel_only}
+    if rsids:
+        rsids = list(rsids)[:MAX_QUERY_RSIDS]
+        out["rsids"] = query_rsids(genome_id, rsids)
+        found = {call["rsid"] for call in out["rsids"]}
+        out["not_in_panel" if panel_only else "not_found"] = [r for r in rsids if r not in found]
+    if regions:
+        out["regions"] = []
+        for region in regions:
+            chrom, start, end = parse_region(region)
+            out["regions"].append({"chrom": chrom, "start": start, "end": end, **query_region(genome_id, chrom, start, end)})
+    if genes:
+        out["genes"] = {gene: query_gene(genome_id, gene) for gene in genes}
+    return out
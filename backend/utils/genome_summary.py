@@ -0,0 +1,200 @@
+"""
+Chromosome-level genome summaries for the frontend: per-chromosome
+heterozygosity, runs of homozygosity (ROH) and binned "chromosome
+painting" tracks.
+
+Everything runs on the position-sorted genotype arrays
+(genome_arrays.position_order) with cumulative sums, so a full array
+genome takes a few tens of milliseconds.
+
+ROH detection follows the PLINK --homozyg sliding-window scan: windows
+of ROH_WINDOW SNPs with at most ROH_WINDOW_HET hets and
+ROH_WINDOW_MISSING no-calls count as homozygous; a SNP is in a run when
+at least ROH_WINDOW_THRESHOLD of the windows covering it are. Runs are
+then kept by SNP count, length and density. Windows never cross a
+chromosome boundary or a gap wider than ROH_MAX_GAP_BP.
+"""
+
+import numpy as np
+
+from utils.genome_arrays import CHROM_NAMES, encode_genome, position_order
+
+ROH_WINDOW = 50
+ROH_WINDOW_HET = 1
+ROH_WINDOW_MISSING = 5
+ROH_WINDOW_THRESHOLD = 0.05
+ROH_MIN_SNPS = 100
+ROH_MIN_BP = 1000000
+ROH_MAX_GAP_BP = 1000000
+ROH_MAX_BP_PER_SNP = 50000
+
+# Painting resolution
+BIN_BP = 5000000
+# chromosomes 1-22 and X get painted; ROH is called on autosomes only
+PAINTED = 23
+MAX_POS = 250000000
+CHROM_ROWS = 27
+
+
+def _round(values, digits=3):
+    return np.round(values, digits).tolist()
+
+
+def _rates(part, whole):
+    return np.divide(part, whole, out=np.zeros(len(part)), where=whole > 0)
+
+
+# ---------------------------------------------------------
+# ROH scan
+# ---------------------------------------------------------
+def _roh_mask(stretch, het, missing):
+    """SNPs covered by homozygous windows (see module docstring)."""
+    n = len(het)
+    w = ROH_WINDOW
+    if n < w:
+        return np.zeros(n, dtype=bool)
+
+    het_cs = np.concatenate(([0], np.cumsum(het, dtype=np.int32)))
+    miss_cs = np.concatenate(([0], np.cumsum(missing, dtype=np.int32)))
+    valid = stretch[:n - w + 1] == stretch[w - 1:]
+    hom = valid & (het_cs[w:] - het_cs[:-w] <= ROH_WINDOW_HET)
+    hom &= miss_cs[w:] - miss_cs[:-w] <= ROH_WINDOW_MISSING
+
+    # windows covering SNP j start at j-w+1 .. j: with w-1 empty windows
+    # padded on both sides that is padded[j : j+w]
+    pad = np.zeros(w - 1, dtype=bool)
+    valid_cs = np.concatenate(([0], np.cumsum(np.concatenate((pad, valid, pad)), dtype=np.int32)))
+    hom_cs = np.concatenate(([0], np.cumsum(np.concatenate((pad, hom, pad)), dtype=np.int32)))
+    covering = valid_cs[w:] - valid_cs[:-w]
+    homs = hom_cs[w:] - hom_cs[:-w]
+    return (covering > 0) & (homs >= ROH_WINDOW_THRESHOLD * covering)
+
+
+def find_roh(chrom, pos, a1, a2):
+    """
+    ROH segments over position-sorted autosomal calls.
+    Returns (first index, last index) arrays of the segments and the
+    in-ROH mask.
+    """
+    n = len(pos)
+    called = (a1 != 0) & (a2 != 0)
+    het = called & (a1 != a2)
+
+    stretch = np.ones(n, dtype=bool)
+    stretch[1:] = (chrom[1:] != chrom[:-1]) | (np.diff(pos) > ROH_MAX_GAP_BP)
+    stretch = np.cumsum(stretch)
+
+    in_roh = _roh_mask(stretch, het, ~called)
+    same = stretch[1:] == stretch[:-1]
+    starts = np.flatnonzero(in_roh & ~np.concatenate(([False], in_roh[:-1] & same)))
+    ends = np.flatnonzero(in_roh & ~np.concatenate((in_roh[1:] & same, [False])))
+
+    length = pos[ends] - pos[starts]
+    snps = ends - starts + 1
+    keep = (snps >= ROH_MIN_SNPS) & (length >= ROH_MIN_BP)
+    keep &= length <= ROH_MAX_BP_PER_SNP * snps
+    starts, ends = starts[keep], ends[keep]
+
+    # segments never touch, so each index gets at most one +1 / -1
+    mark = np.zeros(n + 1, dtype=np.int8)
+    mark[starts] += 1
+    mark[ends + 1] -= 1
+    return starts, ends, np.cumsum(mark[:n]) > 0
+
+
+# ---------------------------------------------------------
+# Main entry
+# ---------------------------------------------------------
+def summarize_genome(genome, bin_bp=BIN_BP):
+    """
+    Returns
+    {
+      "heterozygosity": 0.31, "roh": {"segments": [...], "count", "total_mb", "froh"},
+      "bin_bp": 5000000,
+      "chromosomes": [
+        {"chrom": "1", "snps", "call_rate", "heterozygosity", "roh_mb",
+         "bins": {"snps": [...], "het": [...], "roh": [...]}}, ...
+      ]
+    }
+    Bin tracks are per-bin SNP counts, heterozygosity and the share of
+    SNPs inside ROH; "roh" segments are {"chrom", "start", "end", "snps"}.
+    """
+    arrays = encode_genome(genome)
+    order = position_order(arrays)
+    chrom = arrays["chrom"][order]
+    pos = arrays["pos"][order]
+    a1 = arrays["a1"][order]
+    a2 = arrays["a2"][order]
+    called = (a1 != 0) & (a2 != 0)
+    het = called & (a1 != a2)
+
+    # calls are in chromosome order, so the autosomes are a prefix
+    auto = slice(0, int(np.searchsorted(chrom, 23)))
+    starts, ends, auto_roh = find_roh(chrom[auto], pos[auto], a1[auto], a2[auto])
+    in_roh = np.zeros(len(pos), dtype=bool)
+    in_roh[auto] = auto_roh
+    seg_chrom = chrom[starts]
+    seg_start = pos[starts]
+    seg_end = pos[ends]
+    seg_len = seg_end - seg_start
+
+    # One count per (chromosome, bin, in ROH, call state); per-chromosome
+    # numbers are sums over its bins
+    n_bins = MAX_POS // bin_bp + 1
+    state = called.astype(np.int64) + het  # 0 no-call, 1 hom, 2 het
+    cell = chrom.astype(np.int64) * n_bins + np.minimum(pos // bin_bp, n_bins - 1)
+    counts = np.bincount((cell * 2 + in_roh) * 3 + state, minlength=CHROM_ROWS * n_bins * 6)
+    counts = counts.reshape(CHROM_ROWS, n_bins, 2, 3)
+    bin_snps = counts.sum(axis=(2, 3))
+    bin_called = counts[:, :, :, 1:].sum(axis=(2, 3))
+    bin_het = counts[:, :, :, 2].sum(axis=2)
+    bin_roh = counts[:, :, 1, :].sum(axis=2)
+    per_snps = bin_snps.sum(axis=1)
+    per_called = bin_called.sum(axis=1)
+    per_het = bin_het.sum(axis=1)
+    per_roh = np.bincount(seg_chrom, weights=seg_len, minlength=CHROM_ROWS)
+
+    # autosomal length covered by calls, for F_ROH
+    codes = np.arange(1, 23)
+    lo = np.searchsorted(chrom, codes)
+    hi = np.searchsorted(chrom, codes, side="right")
+    present = hi > lo
+    auto_span = int((pos[hi[present] - 1] - pos[lo[present]]).sum())
+
+    chromosomes = []
+    for code in np.flatnonzero(per_snps).tolist():
+        entry = {
+            "chrom": CHROM_NAMES.get(code),
+            "snps": int(per_snps[code]),
+            "call_rate": round(float(per_called[code] / per_snps[code]), 4),
+            "heterozygosity": round(float(per_het[code] / per_called[code]), 4) if per_called[code] else None,
+            "roh_mb": round(float(per_roh[code]) / 1e6, 2),
+        }
+        if code <= PAINTED:
+            last = np.flatnonzero(bin_snps[code])[-1] + 1
+            entry["bins"] = {
+                "snps": bin_snps[code, :last].tolist(),
+                "het": _round(_rates(bin_het[code, :last], bin_called[code, :last])),
+                "roh": _round(_rates(bin_roh[code, :last], bin_snps[code, :last])),
+            }
+        chromosomes.append(entry)
+
+    total_roh = int(seg_len.sum())
+    auto_called = called[auto].sum()
+    return {
+        "snps": int(len(pos)),
+        "heterozygosity": round(float(het[auto].sum() / auto_called), 4) if auto_called else None,
+        "bin_bp": bin_bp,
+        "roh": {
+            "count": int(len(starts)),
+            "total_mb": round(total_roh / 1e6, 2),
+            "froh": round(total_roh / auto_span, 4) if auto_span else None,
+            "segments": [
+                {"chrom": CHROM_NAMES.get(c), "start": s, "end": e, "snps": n}
+                for c, s, e, n in zip(
+                    seg_chrom.tolist(), seg_start.tolist(), seg_end.tolist(), (ends - starts + 1).tolist()
+                )
+            ],
+        },
+        "chromosomes": chromosomes,
+    }
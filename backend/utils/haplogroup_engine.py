@@ -0,0 +1,220 @@
+"""
+mtDNA and Y-chromosome haplogroups.
+
+Marker trees live in nih/haplogroups/ as CSV rows
+`haplogroup,parent,markers`, where markers are the derived alleles that
+define the branch ("10398A": position 10398 carries A; rCRS positions
+for mtDNA, GRCh37 for Y). New branches are data-only additions.
+
+Each tree is compiled once:
+- nodes in pre-order, so the set of nodes carrying a marker (the subtree
+  of the branch it defines) is one contiguous range - a bitset stored
+  as [start, end)
+- markers sorted by locus key, with their derived allele and node
+
+Assignment reads the calls at every marker locus in one sorted join,
+counts derived / ancestral markers per node with bincount, turns them
+into subtree counts with one cumulative sum over the pre-order, and
+walks down once from the root into the best-supported child. A child is
+entered while derived markers anywhere in its subtree outweigh ancestral
+calls at its own markers, so missing markers and isolated miscalls do
+not stop the descent.
+"""
+
+import csv
+import os
+import re
+
+import numpy as np
+
+from utils.genome_arrays import (
+    ALLELE_CODES,
+    chrom_code,
+    encode_genome,
+    genotype_codes,
+    join_sorted,
+    locus_keys,
+)
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HAPLOGROUP_DIR = os.path.join(BASE_DIR, "nih", "haplogroups")
+
+# tree name -> (file, chromosome)
+HAPLOGROUP_TREE_FILES = {
+    "mt": ("mt_tree.csv", "MT"),
+    "y": ("y_tree.csv", "Y"),
+}
+
+MARKER_PATTERN = re.compile(r"^(\d+)([ACGT])$")
+
+# Compiled once per tree:
+# {
+#   "chrom": int, "names": [...] (pre-order), "children": [int array per node],
+#   "end": int64[nodes] (subtree = [i, end[i])),
+#   "locus": int64[M] sorted, "allele": uint8[M], "node": int64[M], "markers": [...]
+# }
+HAPLOGROUP_TREES = {}
+
+
+# ---------------------------------------------------------
+# Tree index
+# ---------------------------------------------------------
+def _compile_tree(path, chrom):
+    with open(path, "r") as f:
+        rows = [r for r in csv.DictReader(f) if r.get("haplogroup")]
+
+    children = {r["haplogroup"]: [] for r in rows}
+    roots = []
+    for r in rows:
+        parent = (r.get("parent") or "").strip()
+        if parent:
+            children[parent].append(r["haplogroup"])
+        else:
+            roots.append(r["haplogroup"])
+    if len(roots) != 1:
+        raise ValueError(f"{path}: expected one root, found {len(roots)}")
+
+    names = []
+    stack = roots[:]
+    while stack:
+        name = stack.pop()
+        names.append(name)
+        stack.extend(reversed(children[name]))
+    index = {name: i for i, name in enumerate(names)}
+
+    # subtree sizes, children before parents in reversed pre-order
+    size = np.ones(len(names), dtype=np.int64)
+    for name in reversed(names):
+        for child in children[name]:
+            size[index[name]] += size[index[child]]
+
+    code = chrom_code(chrom)
+    loci, alleles, nodes, markers = [], [], [], []
+    for r in rows:
+        for token in (r.get("markers") or "").split(";"):
+            m = MARKER_PATTERN.match(token.strip().upper())
+            if not m:
+                continue
+            loci.append((code << 32) | int(m.group(1)))
+            alleles.append(ALLELE_CODES[m.group(2)])
+            nodes.append(index[r["haplogroup"]])
+            markers.append(token.strip())
+
+    loci = np.array(loci, dtype=np.int64)
+    order = np.argsort(loci, kind="stable")
+    return {
+        "chrom": code,
+        "names": names,
+        "children": [np.array([index[c] for c in children[n]], dtype=np.int64) for n in names],
+        "end": np.arange(len(names)) + size,
+        "locus": loci[order],
+        "allele": np.array(alleles, dtype=np.uint8)[order],
+        "node": np.array(nodes, dtype=np.int64)[order],
+        "markers": [markers[i] for i in order],
+    }
+
+
+def load_haplogroup_tree(tree):
+    if tree in HAPLOGROUP_TREES:
+        return HAPLOGROUP_TREES[tree]
+
+    filename, chrom = HAPLOGROUP_TREE_FILES[tree]
+    path = os.path.join(HAPLOGROUP_DIR, filename)
+    HAPLOGROUP_TREES[tree] = _compile_tree(path, chrom) if os.path.exists(path) else None
+    return HAPLOGROUP_TREES[tree]
+
+
+# ---------------------------------------------------------
+# Assignment
+# ---------------------------------------------------------
+def _marker_calls(genome, tree):
+    """Allele codes (a1, a2) of the genome at every marker locus (0 = missing)."""
+    n = len(tree["locus"])
+    a1 = np.zeros(n, dtype=np.uint8)
+    a2 = np.zeros(n, dtype=np.uint8)
+
+    positions = getattr(genome, "positions", None)
+    if positions is not None:
+        at, hits = join_sorted(positions["locus"], tree["locus"])
+        ids = positions["ids"]
+        for i, m in zip(at.tolist(), hits.tolist()):
+            info = genome.get(ids[i])
+            if info:
+                a1[m], a2[m] = genotype_codes(info.get("genotype"))
+        return a1, a2
+
+    arrays = encode_genome(genome)
+    on_chrom = np.flatnonzero(arrays["chrom"] == tree["chrom"])
+    loci = locus_keys(arrays["chrom"][on_chrom], arrays["pos"][on_chrom])
+    order = np.argsort(loci, kind="stable")
+    at, hits = join_sorted(loci[order], tree["locus"])
+    rows = on_chrom[order[at]]
+    a1[hits] = arrays["a1"][rows]
+    a2[hits] = arrays["a2"][rows]
+    return a1, a2
+
+
+def assign_haplogroup(genome, tree):
+    """
+    Deepest consistent haplogroup of `genome` on a compiled tree, or
+    None when no marker locus was called (e.g. Y for XX genomes):
+    {
+      "haplogroup": "H", "path": ["L", "N", "R", "HV", "H"],
+      "derived": 11, "conflicts": ["7028C"], "missing": 3,
+      "confidence": 0.92, "markers_called": 64
+    }
+    """
+    a1, a2 = _marker_calls(genome, tree)
+    # heterozygous / heteroplasmic calls are treated as missing
+    called = (a1 != 0) & (a1 == a2)
+    if not called.any():
+        return None
+    derived = called & (a1 == tree["allele"])
+    ancestral = called & ~derived
+
+    n_nodes = len(tree["names"])
+    own_derived = np.bincount(tree["node"][derived], minlength=n_nodes)
+    own_ancestral = np.bincount(tree["node"][ancestral], minlength=n_nodes)
+    cs = np.concatenate(([0], np.cumsum(own_derived)))
+    subtree_derived = cs[tree["end"]] - cs[:-1]
+    score = subtree_derived - own_ancestral
+
+    node = 0
+    path = [0]
+    while len(tree["children"][node]):
+        kids = tree["children"][node]
+        best = kids[np.lexsort((-subtree_derived[kids], -score[kids]))[0]]
+        if score[best] <= 0:
+            break
+        node = best
+        path.append(node)
+
+    on_path = np.isin(tree["node"], path)
+    # ancestral calls at loci re-mutated further down the path are expected
+    remutated = np.isin(tree["locus"], tree["locus"][on_path & derived])
+    conflicts = np.flatnonzero(on_path & ancestral & ~remutated)
+    n_derived = int((on_path & derived).sum())
+
+    return {
+        "haplogroup": tree["names"][node],
+        "path": [tree["names"][i] for i in path],
+        "derived": n_derived,
+        "conflicts": [tree["markers"][i] for i in conflicts],
+        "missing": int((on_path & ~called).sum()),
+        "confidence": round(n_derived / (n_derived + len(conflicts)), 4) if n_derived else 0.0,
+        "markers_called": int(called.sum()),
+    }
+
+
+def assign_haplogroups(genome):
+    """{ "mt": report or None, "y": report or None } (see assign_haplogroup)."""
+    out = {}
+    for name in HAPLOGROUP_TREE_FILES:
+        tree = load_haplogroup_tree(name)
+        out[name] = assign_haplogroup(genome, tree) if tree else None
+    return out
+
+
+def assign_haplogroups_batch(genomes):
+    """Haplogroups of a cohort; trees are compiled once and reused."""
+    return [assign_haplogroups(genome) for genome in genomes]
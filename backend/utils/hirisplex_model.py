@@ -1,5 +1,11 @@
 import math
 
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_LETTERS, call_dosage
+from utils.genome_arrays import ALLELE_LETTERS, genotype_codes
+from utils.population_freqs import load_freq_table, resolve_population
+
 # ---------------------------------------------------------
 #  HIrisPlex-S Logistic Regression Coefficients
 # ---------------------------------------------------------
@@ -84,14 +90,9 @@ SKIN_MODEL = {
 # Helper Functions
 # ---------------------------------------------------------
 
-def _allele_dosage(geno, effect):
-    """Return 0–2 copies of an effect allele."""
-    if not geno:
-        return 0
-    geno = geno.replace("/", "").replace("|", "").replace(" ", "").upper()
-    effect = effect.upper()
-    # Count how many of the characters match the effect allele
-    return sum(1 for base in geno if base == effect)
+def _allele_dosage(call, effect):
+    """Return 0–2 copies of an effect allele (genome entry or genotype string)."""
+    return call_dosage(call, effect)
 
 
 def _logit(intercept, snps, genome):
@@ -100,7 +101,7 @@ def _logit(intercept, snps, genome):
         g = genome.get(rsid)
         if not g:
             continue
-        dosage = _allele_dosage(g.get("genotype"), effect)
+        dosage = _allele_dosage(g, effect)
         x += beta * dosage
     return x
 
@@ -113,6 +114,146 @@ def _softmax(logits):
     return [e / total for e in exps]
 
 
+# ---------------------------------------------------------
+# Missing-genotype marginalization
+# ---------------------------------------------------------
+# Instead of scoring absent SNPs as zero dosage, average the model over
+# the genotypes they could have: every configuration of the missing
+# loci (3^m, at most 3^8 for hair) weighted by its Hardy-Weinberg
+# probability under population allele frequencies. The spread of the
+# class probabilities across those configurations is the uncertainty.
+# Configurations depend only on which loci are missing, so they are
+# enumerated once per missing set and cached; a call is then one
+# (configurations x classes) softmax.
+
+MARGINALIZE_MISSING = True
+
+# compiled models: name -> {"loci", "effects", "intercepts": float[K], "betas": float[L, K]}
+_COMPILED_MODELS = {}
+
+# (model, missing loci, population) -> (logit offsets float[C, K], weights float[C])
+_MARGINAL_CACHE = {}
+
+
+def _compile_model(name, classes):
+    """
+    One row per locus across the class models. A class using the other
+    allele of a locus scores beta * (2 - d) = 2 * beta - beta * d.
+    """
+    model = _COMPILED_MODELS.get(name)
+    if model is not None:
+        return model
+
+    loci, effects = [], []
+    for cls in classes:
+        for rsid, (effect, _) in cls["snps"].items():
+            if rsid not in loci:
+                loci.append(rsid)
+                effects.append(effect)
+
+    intercepts = np.array([cls["intercept"] for cls in classes], dtype=np.float64)
+    betas = np.zeros((len(loci), len(classes)))
+    for k, cls in enumerate(classes):
+        for rsid, (effect, beta) in cls["snps"].items():
+            j = loci.index(rsid)
+            if effect == effects[j]:
+                betas[j, k] = beta
+            else:
+                intercepts[k] += 2 * beta
+                betas[j, k] = -beta
+
+    model = _COMPILED_MODELS[name] = {
+        "loci": loci,
+        "effects": effects,
+        "intercepts": intercepts,
+        "betas": betas,
+    }
+    return model
+
+
+def _effect_frequency(rsid, effect, population):
+    """Effect allele frequency (pooled over populations when None), or None if unknown."""
+    table = load_freq_table()
+    i = table["index"].get(rsid)
+    if i is None:
+        return None
+    if population:
+        freq = float(table["freqs"][resolve_population(population)][i])
+    else:
+        freq = float(np.mean([f[i] for f in table["freqs"].values()]))
+
+    ref = ALLELE_LETTERS[table["ref"][i]]
+    alt = ALLELE_LETTERS[table["alt"][i]]
+    if effect not in (ref, alt):
+        effect = effect.translate(COMPLEMENT_LETTERS)
+    if effect == alt:
+        return freq
+    if effect == ref:
+        return 1 - freq
+    return None
+
+
+def _missing_configurations(name, model, missing, population):
+    key = (name, missing, population)
+    cached = _MARGINAL_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    # loci without a known frequency keep the old zero-dosage behaviour
+    freqs = [_effect_frequency(model["loci"][j], model["effects"][j], population) for j in missing]
+    usable = [j for j, p in zip(missing, freqs) if p is not None]
+    p = np.array([f for f in freqs if f is not None], dtype=np.float64)
+
+    # all 3^m dosage configurations, one per row
+    if usable:
+        dosages = np.indices((3,) * len(usable)).reshape(len(usable), -1).T
+    else:
+        dosages = np.zeros((1, 0), dtype=np.int64)
+    genotype_probs = np.stack(((1 - p) ** 2, 2 * p * (1 - p), p ** 2), axis=1)
+    weights = np.prod(genotype_probs[np.arange(len(usable)), dosages], axis=1)
+
+    offsets = dosages @ model["betas"][usable]
+    cached = _MARGINAL_CACHE[key] = (offsets, weights / weights.sum())
+    return cached
+
+
+def _marginal_probabilities(name, classes, genome, population=None):
+    """
+    Class probabilities of a model averaged over the genotypes of its
+    missing loci. A single-class model is a plain logistic regression.
+
+    Returns (mean float[K], standard deviation float[K], missing rsIDs).
+    """
+    model = _compile_model(name, classes)
+    if population is None:
+        population = getattr(genome, "population", None)
+
+    logit = model["intercepts"].copy()
+    missing = []
+    for j, (rsid, effect) in enumerate(zip(model["loci"], model["effects"])):
+        call = genome.get(rsid)
+        if call and genotype_codes(call.get("genotype"))[0]:
+            logit += model["betas"][j] * _allele_dosage(call, effect)
+        else:
+            missing.append(j)
+
+    offsets, weights = _missing_configurations(name, model, tuple(missing), population)
+    logits = logit + offsets
+    if logits.shape[1] == 1:
+        probs = 1 / (1 + np.exp(-logits))
+    else:
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+
+    mean = weights @ probs
+    sd = np.sqrt(np.maximum(weights @ (probs - mean) ** 2, 0.0))
+    return mean, sd, [model["loci"][j] for j in missing]
+
+
+def _rounded(values):
+    return {k: round(float(v), 4) for k, v in values.items()}
+
+
 # ---------------------------------------------------------
 #  Eye Color Prediction
 # ---------------------------------------------------------
@@ -132,7 +273,16 @@ def _quick_herc2_call(genome):
     return None
 
 
-def predict_eye(genome):
+def predict_eye(genome, marginalize=None, population=None):
+    """
+    marginalize: average over the genotypes of missing model SNPs
+    (default MARGINALIZE_MISSING) instead of scoring them as absent;
+    population: frequency column for that (default: the genome's own
+    population if it has one, else pooled).
+    """
+    if marginalize is None:
+        marginalize = MARGINALIZE_MISSING
+
     # Strong HERC2 rule: any A allele biases to brown regardless of model logits
     herc2 = genome.get("rs12913832")
     if herc2 and herc2.get("genotype"):
@@ -153,7 +303,7 @@ def predict_eye(genome):
         if rsid in genome
     }
 
-    if len(present) < 2:
+    if len(present) < (1 if marginalize else 2):
         # Not enough information → don’t pretend we know
         quick = _quick_herc2_call(genome)
         if quick:
@@ -170,14 +320,20 @@ def predict_eye(genome):
             "model": "HIrisPlex-S (Eye) — insufficient SNPs",
         }
 
-    logits = []
     colors = ["blue", "intermediate", "brown"]
+    sd = missing = None
+
+    if marginalize:
+        probs, sd, missing = _marginal_probabilities(
+            "eye", [EYE_MODEL[c] for c in colors], genome, population
+        )
+    else:
+        logits = []
+        for c in colors:
+            model = EYE_MODEL[c]
+            logits.append(_logit(model["intercept"], model["snps"], genome))
+        probs = _softmax(logits)
 
-    for c in colors:
-        model = EYE_MODEL[c]
-        logits.append(_logit(model["intercept"], model["snps"], genome))
-
-    probs = _softmax(logits)
     proto = {
         "Blue": probs[0],
         "Green/Hazel": probs[1],
@@ -202,27 +358,41 @@ def predict_eye(genome):
     if quick and (quick == "Brown" or final.get(quick, 0) + 0.15 > final[best]):
         best = quick
 
-    return {
+    out = {
         "result": best,
         "probabilities": final,
         "confidence": final[best],
         "model": "HIrisPlex-S (Eye) + rs12913832 safety net",
     }
+    if sd is not None:
+        out["probabilities"] = _rounded(final)
+        out["confidence"] = out["probabilities"][best]
+        out["uncertainty"] = _rounded({"Blue": sd[0], "Green": sd[1] * 0.7, "Hazel": sd[1] * 0.3, "Brown": sd[2]})
+        out["missing_snps"] = missing
+    return out
 
 
 # ---------------------------------------------------------
 #  Hair Color Prediction
 # ---------------------------------------------------------
 
-def predict_hair(genome):
-    logits = []
+def predict_hair(genome, marginalize=None, population=None):
+    """See predict_eye for `marginalize` / `population`."""
+    if marginalize is None:
+        marginalize = MARGINALIZE_MISSING
     colors = ["blond", "brown", "red", "black"]
-
-    for c in colors:
-        model = HAIR_MODEL[c]
-        logits.append(_logit(model["intercept"], model["snps"], genome))
-
-    probs = _softmax(logits)
+    sd = missing = None
+
+    if marginalize:
+        probs, sd, missing = _marginal_probabilities(
+            "hair", [HAIR_MODEL[c] for c in colors], genome, population
+        )
+    else:
+        logits = []
+        for c in colors:
+            model = HAIR_MODEL[c]
+            logits.append(_logit(model["intercept"], model["snps"], genome))
+        probs = _softmax(logits)
     final = {
         "Blond": probs[0],
         "Brown": probs[1],
@@ -231,22 +401,37 @@ def predict_hair(genome):
     }
 
     best = max(final, key=final.get)
-    return {
+    out = {
         "result": best,
         "probabilities": final,
         "confidence": final[best],
         "model": "HIrisPlex-S (Hair)",
     }
+    if sd is not None:
+        out["probabilities"] = _rounded(final)
+        out["confidence"] = out["probabilities"][best]
+        out["uncertainty"] = _rounded(dict(zip(final, sd)))
+        out["missing_snps"] = missing
+    return out
 
 
 # ---------------------------------------------------------
 #  Skin Pigmentation Prediction
 # ---------------------------------------------------------
 
-def predict_skin(genome):
+def predict_skin(genome, marginalize=None, population=None):
+    """See predict_eye for `marginalize` / `population`."""
+    if marginalize is None:
+        marginalize = MARGINALIZE_MISSING
     model = SKIN_MODEL
-    x = _logit(model["intercept"], model["snps"], genome)
-    melanin_index = 1 / (1 + math.exp(-x))
+    sd = missing = None
+
+    if marginalize:
+        mean, sd, missing = _marginal_probabilities("skin", [model], genome, population)
+        melanin_index = float(mean[0])
+    else:
+        x = _logit(model["intercept"], model["snps"], genome)
+        melanin_index = 1 / (1 + math.exp(-x))
 
     categories = {
         "Very Light": 0.15,
@@ -259,20 +444,25 @@ def predict_skin(genome):
 
     result = min(categories, key=lambda k: abs(categories[k] - melanin_index))
 
-    return {
+    out = {
         "result": result,
         "melanin_index": melanin_index,
         "model": "HIrisPlex-S (Skin)",
     }
+    if sd is not None:
+        out["melanin_index"] = round(melanin_index, 4)
+        out["uncertainty"] = round(float(sd[0]), 4)
+        out["missing_snps"] = missing
+    return out
 
 
 # ---------------------------------------------------------
 # Unified interface
 # ---------------------------------------------------------
 
-def hirisplex_predict(genome):
+def hirisplex_predict(genome, marginalize=None, population=None):
     return {
-        "eye": predict_eye(genome),
-        "hair": predict_hair(genome),
-        "skin": predict_skin(genome),
+        "eye": predict_eye(genome, marginalize, population),
+        "hair": predict_hair(genome, marginalize, population),
+        "skin": predict_skin(genome, marginalize, population),
     }
@@ -0,0 +1,238 @@
+"""
+LD-proxy substitution for model loci missing from a chip.
+
+Proxies come from nih/ld_proxies.csv (target, proxy, r2, alleles), where
+alleles pairs the target and proxy alleles that travel together in
+LDlink's "Correlated_Alleles" notation ("G=T,A=C": target G goes with
+proxy T). The table is compiled once into memory-mapped columns under
+nih/ld_proxies/:
+
+    target   int64[N]   rsID keys (see genome_arrays.rsid_key), sorted
+    proxy    int64[N]   rsID keys, best r2 first within a target
+    r2       float32[N]
+    alleles  uint8[N,4] target allele 1, proxy allele 1, target allele 2, proxy allele 2
+
+and recompiled whenever the CSV is newer. The proxies of the model
+loci are resolved once into a per-locus plan, so filling a genome is a
+few dict lookups per missing locus.
+
+Substituted calls are written into the genome dict only (not its
+arrays), tagged with the proxy and its r2, so trio checks, merges and
+summaries keep seeing the genotyped calls alone; meiosis_layout adds
+them back to the array rows of the loci it simulates. They sit at the
+target's own GRCh37 position (the proxy's on other builds) and carry
+ref/alt/dosage like any harmonized call.
+"""
+
+import csv
+import os
+
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_CODES, NO_DOSAGE, harmonize_arrays
+from utils.genome_arrays import (
+    ALLELE_CODES,
+    ALLELE_LETTERS,
+    CHROM_NAMES,
+    decode_genotype,
+    genotype_codes,
+    key_to_rsid,
+    rsid_key,
+)
+from utils.liftover import TARGET_BUILD
+from utils.reference_positions import load_reference_positions
+from utils.risk_engine import HEALTH_LOCI
+from utils.trait_engine import TRAIT_LOCI
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LD_SOURCE_PATH = os.path.join(BASE_DIR, "nih", "ld_proxies.csv")
+LD_INDEX_DIR = os.path.join(BASE_DIR, "nih", "ld_proxies")
+
+LD_COLUMNS = ("target", "proxy", "r2", "alleles")
+
+# weaker proxies are not worth a substituted call
+MIN_PROXY_R2 = 0.8
+
+MODEL_LOCI = sorted(set(TRAIT_LOCI) | set(HEALTH_LOCI))
+
+# Memory-mapped index (see module docstring)
+LD_INDEX = {}
+
+# loci tuple -> { target rsid: [(proxy rsid, r2, {proxy code: target letter}), ...] }
+_PROXY_PLANS = {}
+
+# target rsid -> (chrom, GRCh37 pos) from the reference positions
+_TARGET_SITES = {}
+
+
+# ---------------------------------------------------------
+# Index
+# ---------------------------------------------------------
+def _parse_alleles(text):
+    """ "G=T,A=C" -> (G, T, A, C) codes, or None. """
+    pairs = [p.split("=") for p in (text or "").upper().replace(" ", "").split(",") if "=" in p]
+    if len(pairs) != 2:
+        return None
+    codes = [ALLELE_CODES.get(a) for pair in pairs for a in pair]
+    return tuple(codes) if all(codes) else None
+
+
+def compile_ld_index(source=LD_SOURCE_PATH, out_dir=LD_INDEX_DIR):
+    """Compiles the proxy table into the column layout above (and saves it when possible)."""
+    targets, proxies, r2s, alleles = [], [], [], []
+    with open(source, "r") as f:
+        for row in csv.DictReader(f):
+            target = rsid_key(row.get("target", "").strip())
+            proxy = rsid_key(row.get("proxy", "").strip())
+            pairs = _parse_alleles(row.get("alleles"))
+            try:
+                r2 = float(row["r2"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if target <= 0 or proxy <= 0 or pairs is None or r2 < MIN_PROXY_R2:
+                continue
+            targets.append(target)
+            proxies.append(proxy)
+            r2s.append(r2)
+            alleles.append(pairs)
+
+    target = np.array(targets, dtype=np.int64)
+    r2 = np.array(r2s, dtype=np.float32)
+    order = np.lexsort((-r2, target))
+    index = {
+        "target": target[order],
+        "proxy": np.array(proxies, dtype=np.int64)[order],
+        "r2": r2[order],
+        "alleles": np.array(alleles, dtype=np.uint8).reshape(-1, 4)[order],
+    }
+
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        for name in LD_COLUMNS:
+            np.save(os.path.join(out_dir, f"{name}.npy"), index[name])
+    except OSError:
+        pass
+    return index
+
+
+def load_ld_index():
+    global LD_INDEX
+    if LD_INDEX:
+        return LD_INDEX
+
+    paths = [os.path.join(LD_INDEX_DIR, f"{name}.npy") for name in LD_COLUMNS]
+    if all(os.path.exists(p) for p in paths) and (
+        not os.path.exists(LD_SOURCE_PATH)
+        or min(os.path.getmtime(p) for p in paths) >= os.path.getmtime(LD_SOURCE_PATH)
+    ):
+        LD_INDEX = {name: np.load(p, mmap_mode="r") for name, p in zip(LD_COLUMNS, paths)}
+    elif os.path.exists(LD_SOURCE_PATH):
+        LD_INDEX = compile_ld_index()
+    return LD_INDEX
+
+
+def proxy_plan(loci=MODEL_LOCI):
+    """Ranked proxies of every locus in `loci` that has any (see _PROXY_PLANS)."""
+    loci = tuple(loci)
+    plan = _PROXY_PLANS.get(loci)
+    if plan is not None:
+        return plan
+
+    plan = {}
+    index = load_ld_index()
+    if index:
+        keys = np.array([rsid_key(r) for r in loci], dtype=np.int64)
+        lo = np.searchsorted(index["target"], keys, side="left")
+        hi = np.searchsorted(index["target"], keys, side="right")
+        for rsid, a, b in zip(loci, lo.tolist(), hi.tolist()):
+            if a == b:
+                continue
+            plan[rsid] = [
+                (
+                    key_to_rsid(int(index["proxy"][i])),
+                    round(float(index["r2"][i]), 3),
+                    {int(index["alleles"][i, 1]): ALLELE_LETTERS[index["alleles"][i, 0]],
+                     int(index["alleles"][i, 3]): ALLELE_LETTERS[index["alleles"][i, 2]]},
+                )
+                for i in range(a, b)
+            ]
+
+        reference = load_reference_positions()
+        wanted = set(plan) - set(_TARGET_SITES)
+        for rsid, locus in zip(reference["rsids"], reference["locus"].tolist()):
+            if rsid in wanted:
+                _TARGET_SITES[rsid] = (CHROM_NAMES.get(locus >> 32), locus & 0xFFFFFFFF)
+    _PROXY_PLANS[loci] = plan
+    return plan
+
+
+# ---------------------------------------------------------
+# Substitution
+# ---------------------------------------------------------
+def _called(call):
+    return bool(call) and genotype_codes(call.get("genotype"))[0] != 0
+
+
+def _translate(call, mapping):
+    """Proxy call -> target genotype through the allele mapping (either strand), or None."""
+    a1, a2 = genotype_codes(call.get("genotype"))
+    if a1 not in mapping or a2 not in mapping:
+        a1, a2 = int(COMPLEMENT_CODES[a1]), int(COMPLEMENT_CODES[a2])
+        if a1 not in mapping or a2 not in mapping:
+            return None
+    return f"{mapping[a1]}/{mapping[a2]}"
+
+
+def _harmonized(rsid, genotype):
+    """(genotype, ref/alt/dosage fields) of a substituted call, as the parser harmonizes."""
+    a1, a2 = genotype_codes(genotype)
+    result = harmonize_arrays({
+        "key": np.array([rsid_key(rsid)], dtype=np.int64),
+        "a1": np.array([a1], dtype=np.uint8),
+        "a2": np.array([a2], dtype=np.uint8),
+    })
+    if not len(result["index"]) or result["dosage"][0] == NO_DOSAGE:
+        return genotype, {}
+    return decode_genotype(int(result["a1"][0]), int(result["a2"][0])), {
+        "dosage": int(result["dosage"][0]),
+        "ref": ALLELE_LETTERS[result["ref"][0]],
+        "alt": ALLELE_LETTERS[result["alt"][0]],
+    }
+
+
+def fill_from_proxies(genome, loci=MODEL_LOCI):
+    """
+    Fills missing or uncalled loci of `genome` (in place) from their best
+    called proxy. Returns the substitutions:
+    [{"rsid": "rs12913832", "proxy": "rs1129038", "r2": 0.85, "genotype": "G/G"}, ...]
+    """
+    # reference positions are GRCh37
+    build = getattr(genome, "build", None)
+    on_reference = not build or build.get("positions") == TARGET_BUILD
+
+    filled = []
+    for rsid, proxies in proxy_plan(loci).items():
+        if _called(genome.get(rsid)):
+            continue
+        for proxy, r2, mapping in proxies:
+            call = genome.get(proxy)
+            if not _called(call):
+                continue
+            genotype = _translate(call, mapping)
+            if genotype is None:
+                continue
+            genotype, alleles = _harmonized(rsid, genotype)
+            # the proxy sits close by, so its position serves when the target's is unknown
+            site = _TARGET_SITES.get(rsid) if on_reference else None
+            chrom, pos = site or (call.get("chrom"), call.get("pos"))
+            genome[rsid] = {
+                "genotype": genotype,
+                "chrom": chrom,
+                "pos": pos,
+                **alleles,
+                "proxy": proxy,
+                "r2": r2,
+            }
+            filled.append({"rsid": rsid, "proxy": proxy, "r2": r2, "genotype": genotype})
+            break
+    return filled
@@ -0,0 +1,261 @@
+"""
+Genome build detection and liftover.
+
+All reference data in nih/ is on GRCh37, but raw files arrive on build
+36 (23andMe v3), 37 or 38 (most WGS VCFs). The parser detects the build
+from header hints or, failing that, from a sample of known loci, and
+lifts every position onto GRCh37 in one vectorized pass.
+
+Liftover uses UCSC chain files placed in nih/chain/ (e.g.
+hg19ToHg38.over.chain.gz). Each chain file is compiled once into a
+sorted interval index (saved next to it as .npz), so lifting is a
+single searchsorted over the whole position array.
+"""
+
+import gzip
+import os
+import re
+
+import numpy as np
+
+from utils.genome_arrays import CHROM_NAMES, chrom_code, locus_keys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CHAIN_DIR = os.path.join(BASE_DIR, "nih", "chain")
+
+TARGET_BUILD = 37
+BUILDS = (36, 37, 38)
+
+CHAIN_FILES = {
+    (36, 37): "hg18ToHg19.over.chain.gz",
+    (37, 36): "hg19ToHg18.over.chain.gz",
+    (37, 38): "hg19ToHg38.over.chain.gz",
+    (38, 37): "hg38ToHg19.over.chain.gz",
+}
+
+# chr1 length identifies the build from VCF ##contig lines
+CHR1_LENGTHS = {247249719: 36, 249250621: 37, 248956422: 38}
+
+HEADER_PATTERNS = [
+    (re.compile(r"grch\s*3?(7|8)"), lambda m: 30 + int(m.group(1))),
+    (re.compile(r"\bhg(18|19|38)\b"), lambda m: {"18": 36, "19": 37, "38": 38}[m.group(1)]),
+    (re.compile(r"ncbi\s*36|\bb36\b"), lambda m: 36),
+    (re.compile(r"\bb37\b"), lambda m: 37),
+    (re.compile(r"build\s*(3[678])"), lambda m: int(m.group(1))),
+]
+CONTIG_LENGTH = re.compile(r"##contig=<id=(?:chr)?1,.*length=(\d+)")
+
+# Share of sampled loci that must sit at a build's positions to call it
+MIN_LOCI_MATCH = 0.8
+LOCI_SAMPLE = 2000
+
+# (src, dst) -> compiled interval index
+LIFTOVER_INDEXES = {}
+
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+# ---------------------------------------------------------
+# Chain files -> sorted interval index
+# ---------------------------------------------------------
+def _compile_chain(path):
+    """
+    Blocks of a chain file as 1-based source intervals:
+    q = intercept + sign * p maps source position p to target q.
+    """
+    starts, ends, intercepts, signs, targets = [], [], [], [], []
+    with gzip.open(path, "rt") if path.endswith(".gz") else open(path) as f:
+        t_pos = q_pos = 0
+        t_code = q_code = q_size = 0
+        strand = 1
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "chain":
+                t_code = chrom_code(fields[2])
+                q_code = chrom_code(fields[7])
+                q_size = int(fields[8])
+                strand = -1 if fields[9] == "-" else 1
+                t_pos = int(fields[5])
+                q_pos = int(fields[10])
+                continue
+
+            size = int(fields[0])
+            if t_code and q_code:
+                starts.append((t_code << 32) | (t_pos + 1))
+                ends.append((t_code << 32) | (t_pos + size))
+                if strand == 1:
+                    intercepts.append(q_pos - t_pos)
+                else:
+                    intercepts.append(q_size + 1 - q_pos + t_pos)
+                signs.append(strand)
+                targets.append(q_code)
+            if len(fields) == 3:
+                t_pos += size + int(fields[1])
+                q_pos += size + int(fields[2])
+
+    starts = np.array(starts, dtype=np.int64)
+    order = np.argsort(starts, kind="stable")
+    index = {
+        "start": starts[order],
+        "end": np.array(ends, dtype=np.int64)[order],
+        "intercept": np.array(intercepts, dtype=np.int64)[order],
+        "sign": np.array(signs, dtype=np.int8)[order],
+        "chrom": np.array(targets, dtype=np.uint8)[order],
+    }
+
+    # Overlapping source intervals (rare, from secondary chains): keep
+    # the first one so every position has a single answer.
+    if len(order):
+        reach = np.maximum.accumulate(index["end"])
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = index["start"][1:] > reach[:-1]
+        index = {k: v[keep] for k, v in index.items()}
+    return index
+
+
+def load_liftover(src, dst):
+    """Compiled interval index for src -> dst, or None without a chain file."""
+    if (src, dst) in LIFTOVER_INDEXES:
+        return LIFTOVER_INDEXES[(src, dst)]
+
+    index = None
+    name = CHAIN_FILES.get((src, dst))
+    if name is not None:
+        path = os.path.join(CHAIN_DIR, name)
+        compiled = path.rsplit(".chain", 1)[0] + ".npz"
+        if os.path.exists(compiled) and (
+            not os.path.exists(path) or os.path.getmtime(compiled) >= os.path.getmtime(path)
+        ):
+            with np.load(compiled) as data:
+                index = {k: data[k] for k in data.files}
+        elif os.path.exists(path):
+            index = _compile_chain(path)
+            try:
+                np.savez(compiled, **index)
+            except OSError:
+                pass
+
+    LIFTOVER_INDEXES[(src, dst)] = index
+    return index
+
+
+def can_lift(src, dst):
+    return src == dst or load_liftover(src, dst) is not None
+
+
+def lift_positions(chrom, pos, src, dst=TARGET_BUILD):
+    """
+    chrom codes + 1-based positions on build `src` -> build `dst`.
+
+    Returns (chrom, pos, strand, mapped): strand is -1 where the target
+    interval is reverse-complemented; unmapped loci get chrom 0 / pos 0.
+    """
+    chrom = np.asarray(chrom, dtype=np.uint8)
+    pos = np.asarray(pos, dtype=np.int64)
+    if src == dst:
+        return chrom, pos, np.ones(len(pos), dtype=np.int8), locus_keys(chrom, pos) != 0
+
+    index = load_liftover(src, dst)
+    if index is None:
+        raise ValueError(f"No chain file for build {src} -> {dst} in {CHAIN_DIR}")
+
+    loci = locus_keys(chrom, pos)
+    j = np.searchsorted(index["start"], loci, side="right")
+    j -= 1
+    mapped = j >= 0
+    np.maximum(j, 0, out=j)
+    mapped &= loci <= index["end"][j]
+    mapped &= loci != 0
+
+    sign = index["sign"][j]
+    new_pos = index["intercept"][j]
+    new_pos += sign * pos
+    new_chrom = index["chrom"][j]
+
+    unmapped = ~mapped
+    sign[unmapped] = 1
+    new_pos[unmapped] = 0
+    new_chrom[unmapped] = 0
+    return new_chrom, new_pos, sign, mapped
+
+
+# ---------------------------------------------------------
+# Build detection
+# ---------------------------------------------------------
+def detect_build_from_header(lines):
+    """Build named in file comments / VCF meta lines, or None."""
+    for line in lines:
+        low = line.lower()
+        m = CONTIG_LENGTH.search(low)
+        if m and int(m.group(1)) in CHR1_LENGTHS:
+            return CHR1_LENGTHS[int(m.group(1))]
+        if low.startswith("##contig"):
+            continue
+        for pattern, build_of in HEADER_PATTERNS:
+            m = pattern.search(low)
+            if m:
+                build = build_of(m)
+                if build in BUILDS:
+                    return build
+    return None
+
+
+def detect_build_from_loci(rsids, chroms, positions, reference):
+    """
+    Compares up to LOCI_SAMPLE calls at reference (GRCh37) rsIDs with
+    the reference positions as they sit on each build.
+
+    reference: see reference_positions.load_reference_positions
+    Returns (build or None, share of loci matching it).
+    """
+    ref_index = {rsid: i for i, rsid in enumerate(reference["rsids"])}
+    sample = []
+    for rsid, chrom, pos in zip(rsids, chroms, positions):
+        i = ref_index.get(rsid)
+        if i is not None and pos:
+            sample.append((i, chrom_code(chrom), int(pos)))
+            if len(sample) >= LOCI_SAMPLE:
+                break
+    if not sample:
+        return None, 0.0
+
+    idx = np.array([s[0] for s in sample])
+    observed = locus_keys([s[1] for s in sample], [s[2] for s in sample])
+    ref_loci = reference["locus"][idx]
+    ref_chrom = (ref_loci >> 32).astype(np.uint8)
+    ref_pos = ref_loci & 0xffffffff
+
+    best, best_share = None, 0.0
+    for build in BUILDS:
+        if not can_lift(TARGET_BUILD, build):
+            continue
+        c, p, _, _ = lift_positions(ref_chrom, ref_pos, TARGET_BUILD, build)
+        share = float((locus_keys(c, p) == observed).mean())
+        if share > best_share:
+            best, best_share = build, share
+    if best_share < MIN_LOCI_MATCH:
+        return None, best_share
+    return best, best_share
+
+
+def lift_calls(chroms, positions, genotypes, src, dst=TARGET_BUILD):
+    """
+    Lifts parallel call lists. Returns new (chroms, positions,
+    genotypes, n_unmapped); unmapped calls keep their identifier and
+    genotype but lose their position.
+    """
+    n = len(positions)
+    codes = np.fromiter(map(chrom_code, chroms), dtype=np.uint8, count=n)
+    pos = np.fromiter((p or 0 for p in positions), dtype=np.int64, count=n)
+    new_chrom, new_pos, sign, mapped = lift_positions(codes, pos, src, dst)
+
+    out_chroms = [CHROM_NAMES.get(c) for c in new_chrom.tolist()]
+    out_pos = [p or None for p in new_pos.tolist()]
+    out_genotypes = list(genotypes)
+    for i in np.flatnonzero(sign < 0).tolist():
+        # the locus sits on the opposite strand in the target build
+        if out_genotypes[i]:
+            out_genotypes[i] = out_genotypes[i].translate(COMPLEMENT)
+    return out_chroms, out_pos, out_genotypes, int(n - mapped.sum())
@@ -0,0 +1,237 @@
+"""
+Panel manifest and compact panel uploads.
+
+The engines read a few tens of thousands of loci out of a ~600k-SNP
+file, so clients can extract just those and upload a small binary
+payload instead of the raw file. The manifest lists them:
+
+    ids       rsIDs sorted by key (see genome_arrays.rsid_key), then
+              "chrom:pos" sites the engines match by position
+              (haplogroup markers, pathogenic ClinVar sites inside the
+              carrier region-panel genes), sorted by locus
+    version   hash of ids; payloads name the manifest they index
+
+It is the union of the model loci (traits, health, fast model), the
+population / ancestry table, PGx definitions, GWAS PRS weights, LD
+proxies of model loci, curated gene blocks, ClinVar pathogenic rsIDs and
+Y / mt haplogroup markers. PGS Catalog scores, the genome summary and
+/snp lookups need the full file: panel genomes are marked by build
+source "panel" (see is_panel_genome), get no genome summary and /snp
+reports loci outside the panel as such.
+
+Payload layout (little endian):
+
+    magic     b"DNAP"
+    format    uint8 (PAYLOAD_FORMAT)
+    version   16 ASCII bytes, the manifest version
+    count     uint32
+    index     uint32[count]  manifest positions
+    codes     uint8[count]   (allele 1 << 3) | allele 2, allele codes
+                             as in genome_arrays.ALLELE_CODES; 0 for
+                             no-calls, kept as the parser keeps them
+
+so a chip's panel is 25 + 5 bytes per call found.
+"""
+
+import hashlib
+import struct
+
+import numpy as np
+
+from utils.carrier_engine import (
+    CLINVAR_DB,
+    DOMINANT_REGION_GENES,
+    RECESSIVE_REGION_GENES,
+    load_clinvar,
+    load_clinvar_sites,
+)
+from utils.child_predictor import MODEL_LOCI
+from utils.dna_parser import GENOTYPE_STRINGS, Genome
+from utils.fast_model import FAST_LOCI
+from utils.gene_index import gene_regions
+from utils.genome_arrays import CHROM_NAMES, chrom_code, genotype_codes, rsid_key
+from utils.genotype_panel import GENE_BLOCKS
+from utils.haplogroup_engine import HAPLOGROUP_TREE_FILES, load_haplogroup_tree
+from utils.ld_proxies import proxy_plan
+from utils.liftover import TARGET_BUILD
+from utils.pgx_engine import load_pgx_tables
+from utils.population_freqs import load_freq_table
+from utils.prs_engine import GWAS_TABLE, load_gwas_table
+from utils.reference_positions import load_reference_positions
+
+PAYLOAD_MAGIC = b"DNAP"
+PAYLOAD_FORMAT = 1
+VERSION_BYTES = 16
+HEADER = struct.Struct("<4sB16sI")
+
+# Built once per process (see module docstring), plus server-side columns:
+# { "version", "ids": [...], "key": int64[N] (0 for sites), "chrom": uint8[N], "pos": int64[N] }
+PANEL_MANIFEST = {}
+
+
+class PanelVersionError(ValueError):
+    """A payload built against another manifest version."""
+
+
+# ---------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------
+def panel_rsids():
+    """rsIDs any engine reads (see module docstring)."""
+    rsids = set(MODEL_LOCI) | set(FAST_LOCI) | set(load_freq_table()["rsids"])
+    for table in load_pgx_tables().values():
+        rsids.update(rsid for rsid, _, _ in table["variants"])
+    load_gwas_table()
+    for weights in GWAS_TABLE.values():
+        rsids.update(weights)
+    for proxies in proxy_plan().values():
+        rsids.update(proxy for proxy, _, _ in proxies)
+    for block in GENE_BLOCKS:
+        rsids.update(snp["rsid"] for snp in block["snps"])
+    load_clinvar()
+    rsids.update(rsid for rsid, info in CLINVAR_DB.items() if "patho" in info["type"])
+    return {rsid for rsid in rsids if rsid_key(rsid) > 0}
+
+
+def panel_sites():
+    """
+    (chrom code, pos) of the loci matched by position: haplogroup markers,
+    and the pathogenic ClinVar sites carrier_engine.region_panel_hits
+    finds under other IDs (vendor "i" IDs, VCF records without one).
+    """
+    sites = set()
+    for tree_name in HAPLOGROUP_TREE_FILES:
+        tree = load_haplogroup_tree(tree_name)
+        if tree is not None:
+            sites.update((int(locus) >> 32, int(locus) & 0xFFFFFFFF) for locus in tree["locus"])
+
+    loci, _ = load_clinvar_sites()
+    for gene in RECESSIVE_REGION_GENES + DOMINANT_REGION_GENES:
+        for chrom, start, end in gene_regions(gene):
+            code = chrom_code(chrom)
+            lo = np.searchsorted(loci, (code << 32) | start, side="left")
+            hi = np.searchsorted(loci, (code << 32) | end, side="right")
+            sites.update((code, int(locus) & 0xFFFFFFFF) for locus in loci[lo:hi].tolist())
+    return sites
+
+
+def load_panel_manifest():
+    global PANEL_MANIFEST
+    if PANEL_MANIFEST:
+        return PANEL_MANIFEST
+
+    rsids = sorted(panel_rsids(), key=rsid_key)
+    sites = sorted(panel_sites())
+
+    # GRCh37 positions of the rsIDs, where the reference tables have them
+    reference = load_reference_positions()
+    placed = {rsid: int(locus) for rsid, locus in zip(reference["rsids"], reference["locus"].tolist())}
+    loci = [placed.get(rsid, 0) for rsid in rsids]
+
+    ids = rsids + [f"{CHROM_NAMES[c]}:{p}" for c, p in sites]
+    PANEL_MANIFEST = {
+        "version": hashlib.sha1("\n".join(ids).encode()).hexdigest()[:VERSION_BYTES],
+        "ids": ids,
+        "key": np.array([rsid_key(r) for r in rsids] + [0] * len(sites), dtype=np.int64),
+        "chrom": np.array([l >> 32 for l in loci] + [c for c, _ in sites], dtype=np.uint8),
+        "pos": np.array([l & 0xFFFFFFFF for l in loci] + [p for _, p in sites], dtype=np.int64),
+    }
+    return PANEL_MANIFEST
+
+
+def manifest_document():
+    """The manifest as published to clients."""
+    manifest = load_panel_manifest()
+    return {
+        "version": manifest["version"],
+        "format": PAYLOAD_FORMAT,
+        "count": len(manifest["ids"]),
+        "ids": manifest["ids"],
+    }
+
+
+# ---------------------------------------------------------
+# Payloads
+# ---------------------------------------------------------
+def is_panel_genome(genome):
+    """True for genomes decoded from a panel payload (only the manifest's loci)."""
+    return ((getattr(genome, "build", None) or {}).get("source")) == "panel"
+
+
+def decode_panel_payload(data):
+    """
+    Genome from a compact panel payload. ValueError for malformed
+    payloads, PanelVersionError when built against another manifest.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Panel payload too short")
+    magic, fmt, version, count = HEADER.unpack_from(data)
+    if magic != PAYLOAD_MAGIC or fmt != PAYLOAD_FORMAT:
+        raise ValueError("Not a panel payload (or unsupported format)")
+
+    manifest = load_panel_manifest()
+    if version.decode("ascii", "replace") != manifest["version"]:
+        raise PanelVersionError(f"Panel built for manifest {version.decode('ascii', 'replace')}, "
+                                f"current is {manifest['version']}")
+    if len(data) != HEADER.size + 5 * count:
+        raise ValueError("Panel payload length does not match its count")
+
+    index = np.frombuffer(data, dtype="<u4", count=count, offset=HEADER.size).astype(np.int64)
+    codes = np.frombuffer(data, dtype=np.uint8, count=count, offset=HEADER.size + 4 * count)
+    if count and index.max() >= len(manifest["ids"]):
+        raise ValueError("Panel payload indexes past the manifest")
+
+    a1 = codes >> 3
+    a2 = codes & 7
+    valid = ((a1 >= 1) & (a1 <= 6) & (a2 >= 1) & (a2 <= 6)) | (codes == 0)
+    index, a1, a2 = index[valid], a1[valid], a2[valid]
+
+    # rsIDs go into the arrays (sorted by key); sites become positional entries
+    keys = manifest["key"][index]
+    by_key = np.flatnonzero(keys != 0)
+    by_key = by_key[np.argsort(keys[by_key], kind="stable")]
+    rows = index[by_key]
+    arrays = {
+        "key": keys[by_key],
+        "chrom": manifest["chrom"][rows],
+        "pos": manifest["pos"][rows],
+        "a1": a1[by_key],
+        "a2": a2[by_key],
+    }
+    extra = {}
+    for i in np.flatnonzero(keys == 0).tolist():
+        row = int(index[i])
+        extra[manifest["ids"][row]] = {
+            "genotype": GENOTYPE_STRINGS[(int(a1[i]) << 3) | int(a2[i])],
+            "chrom": CHROM_NAMES.get(int(manifest["chrom"][row])),
+            "pos": int(manifest["pos"][row]),
+        }
+
+    genome = Genome.from_arrays(
+        arrays,
+        extra=extra,
+        build={"detected": None, "source": "panel", "positions": TARGET_BUILD, "unmapped": 0},
+    )
+    genome.qc = {"format": "panel", "calls": int(valid.sum()), "invalid_codes": int(count - valid.sum())}
+    return genome
+
+
+def encode_panel_payload(calls, manifest=None):
+    """
+    Payload of { id: genotype } calls (the server-side twin of the
+    frontend's panel worker, e.g. for tests and scripted uploads).
+    """
+    manifest = manifest or load_panel_manifest()
+    position = {rsid: i for i, rsid in enumerate(manifest["ids"])}
+    entries = []
+    for rsid, genotype in calls.items():
+        i = position.get(rsid)
+        if i is None:
+            continue
+        a1, a2 = genotype_codes(genotype)
+        entries.append((i, (a1 << 3) | a2 if a1 and a2 else 0))
+    entries.sort()
+    header = HEADER.pack(PAYLOAD_MAGIC, PAYLOAD_FORMAT, manifest["version"].encode(), len(entries))
+    index = np.array([e[0] for e in entries], dtype="<u4")
+    codes = np.array([e[1] for e in entries], dtype=np.uint8)
+    return header + index.tobytes() + codes.tobytes()
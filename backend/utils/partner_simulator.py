@@ -0,0 +1,224 @@
+"""
+Population partner simulator.
+
+Draws synthetic partner genomes at the model loci from per-population
+allele frequencies (see population_freqs), pairs every partner with
+the user's genome and aggregates the resulting child trait and carrier
+distributions. All sampling is done on (partners x loci) arrays; each
+trait model is then evaluated once per distinct genotype pattern over
+its own loci rather than once per simulated child.
+
+Alleles are on the frequency table's strand: the user's calls are
+harmonized to it, and simulated children carry the table's ref/alt
+and dosage like parsed calls. Trait loci without frequency data keep
+the user's own call. X loci are hemizygous in males: a male partner
+carries one X allele, sons get their mother's, and daughters one from
+each parent.
+"""
+
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_CODES
+from utils.carrier_engine import GENE_PANELS
+from utils.child_predictor import summarize_trait_results
+from utils.genome_arrays import ALLELE_LETTERS, decode_genotype, genotype_codes
+from utils.genome_qc import genome_sex
+from utils.population_freqs import load_freq_table, resolve_population
+from utils.trait_engine import TRAIT_MODELS
+
+DEFAULT_PARTNERS = 2000
+MAX_PARTNERS = 20000
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+def _user_codes(genome, table):
+    """
+    User allele codes at the table loci, on the table's strand (0 where
+    the locus is missing or fits neither strand).
+    """
+    n = len(table["rsids"])
+    a1 = np.zeros(n, dtype=np.uint8)
+    a2 = np.zeros(n, dtype=np.uint8)
+    for i, rsid in enumerate(table["rsids"]):
+        info = genome.get(rsid)
+        if not info:
+            continue
+        codes = genotype_codes(info.get("genotype"))
+        alleles = (table["ref"][i], table["alt"][i])
+        if not set(codes) <= set(alleles):
+            codes = tuple(int(COMPLEMENT_CODES[c]) for c in codes)
+        if set(codes) <= set(alleles):
+            a1[i], a2[i] = codes
+    return a1, a2
+
+
+def _table_call(table, j, code):
+    """Genome entry for an unordered genotype code at table locus j, dosage included."""
+    a1, a2 = code >> 3, code & 7
+    genotype = decode_genotype(a1, a2)
+    if not genotype:
+        return None
+    ref, alt = table["ref"][j], table["alt"][j]
+    return {
+        "genotype": genotype,
+        "chrom": table["chroms"][j],
+        "pos": int(table["pos"][j]),
+        "dosage": int(a1 == alt) + int(a2 == alt),
+        "ref": ALLELE_LETTERS[ref],
+        "alt": ALLELE_LETTERS[alt],
+    }
+
+
+def _pattern_distribution(trait, fn, loci, c1, c2, table, fixed):
+    """
+    Evaluates one trait model on every distinct child genotype pattern
+    over its loci and weights the results by how often each occurs.
+    fixed: calls at the trait's loci the table lacks (the user's own).
+    """
+    idx = [table["index"][rsid] for rsid in loci if rsid in table["index"]]
+    n = c1.shape[0]
+
+    # unordered genotype code per locus, so A/G and G/A collapse
+    lo = np.minimum(c1[:, idx], c2[:, idx])
+    hi = np.maximum(c1[:, idx], c2[:, idx])
+    codes = (lo << 3) | hi
+
+    if codes.shape[1] == 0:
+        patterns = np.zeros((1, 0), dtype=np.uint8)
+        counts = np.array([n])
+    else:
+        patterns, counts = np.unique(codes, axis=0, return_counts=True)
+
+    dist = {}
+    for pattern, count in zip(patterns, counts):
+        genome = {rsid: fixed[rsid] for rsid in loci if rsid in fixed}
+        for j, code in zip(idx, pattern.tolist()):
+            call = _table_call(table, j, code)
+            if call:
+                genome[table["rsids"][j]] = call
+        value = summarize_trait_results({trait: fn(genome)})[trait]
+        dist[value] = dist.get(value, 0) + int(count)
+
+    return {val: round(cnt / n, 4) for val, cnt in dist.items()}
+
+
+def _carrier_risk(genome, c1, c2, partner_alt, table):
+    """Per panel locus: partner carrier rate and child carrier / affected rates."""
+    out = []
+    for gene, snps in GENE_PANELS.items():
+        for rsid in snps:
+            j = table["index"].get(rsid)
+            if j is None:
+                continue
+            alt = table["alt"][j]
+            user_genotype = (genome.get(rsid) or {}).get("genotype")
+            entry = {
+                "gene": gene,
+                "rsid": rsid,
+                "user_genotype": user_genotype,
+                "partner_carrier_rate": round(float((partner_alt[:, j].sum(axis=1) == 1).mean()), 4),
+                "child_carrier_rate": None,
+                "child_affected_rate": None,
+            }
+            if c1[0, j]:
+                dose = (c1[:, j] == alt).astype(np.int8) + (c2[:, j] == alt)
+                entry["child_carrier_rate"] = round(float((dose == 1).mean()), 4)
+                entry["child_affected_rate"] = round(float((dose == 2).mean()), 4)
+            out.append(entry)
+    return out
+
+
+# ---------------------------------------------------------
+# Main entry
+# ---------------------------------------------------------
+def simulate_partners(genome, population="EUR", partners=DEFAULT_PARTNERS, seed=None, sex=None):
+    """
+    genome: the user's parsed genome, or None to only draw a partner.
+    sex: the user's ("male" / "female"); defaults to the one QC inferred
+    from the file. Partners are of the other sex; when neither is known,
+    each simulated couple is either way round with equal odds.
+
+    Returns:
+    {
+      "population": "EUR",
+      "partners_simulated": 2000,
+      "loci_simulated": 40,
+      "example_partner": { "rs12913832": "A/G", ... },
+      "child_trait_distribution": { "eye_color": {"Brown": 0.61, ...}, ... },
+      "carrier_risk": [ {"gene": "HFE", "rsid": ..., "child_affected_rate": ...}, ... ]
+    }
+    """
+    table = load_freq_table()
+    pop = resolve_population(population)
+    n = max(1, min(int(partners), MAX_PARTNERS))
+    rng = np.random.default_rng(seed)
+
+    freqs = table["freqs"][pop]
+    ref, alt = table["ref"], table["alt"]
+
+    if sex not in (None, "", "male", "female"):
+        raise ValueError(f"Unknown sex '{sex}' (use male or female)")
+    # the user's sex decides the partners' (and so who is hemizygous on X)
+    sex = sex or (genome_sex(genome) if genome is not None else None)
+    user_male = np.full(n, sex == "male") if sex else rng.random(n) < 0.5
+    on_x = np.array([c == "X" for c in table["chroms"]], dtype=bool)
+
+    # (partners, loci, 2) alt-allele indicators under Hardy-Weinberg;
+    # male partners carry a single X allele
+    partner_alt = rng.random((n, len(freqs), 2)) < freqs[None, :, None]
+    hemizygous = (~user_male)[:, None] & on_x[None, :]
+    partner_alt[:, :, 1] = np.where(hemizygous, partner_alt[:, :, 0], partner_alt[:, :, 1])
+
+    example = {
+        rsid: decode_genotype(*np.where(partner_alt[0, i], alt[i], ref[i]))
+        for i, rsid in enumerate(table["rsids"])
+    }
+
+    result = {
+        "population": pop,
+        "partners_simulated": n,
+        "loci_simulated": len(freqs),
+        "example_partner": example,
+        "child_trait_distribution": None,
+        "carrier_risk": None,
+    }
+    if genome is None:
+        return result
+
+    ua1, ua2 = _user_codes(genome, table)
+    has_user = ua1 != 0
+
+    # Child: one random user allele + one partner allele. The partner's
+    # first allele is as random as either, so it is used directly.
+    from_user = np.where(rng.random((n, len(freqs))) < 0.5, ua1, ua2)
+    from_partner = np.where(partner_alt[:, :, 0], alt, ref)
+
+    # X: the mother passes one of her two alleles, the father his only X
+    # to daughters; sons are hemizygous (stored homozygous, as parsed)
+    son = (rng.random(n) < 0.5)[:, None]
+    mother = np.where(user_male[:, None], from_partner, from_user)
+    father = np.where(user_male[:, None], from_user, from_partner)
+    x_c1 = mother
+    x_c2 = np.where(son, mother, father)
+    from_user = np.where(on_x, x_c1, from_user)
+    from_partner = np.where(on_x, x_c2, from_partner)
+
+    # Loci the user lacks stay missing, like predict_child's parent-A template
+    c1 = np.where(has_user, from_user, 0).astype(np.uint8)
+    c2 = np.where(has_user, from_partner, 0).astype(np.uint8)
+
+    # trait loci without frequency data: the child keeps the user's call
+    fixed = {
+        rsid: genome[rsid]
+        for _, loci in TRAIT_MODELS.values() for rsid in loci
+        if rsid not in table["index"] and genome.get(rsid)
+    }
+
+    result["child_trait_distribution"] = {
+        trait: _pattern_distribution(trait, fn, loci, c1, c2, table, fixed)
+        for trait, (fn, loci) in TRAIT_MODELS.items()
+    }
+    result["carrier_risk"] = _carrier_risk(genome, c1, c2, partner_alt, table)
+    return result
@@ -0,0 +1,449 @@
+"""
+PGS Catalog polygenic scores.
+
+Scoring files from the PGS Catalog (plain or harmonized
+"_hmPOS_GRCh37/38", optionally gzipped) are streamed once at install
+time and compiled into column files under nih/pgs/<PGS id>/:
+
+    key     int64[V]   rsID keys (see genome_arrays.rsid_key; 0 = none)
+    locus   int64[V]   GRCh37 locus keys (see genome_arrays.locus_keys; 0 = unplaced)
+    effect  uint8[V]   effect allele code
+    other   uint8[V]   other allele code (0 = not given)
+    weight  float32[V] per-allele weight (log scale for OR / HR scores)
+    freq    float32[V] effect allele frequency (NaN = not given)
+
+sorted by rsID key. nih/pgs/registry.json lists the installed scores
+and their metadata. Columns are memory-mapped on first use, so an
+installed score costs nothing until it is scored, and scoring a genome
+is one sorted join on its rsID keys (plus one position join for
+variants without a matching rsID) and a dot product of weights and
+effect-allele dosages.
+
+Variants given on a build other than GRCh37 are lifted when a chain
+file is available (see liftover); variants placed but without an rsID
+get one from the reference positions when possible.
+
+    python -m utils.pgs_catalog install PGS000001_hmPOS_GRCh37.txt.gz [--trait height]
+    python -m utils.pgs_catalog list
+    python -m utils.pgs_catalog remove PGS000001
+"""
+
+import csv
+import gzip
+import json
+import math
+import os
+import re
+import shutil
+
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_CODES
+from utils.genome_arrays import (
+    ALLELE_CODES,
+    chrom_code,
+    encode_genome,
+    join_sorted,
+    locus_keys,
+    position_order,
+    rsid_key,
+)
+from utils.liftover import TARGET_BUILD, can_lift, lift_positions
+from utils.reference_positions import load_reference_positions
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PGS_DIR = os.path.join(BASE_DIR, "nih", "pgs")
+REGISTRY_PATH = os.path.join(PGS_DIR, "registry.json")
+
+PGS_COLUMNS = {
+    "key": np.int64,
+    "locus": np.int64,
+    "effect": np.uint8,
+    "other": np.uint8,
+    "weight": np.float32,
+    "freq": np.float32,
+}
+
+# weights reported as ratios are stored as logs
+RATIO_WEIGHT_TYPES = ("or", "hr")
+
+BUILD_NAMES = {"grch37": 37, "hg19": 37, "grch38": 38, "hg38": 38, "ncbi36": 36, "hg18": 36}
+
+# Registry (pgs_id -> metadata), reloaded when registry.json changes
+PGS_REGISTRY = {}
+_REGISTRY_MTIME = None
+
+# pgs_id -> { column: memory-mapped array }
+PGS_SCORES = {}
+
+
+# ---------------------------------------------------------
+# Registry
+# ---------------------------------------------------------
+def load_pgs_registry():
+    global PGS_REGISTRY, _REGISTRY_MTIME
+    mtime = os.path.getmtime(REGISTRY_PATH) if os.path.exists(REGISTRY_PATH) else None
+    if mtime == _REGISTRY_MTIME:
+        return PGS_REGISTRY
+
+    registry = {}
+    if mtime is not None:
+        with open(REGISTRY_PATH, "r") as f:
+            registry = json.load(f)
+
+    # re-installed or removed scores must be re-mapped
+    for pgs_id in list(PGS_SCORES):
+        if registry.get(pgs_id) != PGS_REGISTRY.get(pgs_id):
+            del PGS_SCORES[pgs_id]
+
+    PGS_REGISTRY = registry
+    _REGISTRY_MTIME = mtime
+    return PGS_REGISTRY
+
+
+def _save_registry(registry):
+    os.makedirs(PGS_DIR, exist_ok=True)
+    tmp = REGISTRY_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+    os.replace(tmp, REGISTRY_PATH)
+
+
+def installed_scores():
+    """{ pgs_id: metadata } of every installed score."""
+    return dict(load_pgs_registry())
+
+
+def load_pgs_score(pgs_id):
+    """Memory-mapped columns of an installed score (see module docstring), or None."""
+    registry = load_pgs_registry()
+    if pgs_id not in registry:
+        return None
+    if pgs_id not in PGS_SCORES:
+        folder = os.path.join(PGS_DIR, pgs_id)
+        PGS_SCORES[pgs_id] = {
+            name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r") for name in PGS_COLUMNS
+        }
+    return PGS_SCORES[pgs_id]
+
+
+# ---------------------------------------------------------
+# Ingestion
+# ---------------------------------------------------------
+def _build_number(text):
+    text = (text or "").strip().lower()
+    if text in BUILD_NAMES:
+        return BUILD_NAMES[text]
+    m = re.search(r"(36|37|38)", text)
+    return int(m.group(1)) if m else None
+
+
+def _allele_pair(effect, other):
+    """
+    (effect, other) allele strings -> codes; indels become I / D by
+    length. Returns None for alleles arrays can't report.
+    """
+    effect = (effect or "").strip().upper()
+    other = (other or "").strip().upper()
+    if "/" in other:
+        # inferred other allele with several candidates
+        other = ""
+
+    if effect in ALLELE_CODES and other in ALLELE_CODES:
+        return ALLELE_CODES[effect], ALLELE_CODES[other]
+    if effect in ALLELE_CODES and not other:
+        return ALLELE_CODES[effect], 0
+    if effect and other and len(effect) != len(other) and effect.isalpha() and other.isalpha():
+        insertion, deletion = ALLELE_CODES["I"], ALLELE_CODES["D"]
+        return (insertion, deletion) if len(effect) > len(other) else (deletion, insertion)
+    return None
+
+
+def _read_scoring_file(path):
+    """
+    Streams a scoring file.
+    Returns (header metadata, column lists, rows skipped).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    meta = {}
+    cols = {"key": [], "chrom": [], "pos": [], "effect": [], "other": [], "weight": [], "freq": []}
+    skipped = 0
+
+    with opener(path, "rt", errors="ignore") as f:
+        line = f.readline()
+        while line.startswith("#"):
+            if "=" in line:
+                k, v = line[1:].split("=", 1)
+                meta[k.strip()] = v.strip()
+            line = f.readline()
+
+        header = [h.strip() for h in line.rstrip("\n").split("\t")]
+        idx = {h: i for i, h in enumerate(header)}
+
+        def col(*names):
+            for name in names:
+                if name in idx:
+                    return idx[name]
+            return None
+
+        harmonized = "hm_pos" in idx
+        hm_rsid_col = col("hm_rsID")
+        rsid_col = col("rsID")
+        chrom_col = col("hm_chr") if harmonized else col("chr_name")
+        pos_col = col("hm_pos") if harmonized else col("chr_position")
+        effect_col = col("effect_allele")
+        other_col = col("other_allele")
+        infer_col = col("hm_inferOtherAllele")
+        freq_col = col("allelefrequency_effect")
+
+        weight_type = meta.get("weight_type", "").lower()
+        weight_col = col("effect_weight")
+        if weight_col is None:
+            weight_col = col("OR", "HR")
+            weight_type = "or"
+        if effect_col is None or weight_col is None:
+            raise ValueError(f"{path}: not a PGS scoring file (no effect_allele / effect_weight)")
+        log_weight = weight_type in RATIO_WEIGHT_TYPES
+
+        def field(row, i):
+            return row[i].strip() if i is not None and i < len(row) else ""
+
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if not row:
+                continue
+            other = field(row, other_col) or field(row, infer_col)
+            alleles = _allele_pair(field(row, effect_col), other)
+            try:
+                weight = float(field(row, weight_col))
+                if log_weight:
+                    weight = math.log(weight)
+            except ValueError:
+                weight = None
+            if alleles is None or weight is None:
+                skipped += 1
+                continue
+
+            rsid = field(row, hm_rsid_col) or field(row, rsid_col)
+            try:
+                pos = int(field(row, pos_col))
+            except ValueError:
+                pos = 0
+            try:
+                freq = float(field(row, freq_col))
+            except ValueError:
+                freq = math.nan
+
+            cols["key"].append(rsid_key(rsid))
+            cols["chrom"].append(chrom_code(field(row, chrom_col)))
+            cols["pos"].append(pos)
+            cols["effect"].append(alleles[0])
+            cols["other"].append(alleles[1])
+            cols["weight"].append(weight)
+            cols["freq"].append(freq)
+
+    meta["_build"] = _build_number(meta.get("HmPOS_build") if harmonized else meta.get("genome_build"))
+    return meta, cols, skipped
+
+
+def compile_scoring_file(path):
+    """
+    Scoring file -> (columns, metadata) in the layout of the module
+    docstring, positions lifted to GRCh37.
+    """
+    meta, cols, skipped = _read_scoring_file(path)
+    key = np.array(cols["key"], dtype=np.int64)
+    key[key < 0] = 0
+    chrom = np.array(cols["chrom"], dtype=np.uint8)
+    pos = np.array(cols["pos"], dtype=np.int64)
+
+    build = meta["_build"]
+    if build is None or not can_lift(build, TARGET_BUILD):
+        # positions on an unknown build can't be trusted
+        locus = np.zeros(len(pos), dtype=np.int64)
+    else:
+        chrom, pos, _, mapped = lift_positions(chrom, pos, build, TARGET_BUILD)
+        locus = np.where(mapped, locus_keys(chrom, pos), 0)
+
+    # placed variants without an rsID: look one up by position
+    missing = np.flatnonzero((key == 0) & (locus != 0))
+    if len(missing):
+        reference = load_reference_positions()
+        at, hits = join_sorted(reference["locus"], locus[missing])
+        key[missing[hits]] = [rsid_key(reference["rsids"][i]) for i in at.tolist()]
+
+    order = np.lexsort((locus, key))
+    columns = {
+        "key": key[order],
+        "locus": locus[order],
+        "effect": np.array(cols["effect"], dtype=np.uint8)[order],
+        "other": np.array(cols["other"], dtype=np.uint8)[order],
+        "weight": np.array(cols["weight"], dtype=np.float32)[order],
+        "freq": np.array(cols["freq"], dtype=np.float32)[order],
+    }
+
+    usable = (columns["key"] != 0) | (columns["locus"] != 0)
+    metadata = {
+        "pgs_id": meta.get("pgs_id"),
+        "name": meta.get("pgs_name"),
+        "trait": meta.get("trait_mapped") or meta.get("trait_reported"),
+        "trait_reported": meta.get("trait_reported"),
+        "source_build": build,
+        "variants": int(usable.sum()),
+        "variants_in_file": int(len(key)) + skipped,
+        "has_frequencies": bool(np.isfinite(columns["freq"]).any()),
+        "source": os.path.basename(path),
+    }
+    columns = {name: values[usable] for name, values in columns.items()}
+    return columns, metadata
+
+
+def install_pgs(path, pgs_id=None, trait=None):
+    """Compiles a scoring file into nih/pgs/ and registers it. Returns its metadata."""
+    columns, metadata = compile_scoring_file(path)
+    pgs_id = pgs_id or metadata["pgs_id"] or os.path.basename(path).split("_")[0].split(".")[0]
+    metadata["pgs_id"] = pgs_id
+    if trait:
+        metadata["trait"] = trait
+    if not metadata["variants"]:
+        raise ValueError(f"{path}: no usable variants")
+
+    folder = os.path.join(PGS_DIR, pgs_id)
+    os.makedirs(folder, exist_ok=True)
+    for name, dtype in PGS_COLUMNS.items():
+        np.save(os.path.join(folder, f"{name}.npy"), columns[name].astype(dtype, copy=False))
+
+    registry = dict(load_pgs_registry())
+    registry[pgs_id] = metadata
+    _save_registry(registry)
+    return metadata
+
+
+def remove_pgs(pgs_id):
+    registry = dict(load_pgs_registry())
+    if registry.pop(pgs_id, None) is None:
+        return False
+    _save_registry(registry)
+    shutil.rmtree(os.path.join(PGS_DIR, pgs_id), ignore_errors=True)
+    return True
+
+
+# ---------------------------------------------------------
+# Scoring
+# ---------------------------------------------------------
+def _matched_calls(arrays, score):
+    """
+    Rows of `score` found in the genome and the genome rows they map to:
+    by rsID key first, by GRCh37 position for the rest.
+    """
+    at, hits = join_sorted(arrays["key"], score["key"])
+
+    found = np.zeros(len(score["key"]), dtype=bool)
+    found[hits] = True
+    rest = np.flatnonzero(~found & (score["locus"] != 0))
+    if len(rest):
+        order = position_order(arrays)
+        loci = locus_keys(arrays["chrom"][order], arrays["pos"][order])
+        at2, hits2 = join_sorted(loci, score["locus"][rest])
+        at = np.concatenate((at, order[at2]))
+        hits = np.concatenate((hits, rest[hits2]))
+    return hits, at
+
+
+def score_pgs(genome, pgs_id):
+    """
+    {
+      "pgs_id": "PGS000001", "trait": "breast carcinoma",
+      "raw_score": 0.41, "z": 0.83, "percentile": 79.7,
+      "snps_used": 71, "snps_total": 77
+    }
+    z / percentile are against the expectation under Hardy-Weinberg at
+    the used variants, so they need effect allele frequencies (None
+    otherwise). Returns None for unknown scores or no overlap.
+    """
+    score = load_pgs_score(pgs_id)
+    if score is None:
+        return None
+    arrays = encode_genome(genome)
+    rows, at = _matched_calls(arrays, score)
+
+    a1 = arrays["a1"][at]
+    a2 = arrays["a2"][at]
+    effect = score["effect"][rows]
+    other = score["other"][rows]
+
+    # read the call on the strand of the score; without an other allele
+    # the strand can't be checked and the call is read as reported
+    known = other != 0
+    fits = ~known | (((a1 == effect) | (a1 == other)) & ((a2 == effect) | (a2 == other)))
+    c1, c2 = COMPLEMENT_CODES[a1], COMPLEMENT_CODES[a2]
+    ambiguous = COMPLEMENT_CODES[effect] == other
+    flip = ~fits & ~ambiguous & ((c1 == effect) | (c1 == other)) & ((c2 == effect) | (c2 == other))
+    a1 = np.where(flip, c1, a1)
+    a2 = np.where(flip, c2, a2)
+
+    usable = (fits | flip) & (a1 != 0)
+    dosage = (a1[usable] == effect[usable]).astype(np.float32) + (a2[usable] == effect[usable])
+    weight = score["weight"][rows[usable]]
+    n_used = int(usable.sum())
+    if not n_used:
+        return None
+    raw = float(np.dot(weight, dosage))
+
+    z = percentile = None
+    p = score["freq"][rows[usable]].astype(np.float64)
+    if np.isfinite(p).all():
+        expected = float(np.dot(weight, 2 * p))
+        sd = math.sqrt(float(np.dot(weight * weight, 2 * p * (1 - p))))
+        if sd > 0:
+            z = (raw - expected) / sd
+            percentile = 0.5 * (1 + math.erf(z / math.sqrt(2))) * 100
+
+    metadata = load_pgs_registry()[pgs_id]
+    return {
+        "pgs_id": pgs_id,
+        "trait": metadata.get("trait"),
+        "raw_score": raw,
+        "z": z,
+        "percentile": percentile,
+        "snps_used": n_used,
+        "snps_total": int(len(score["key"])),
+    }
+
+
+def score_installed(genome, pgs_ids=None):
+    """{ pgs_id: score_pgs(...) } for the given or all installed scores."""
+    registry = load_pgs_registry()
+    return {pgs_id: score_pgs(genome, pgs_id) for pgs_id in (pgs_ids or registry) if pgs_id in registry}
+
+
+# ---------------------------------------------------------
+# Command line
+# ---------------------------------------------------------
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Install PGS Catalog scoring files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_install = sub.add_parser("install", help="compile and register scoring files")
+    p_install.add_argument("paths", nargs="+")
+    p_install.add_argument("--id", dest="pgs_id", help="registry id (default: pgs_id from the file header)")
+    p_install.add_argument("--trait", help="trait label to register")
+    sub.add_parser("list", help="list installed scores")
+    p_remove = sub.add_parser("remove", help="uninstall scores")
+    p_remove.add_argument("pgs_ids", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "install":
+        for path in args.paths:
+            meta = install_pgs(path, pgs_id=args.pgs_id if len(args.paths) == 1 else None, trait=args.trait)
+            print(f"{meta['pgs_id']}: {meta['variants']}/{meta['variants_in_file']} variants ({meta['trait']})")
+    elif args.command == "list":
+        for pgs_id, meta in sorted(load_pgs_registry().items()):
+            print(f"{pgs_id}\t{meta.get('variants')}\t{meta.get('trait')}")
+    else:
+        for pgs_id in args.pgs_ids:
+            print(f"{pgs_id}: {'removed' if remove_pgs(pgs_id) else 'not installed'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Pharmacogenomic star-allele calling.
+
+Star-allele definitions (nih/pgx/star_alleles.csv: gene, allele,
+function, activity, defining "rsid:REF>ALT" variants) and activity-score
+phenotype bins (nih/pgx/phenotypes.csv) are compiled once per gene
+into bitmasks over its defining variants:
+
+- every allele is a mask of the alt alleles that define it (*1 = 0)
+- every candidate diplotype (all unordered allele pairs) is stored as
+  an expected homozygous-alt mask (a & b) and heterozygous mask (a ^ b)
+
+Calling a genome turns its calls at the defining variants into observed
+het / hom / called masks and scores all diplotypes at once by popcount
+of the disagreeing bits. Ties go to the pair relying least on uncalled
+variants (so missing data falls back to *1), and the remaining equally
+good pairs are reported as alternatives. New genes or alleles are
+data-only additions to the two CSVs.
+
+Alleles are given on the GRCh37 + strand; calls fitting only the
+complemented ref/alt are read on the other strand, and calls fitting
+neither count as uncalled.
+"""
+
+import csv
+import os
+
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_CODES
+from utils.genome_arrays import ALLELE_CODES, genotype_codes
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PGX_DIR = os.path.join(BASE_DIR, "nih", "pgx")
+STAR_ALLELE_PATH = os.path.join(PGX_DIR, "star_alleles.csv")
+PHENOTYPE_PATH = os.path.join(PGX_DIR, "phenotypes.csv")
+
+# one bit per defining variant
+MAX_VARIANTS = 64
+
+POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Compiled once:
+# { gene: {
+#     "variants": [(rsid, ref code, alt code), ...], "alleles": [...], "functions": [...],
+#     "pairs": (int[P], int[P]), "hom": uint64[P], "het": uint64[P],
+#     "defined": uint64[P] (bits either allele needs), "activity": float[P],
+#     "phenotypes": [(max_activity, phenotype), ...] ascending
+# } }
+PGX_TABLES = {}
+
+
+def _popcount(x):
+    return POPCOUNT_8[x.view(np.uint8)].reshape(len(x), 8).sum(axis=1)
+
+
+# ---------------------------------------------------------
+# Definition tables -> bitmasks
+# ---------------------------------------------------------
+def _compile_gene(rows, phenotypes):
+    variants = []
+    masks = []
+    for row in rows:
+        mask = 0
+        for token in (row.get("variants") or "").split(";"):
+            token = token.strip()
+            if not token:
+                continue
+            rsid, alleles = token.split(":")
+            ref, alt = alleles.upper().split(">")
+            variant = (rsid, ALLELE_CODES[ref], ALLELE_CODES[alt])
+            if variant not in variants:
+                variants.append(variant)
+            mask |= 1 << variants.index(variant)
+        masks.append(mask)
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f"{rows[0]['gene']}: more than {MAX_VARIANTS} defining variants")
+
+    masks = np.array(masks, dtype=np.uint64)
+    activity = np.array([float(r["activity"]) for r in rows])
+    i, j = np.triu_indices(len(rows))
+    return {
+        "variants": variants,
+        "alleles": [r["allele"] for r in rows],
+        "functions": [r["function"] for r in rows],
+        "pairs": (i, j),
+        "hom": masks[i] & masks[j],
+        "het": masks[i] ^ masks[j],
+        "defined": masks[i] | masks[j],
+        "activity": activity[i] + activity[j],
+        "phenotypes": sorted(phenotypes),
+    }
+
+
+def load_pgx_tables():
+    global PGX_TABLES
+    if PGX_TABLES:
+        return PGX_TABLES
+
+    genes = {}
+    with open(STAR_ALLELE_PATH, "r") as f:
+        for row in csv.DictReader(f):
+            genes.setdefault(row["gene"], []).append(row)
+
+    phenotypes = {}
+    if os.path.exists(PHENOTYPE_PATH):
+        with open(PHENOTYPE_PATH, "r") as f:
+            for row in csv.DictReader(f):
+                phenotypes.setdefault(row["gene"], []).append((float(row["max_activity"]), row["phenotype"]))
+
+    PGX_TABLES = {gene: _compile_gene(rows, phenotypes.get(gene, [])) for gene, rows in genes.items()}
+    return PGX_TABLES
+
+
+# ---------------------------------------------------------
+# Calling
+# ---------------------------------------------------------
+def _alt_dosage(call, ref, alt):
+    """Alt allele count of a call, read on whichever strand fits; None if uncalled."""
+    a1, a2 = genotype_codes(call.get("genotype")) if call else (0, 0)
+    if not a1:
+        return None
+    if a1 not in (ref, alt) or a2 not in (ref, alt):
+        a1, a2 = int(COMPLEMENT_CODES[a1]), int(COMPLEMENT_CODES[a2])
+        if a1 not in (ref, alt) or a2 not in (ref, alt):
+            return None
+    return (a1 == alt) + (a2 == alt)
+
+
+def _observed_masks(genome, table):
+    het = hom = called = 0
+    for bit, (rsid, ref, alt) in enumerate(table["variants"]):
+        d = _alt_dosage(genome.get(rsid), ref, alt)
+        if d is None:
+            continue
+        called |= 1 << bit
+        if d == 1:
+            het |= 1 << bit
+        elif d == 2:
+            hom |= 1 << bit
+    return np.uint64(het), np.uint64(hom), np.uint64(called)
+
+
+def _phenotype(table, activity):
+    for max_activity, phenotype in table["phenotypes"]:
+        if activity <= max_activity:
+            return phenotype
+    return None
+
+
+def call_gene(genome, gene, table=None):
+    """
+    Best diplotype for one gene:
+    {
+      "diplotype": "*1/*2", "activity_score": 1.0,
+      "phenotype": "Intermediate metabolizer", "functions": [...],
+      "variants_called": 3, "variants_total": 3, "mismatches": 0,
+      "alternatives": ["*1B/*5"]
+    }
+    """
+    table = table or load_pgx_tables()[gene]
+    het, hom, called = _observed_masks(genome, table)
+    total = len(table["variants"])
+    n_called = bin(int(called)).count("1")
+    if not n_called:
+        return {"diplotype": None, "phenotype": None, "variants_called": 0, "variants_total": total}
+
+    wrong = ((table["hom"] ^ hom) | (table["het"] ^ het)) & called
+    mismatches = _popcount(wrong)
+    unobserved = _popcount(table["defined"] & ~called)
+    order = np.lexsort((unobserved, mismatches))
+    best = order[0]
+    tied = order[(mismatches[order] == mismatches[best]) & (unobserved[order] == unobserved[best])]
+
+    i, j = table["pairs"]
+    names = table["alleles"]
+    activity = float(table["activity"][best])
+    return {
+        "diplotype": f"{names[i[best]]}/{names[j[best]]}",
+        "activity_score": activity,
+        "phenotype": _phenotype(table, activity),
+        "functions": [table["functions"][i[best]], table["functions"][j[best]]],
+        "variants_called": n_called,
+        "variants_total": total,
+        "mismatches": int(mismatches[best]),
+        "alternatives": [f"{names[i[k]]}/{names[j[k]]}" for k in tied[1:].tolist()],
+    }
+
+
+def call_star_alleles(genome, genes=None):
+    """{ gene: call_gene(...) } for every gene in the definition tables."""
+    tables = load_pgx_tables()
+    return {gene: call_gene(genome, gene, tables[gene]) for gene in (genes or tables)}
@@ -0,0 +1,73 @@
+"""
+Per-population allele frequencies at the model loci
+(nih/population_freqs.csv), compiled once into numpy arrays.
+"""
+
+import csv
+import os
+
+import numpy as np
+
+from utils.genome_arrays import ALLELE_CODES
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FREQ_PATH = os.path.join(BASE_DIR, "nih", "population_freqs.csv")
+
+SUPERPOPULATIONS = ["AFR", "AMR", "EAS", "EUR", "SAS"]
+
+# 1000 Genomes sub-populations -> super-population column
+POPULATION_ALIASES = {
+    "YRI": "AFR", "LWK": "AFR", "GWD": "AFR", "MSL": "AFR", "ESN": "AFR", "ASW": "AFR", "ACB": "AFR",
+    "MXL": "AMR", "PUR": "AMR", "CLM": "AMR", "PEL": "AMR",
+    "CHB": "EAS", "JPT": "EAS", "CHS": "EAS", "CDX": "EAS", "KHV": "EAS",
+    "CEU": "EUR", "TSI": "EUR", "FIN": "EUR", "GBR": "EUR", "IBS": "EUR",
+    "GIH": "SAS", "PJL": "SAS", "BEB": "SAS", "STU": "SAS", "ITU": "SAS",
+}
+
+# Compiled once:
+# {
+#   "rsids": [...], "index": {rsid: i}, "genes": [...], "chroms": [...],
+#   "pos": int64[L], "ref": uint8[L], "alt": uint8[L],
+#   "freqs": { "EUR": float64[L], ... }   (alt allele frequency)
+# }
+FREQ_TABLE = {}
+
+
+def load_freq_table():
+    global FREQ_TABLE
+    if FREQ_TABLE:
+        return FREQ_TABLE
+
+    rows = []
+    with open(FREQ_PATH, "r") as f:
+        reader = csv.DictReader(f)
+        populations = [c for c in reader.fieldnames if c.isupper()]
+        for row in reader:
+            rows.append(row)
+
+    FREQ_TABLE = {
+        "rsids": [r["rsid"] for r in rows],
+        "index": {r["rsid"]: i for i, r in enumerate(rows)},
+        "genes": [r["gene"] for r in rows],
+        "chroms": [r["chrom"] for r in rows],
+        "pos": np.array([int(r["pos"]) for r in rows], dtype=np.int64),
+        "ref": np.array([ALLELE_CODES[r["ref"]] for r in rows], dtype=np.uint8),
+        "alt": np.array([ALLELE_CODES[r["alt"]] for r in rows], dtype=np.uint8),
+        "freqs": {
+            pop: np.array([float(r[pop]) for r in rows], dtype=np.float64)
+            for pop in populations
+        },
+    }
+    return FREQ_TABLE
+
+
+def resolve_population(population):
+    """Maps a population code to a frequency column (sub-populations fall back to their super-population)."""
+    table = load_freq_table()
+    code = (population or "").upper()
+    if code in table["freqs"]:
+        return code
+    alias = POPULATION_ALIASES.get(code)
+    if alias in table["freqs"]:
+        return alias
+    raise ValueError(f"Unknown population '{population}'")
@@ -1,6 +1,9 @@
 import csv
 import math
 
+from utils.allele_harmonizer import call_dosage
+from utils.pgs_catalog import score_installed
+
 GWAS_PATH = "../backend/nih/gwas_50k.csv"
 
 # Structure:
@@ -38,11 +41,9 @@ def load_gwas_table():
                 continue
 
 
-def allele_dosage(genotype: str, effect: str) -> int:
-    if not genotype:
-        return 0
-    g = genotype.replace("/", "").upper()
-    return g.count(effect)
+def allele_dosage(call, effect: str) -> int:
+    """call: genome entry (uses its harmonized dosage code) or genotype string."""
+    return call_dosage(call, effect)
 
 
 def compute_single_prs(genome, trait: str):
@@ -64,8 +65,7 @@ def compute_single_prs(genome, trait: str):
         if rsid not in genome:
             continue
 
-        g = genome[rsid]["genotype"]
-        dosage = allele_dosage(g, info["effect"])
+        dosage = allele_dosage(genome[rsid], info["effect"])
         score += info["beta"] * dosage
         contributing_snps += 1
 
@@ -87,7 +87,7 @@ def compute_single_prs(genome, trait: str):
     }
 
 
-def compute_prs(genome):
+def compute_prs(genome, pgs_ids=None):
     """
     Computes PRS for all major traits:
     - height
@@ -95,6 +95,8 @@ def compute_prs(genome):
     - diabetes
     - heart_disease
     - alzheimer_prs (NOT APOE)
+    plus the installed PGS Catalog scores (all, or `pgs_ids`), keyed by
+    PGS id (see pgs_catalog.score_pgs).
     """
 
     load_gwas_table()
@@ -107,4 +109,6 @@ def compute_prs(genome):
         prs = compute_single_prs(genome, trait)
         results[trait] = prs
 
+    results.update(score_installed(genome, pgs_ids))
+
     return results
@@ -0,0 +1,205 @@
+"""
+Genetic-map based recombination.
+
+Each SNP gets a centimorgan position, interpolated from a per-chromosome
+genetic map that is loaded once into cumulative cM arrays. Gametes are
+then drawn with crossovers as a Poisson process in cM space: crossover
+points are placed by binary search against the SNP cM positions, so a
+gamete is a handful of array operations regardless of how many SNPs the
+parent has.
+
+Map files (HapMap / IMPUTE "genetic_map_chr*.txt" layout, with a
+position column and a cumulative cM column) are read from
+nih/genetic_map/ when present. Without them each chromosome falls back
+to a uniform rate over its GRCh37 length.
+"""
+
+import glob
+import os
+
+import numpy as np
+
+from utils.genome_arrays import CHROM_CODES, encode_genome, key_to_rsid, rsid_key
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GENETIC_MAP_DIR = os.path.join(BASE_DIR, "nih", "genetic_map")
+
+# chrom -> (GRCh37 length in bp, sex-averaged map length in cM; X is female-only)
+CHROM_MAP_LENGTHS = {
+    "1": (249250621, 278), "2": (243199373, 264), "3": (198022430, 224),
+    "4": (191154276, 214), "5": (180915260, 209), "6": (171115067, 193),
+    "7": (159138663, 188), "8": (146364022, 171), "9": (141213431, 168),
+    "10": (135534747, 178), "11": (135006516, 158), "12": (133851895, 175),
+    "13": (115169878, 129), "14": (107349540, 127), "15": (102531392, 131),
+    "16": (90354753, 135), "17": (81195210, 132), "18": (78077248, 126),
+    "19": (59128983, 110), "20": (63025520, 103), "21": (48129895, 61),
+    "22": (51304566, 67), "X": (155270560, 183), "XY": (2699520, 50),
+    "Y": (59373566, 0), "MT": (16569, 0),
+}
+
+# Female meioses have ~1.7x more crossovers than male ones on the autosomes
+SEX_SCALE = {"female": 1.26, "male": 0.74}
+X_CODE = CHROM_CODES["X"]
+
+# chrom code -> (bp array, cumulative cM array)
+GENETIC_MAPS = {}
+
+_RNG = np.random.default_rng()
+
+
+# ---------------------------------------------------------
+# Map loading
+# ---------------------------------------------------------
+def _read_map_file(path):
+    """Reads a genetic map text file into (bp, cM) arrays."""
+    with open(path, "r") as f:
+        header = f.readline().lower().split()
+        pos_col = next(i for i, h in enumerate(header) if "pos" in h)
+        cm_col = next(i for i, h in enumerate(header) if "map" in h or h.endswith("cm)") or h == "cm")
+        rows = [line.split() for line in f if line.strip()]
+    bp = np.array([int(r[pos_col]) for r in rows], dtype=np.int64)
+    cm = np.array([float(r[cm_col]) for r in rows], dtype=np.float64)
+    order = np.argsort(bp)
+    return bp[order], cm[order]
+
+
+def load_genetic_map(chrom):
+    """(bp, cM) arrays for a chromosome name or code, loaded once."""
+    code = chrom if isinstance(chrom, (int, np.integer)) else CHROM_CODES.get(str(chrom).upper(), 0)
+    if code in GENETIC_MAPS:
+        return GENETIC_MAPS[code]
+
+    name = next((n for n, c in CHROM_CODES.items() if c == code), None)
+    genetic_map = None
+    if name is not None:
+        for path in sorted(glob.glob(os.path.join(GENETIC_MAP_DIR, f"genetic_map*chr{name}[._]*"))):
+            try:
+                genetic_map = _read_map_file(path)
+                break
+            except (OSError, StopIteration, ValueError, IndexError):
+                continue
+
+    if genetic_map is None:
+        length_bp, length_cm = CHROM_MAP_LENGTHS.get(name, (1, 0))
+        genetic_map = (
+            np.array([0, length_bp], dtype=np.int64),
+            np.array([0.0, float(length_cm)]),
+        )
+
+    GENETIC_MAPS[code] = genetic_map
+    return genetic_map
+
+
+def interpolate_cm(chrom, pos):
+    """cM position for every SNP (chrom codes + bp positions)."""
+    cm = np.zeros(len(pos), dtype=np.float64)
+    for code in np.unique(chrom):
+        mask = chrom == code
+        bp, cum_cm = load_genetic_map(int(code))
+        cm[mask] = np.interp(pos[mask], bp, cum_cm)
+    return cm
+
+
+def _sex_scale(code, sex):
+    if code == X_CODE:
+        # a father passes his single X on intact
+        return 0.0 if sex == "male" else 1.0
+    return SEX_SCALE.get(sex, 1.0)
+
+
+# ---------------------------------------------------------
+# Meiosis
+# ---------------------------------------------------------
+def _with_dict_calls(genome, arrays, idx, wanted):
+    """
+    Adds wanted loci a parsed genome holds in its dict only (calls
+    filled in after parsing, e.g. LD proxies) to its rows `idx`.
+    Returns (arrays, row index) for the combined rows.
+    """
+    absent = wanted[~np.isin(wanted, arrays["key"])]
+    calls = {}
+    for key in absent.tolist():
+        rsid = key_to_rsid(key)
+        if genome.get(rsid):
+            calls[rsid] = genome[rsid]
+    if not calls:
+        return arrays, idx
+
+    added = encode_genome(calls)
+    combined = {
+        name: np.concatenate((arrays[name][idx], added[name]))
+        for name in ("key", "chrom", "pos", "a1", "a2")
+    }
+    return combined, np.arange(len(combined["key"]))
+
+
+def meiosis_layout(genome, loci=None):
+    """
+    Precomputes everything gamete drawing needs, once per parent:
+    SNPs sorted by (chrom, pos), their cM positions, allele codes and
+    each chromosome's map length.
+    """
+    if loci is not None and getattr(genome, "arrays", None) is None:
+        # plain dict: encode just the requested loci, not the whole genome
+        genome = {rsid: genome[rsid] for rsid in loci if rsid in genome}
+
+    arrays = encode_genome(genome)
+    idx = np.arange(len(arrays["key"]))
+    if loci is not None:
+        wanted = np.unique(np.fromiter((rsid_key(r) for r in loci), dtype=np.int64))
+        idx = idx[np.isin(arrays["key"], wanted)]
+        if getattr(genome, "arrays", None) is not None:
+            arrays, idx = _with_dict_calls(genome, arrays, idx, wanted)
+
+    chrom = arrays["chrom"][idx]
+    pos = arrays["pos"][idx]
+    order = np.lexsort((pos, chrom))
+    idx = idx[order]
+    chrom = chrom[order]
+
+    cm = arrays["cm"][idx] if "cm" in arrays else interpolate_cm(chrom, arrays["pos"][idx])
+
+    codes, chrom_of = np.unique(chrom, return_inverse=True)
+    lengths = np.array([load_genetic_map(int(c))[1][-1] for c in codes], dtype=np.float64)
+
+    return {
+        "keys": arrays["key"][idx],
+        "a1": arrays["a1"][idx],
+        "a2": arrays["a2"][idx],
+        "cm": cm,
+        "chrom_codes": codes,
+        "chrom_of": chrom_of,
+        "lengths": lengths,
+    }
+
+
+def draw_gamete(layout, sex=None, rng=None):
+    """
+    Allele codes of one gamete (aligned with layout["keys"]).
+
+    Crossovers per chromosome ~ Poisson(map length in Morgans), placed
+    uniformly in cM. All chromosomes are laid end to end in one cM axis
+    so a single searchsorted counts the crossovers before every SNP.
+    """
+    rng = rng or _RNG
+    scale = np.array([_sex_scale(int(c), sex) for c in layout["chrom_codes"]])
+    lengths = layout["lengths"] * scale
+    offsets = np.concatenate(([0.0], np.cumsum(lengths)))[:-1]
+
+    n_xo = rng.poisson(lengths / 100.0)
+    xo = np.sort(
+        rng.random(int(n_xo.sum())) * np.repeat(lengths, n_xo) + np.repeat(offsets, n_xo)
+    )
+
+    chrom_of = layout["chrom_of"]
+    snp_cm = layout["cm"] * scale[chrom_of] + offsets[chrom_of]
+    crossed = np.searchsorted(xo, snp_cm) - np.searchsorted(xo, offsets)[chrom_of]
+    start = rng.integers(0, 2, len(lengths))[chrom_of]
+
+    side = (crossed + start) & 1
+    return np.where(side == 1, layout["a2"], layout["a1"])
+
+
+def layout_rsids(layout):
+    """rsID strings for a layout's SNPs, in layout order."""
+    return [key_to_rsid(int(k)) for k in layout["keys"]]
@@ -0,0 +1,109 @@
+"""
+GRCh37 positions of the reference loci (model loci, dbSNP-lite, GWAS,
+ClinVar), compiled once into a sorted (chrom, pos) index.
+
+Used to recover calls whose identifier is not the rsID the engines look
+up: vendor-internal IDs ("i5012345") and VCF records without an ID are
+matched to reference rsIDs by position with one sorted-merge join.
+
+Sources only contribute when they carry position columns; files keyed
+by rsID alone are skipped.
+"""
+
+import csv
+import gzip
+import os
+
+import numpy as np
+
+from utils.genome_arrays import chrom_code, locus_keys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# In priority order: the first source that places an rsID wins
+REFERENCE_SOURCES = [
+    os.path.join(BASE_DIR, "nih", "population_freqs.csv"),
+    os.path.join(BASE_DIR, "nih", "dbsnp_lite.csv"),
+    os.path.join(BASE_DIR, "nih", "gwas_50k.csv"),
+    os.path.join(BASE_DIR, "nih", "clinvar.gz"),
+]
+
+# Header names used by our CSVs, the GWAS Catalog and ClinVar variant_summary
+RSID_COLUMNS = ("rsid", "snps", "rs# (dbsnp)", "snp")
+CHROM_COLUMNS = ("chrom", "chr", "chromosome", "chr_id", "#chrom")
+POS_COLUMNS = ("pos", "position", "chr_pos", "positionvcf", "start", "bp")
+
+# Compiled once:
+# { "locus": int64[N] sorted (see genome_arrays.locus_keys), "rsids": [...] }
+REFERENCE_POSITIONS = {}
+
+
+def _column(header, names):
+    lowered = [h.strip().lower() for h in header]
+    for name in names:
+        if name in lowered:
+            return lowered.index(name)
+    return None
+
+
+def _read_source(path):
+    """Yields (rsid, chrom, pos) from one reference file."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="ignore") as f:
+        first = f.readline()
+        reader = csv.reader(f, delimiter="\t" if "\t" in first else ",")
+        header = next(csv.reader([first], delimiter="\t" if "\t" in first else ","))
+
+        rsid_col = _column(header, RSID_COLUMNS)
+        chrom_col = _column(header, CHROM_COLUMNS)
+        pos_col = _column(header, POS_COLUMNS)
+        if rsid_col is None or chrom_col is None or pos_col is None:
+            return
+        # ClinVar lists every variant once per assembly
+        assembly_col = _column(header, ("assembly",))
+        last = max(rsid_col, chrom_col, pos_col)
+
+        for row in reader:
+            if len(row) <= last:
+                continue
+            if assembly_col is not None and row[assembly_col] not in ("GRCh37", ""):
+                continue
+            rsid = row[rsid_col].strip()
+            if rsid.isdigit():
+                rsid = "rs" + rsid
+            pos = row[pos_col].strip()
+            if not rsid.startswith("rs") or not pos.isdigit():
+                continue
+            yield rsid, row[chrom_col], int(pos)
+
+
+def load_reference_positions():
+    global REFERENCE_POSITIONS
+    if REFERENCE_POSITIONS:
+        return REFERENCE_POSITIONS
+
+    seen = set()
+    rsids, chroms, positions = [], [], []
+    for path in REFERENCE_SOURCES:
+        if not os.path.exists(path):
+            continue
+        try:
+            for rsid, chrom, pos in _read_source(path):
+                if rsid in seen:
+                    continue
+                seen.add(rsid)
+                rsids.append(rsid)
+                chroms.append(chrom_code(chrom))
+                positions.append(pos)
+        except (OSError, csv.Error) as e:
+            print(f"Failed reading reference positions from {path}: {e}")
+
+    loci = locus_keys(np.array(chroms, dtype=np.int64), np.array(positions, dtype=np.int64))
+    keep = np.flatnonzero(loci)
+    keep = keep[np.argsort(loci[keep], kind="stable")]
+
+    REFERENCE_POSITIONS = {
+        "locus": loci[keep],
+        "rsids": [rsids[i] for i in keep],
+    }
+    return REFERENCE_POSITIONS
@@ -0,0 +1,84 @@
+"""
+Negotiated encodings for large result payloads.
+
+Bodies are JSON (compact separators) or MessagePack (Accept:
+application/msgpack or application/x-msgpack), compressed with brotli
+or gzip per Accept-Encoding when they are big enough to gain from it.
+brotli and msgpack are optional: without them the next best encoding
+is used.
+"""
+
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# smaller bodies are sent as they are
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _accepted(header):
+    """{ token: q } of an Accept / Accept-Encoding header."""
+    accepted = {}
+    for item in (header or "").split(","):
+        token, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if token:
+            accepted[token.strip().lower()] = q
+    return accepted
+
+
+def negotiate(accept, accept_encoding):
+    """(media type, content encoding or None) for the request headers."""
+    types = _accepted(accept)
+    media = "application/json"
+    if msgpack is not None:
+        best = max(MSGPACK_TYPES, key=lambda t: types.get(t, 0))
+        if types.get(best, 0) > types.get("application/json", 0):
+            media = best
+
+    # brotli wins ties with gzip
+    encodings = _accepted(accept_encoding)
+    available = ("br", "gzip") if brotli is not None else ("gzip",)
+    q = {e: encodings.get(e, encodings.get("*", 0)) for e in available}
+    encoding = max(available, key=q.get)
+    return media, (encoding if q[encoding] > 0 else None)
+
+
+def encode_payload(payload, accept=None, accept_encoding=None):
+    """
+    (body bytes, headers) of a JSON-safe payload, negotiated as above.
+    """
+    media, encoding = negotiate(accept, accept_encoding)
+    if media in MSGPACK_TYPES:
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+
+    headers = {"Content-Type": media, "Vary": "Accept, Accept-Encoding"}
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = encoding
+    return body, headers
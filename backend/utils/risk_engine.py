@@ -1,5 +1,5 @@
 from utils.prs_engine import compute_prs
-from utils.carrier_engine import detect_carrier_status
+from utils.carrier_engine import DOMINANT_GENES, GENE_PANELS, detect_carrier_status
 from utils.apoe import compute_apoe_genotype
 
 
@@ -11,6 +11,15 @@ from utils.apoe import compute_apoe_genotype
 # - Recessive carrier → no risk unless homozygous
 # -------------------------------------------------------------
 
+# Loci read directly by the health engines (ClinVar and PRS tables aside)
+TARGETED_LOCI = ["rs429358", "rs7412", "rs2187668", "rs7454108", "rs699", "rs1800562", "rs1799945"]
+HEALTH_LOCI = sorted(
+    set(TARGETED_LOCI)
+    | {rsid for snps in GENE_PANELS.values() for rsid in snps}
+    | {rsid for snps in DOMINANT_GENES.values() for rsid in snps}
+)
+
+
 def prs_category(percentile: float):
     """
     Convert PRS percentile → risk category.
@@ -69,7 +78,7 @@ def allele_risk_label(genome, rsid, risk_allele):
 # Final Risk Engine (Main Output)
 # -------------------------------------------------------------
 
-def compute_health_risk(genome):
+def compute_health_risk(genome, prs=None, carriers_info=None, apoe=None):
     """
     Integrates:
     - PRS
@@ -77,18 +86,25 @@ def compute_health_risk(genome):
     - ClinVar pathogenic variants
     - Carrier screening
     Returns master health summary.
+
+    prs / carriers_info / apoe: results of compute_prs,
+    detect_carrier_status and compute_apoe_genotype when the caller
+    already has them (e.g. streamed one by one), so they are not redone.
     """
 
     # 1. Get PRS
-    prs = compute_prs(genome)
+    if prs is None:
+        prs = compute_prs(genome)
 
     # 2. ClinVar: carriers + dominant pathogenic mutations
-    carriers_info = detect_carrier_status(genome)
+    if carriers_info is None:
+        carriers_info = detect_carrier_status(genome)
     carrier_list = carriers_info["carriers"]
     dominant_list = carriers_info["dominant_variants"]
 
     # 3. APOE risk
-    apoe = compute_apoe_genotype(genome)
+    if apoe is None:
+        apoe = compute_apoe_genotype(genome)
     alz_risk = apoe_risk(apoe)
 
     # ---------------------------------------------------------
@@ -0,0 +1,155 @@
+"""
+Merged / retired rsIDs.
+
+dbSNP merges rsIDs that turn out to be the same variant, and older chip
+exports still carry the retired ones, so their calls miss every table
+keyed by the current rsID. The merge history is compiled once into a
+sorted array pair (nih/rsid_merges.npy, memory-mapped):
+
+    row 0  old rsID keys, sorted (see genome_arrays.rsid_key)
+    row 1  current rsID keys (merge chains already followed)
+    row 2  1 where the current rsID is on the opposite strand
+
+Sources, in priority order (the first to list an old rsID wins):
+
+- nih/rsid_merges.csv       old,current[,flipped]
+- nih/RsMergeArch.bcp.gz    dbSNP merge archive (rsHigh, rsLow, ...,
+                            rsCurrent, orien2Current)
+
+The parser renames merged calls once per file, with one sorted join
+over the keys it computes anyway (see dna_parser).
+"""
+
+import csv
+import gzip
+import os
+
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_LETTERS
+from utils.genome_arrays import join_sorted, key_to_rsid, rsid_key
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MERGE_INDEX_PATH = os.path.join(BASE_DIR, "nih", "rsid_merges.npy")
+MERGE_SOURCES = [
+    os.path.join(BASE_DIR, "nih", "rsid_merges.csv"),
+    os.path.join(BASE_DIR, "nih", "RsMergeArch.bcp.gz"),
+]
+
+# merge chains longer than this are cut (dbSNP's are a few steps)
+MAX_CHAIN = 16
+
+# Loaded once (see module docstring); empty when no source ships
+RSID_MERGES = {}
+
+
+def _read_source(path):
+    """Yields (old key, current key, flipped) from one merge source."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="ignore") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                old = rsid_key((row.get("old") or "").strip())
+                current = rsid_key((row.get("current") or "").strip())
+                yield old, current, (row.get("flipped") or "").strip() in ("1", "true", "True")
+            return
+
+        for row in csv.reader(f, delimiter="\t"):
+            if len(row) < 2:
+                continue
+            try:
+                old = int(row[0])
+                current = int(row[6]) if len(row) > 6 and row[6] else int(row[1])
+            except ValueError:
+                continue
+            yield old, current, len(row) > 7 and row[7].strip() == "1"
+
+
+def compile_rsid_merges():
+    seen = set()
+    olds, currents, flips = [], [], []
+    for path in MERGE_SOURCES:
+        if not os.path.exists(path):
+            continue
+        try:
+            for old, current, flipped in _read_source(path):
+                if old <= 0 or current <= 0 or old == current or old in seen:
+                    continue
+                seen.add(old)
+                olds.append(old)
+                currents.append(current)
+                flips.append(flipped)
+        except (OSError, csv.Error) as e:
+            print(f"Failed reading rsID merges from {path}: {e}")
+
+    old = np.array(olds, dtype=np.int64)
+    order = np.argsort(old, kind="stable")
+    old = old[order]
+    current = np.array(currents, dtype=np.int64)[order]
+    flip = np.array(flips, dtype=np.int64)[order]
+
+    # follow chains (a -> b, b -> c) so every old key maps straight to
+    # the current rsID
+    for _ in range(MAX_CHAIN):
+        at, hits = join_sorted(old, current)
+        if not len(hits):
+            break
+        current[hits] = current[at]
+        flip[hits] ^= flip[at]
+
+    merges = np.vstack((old, current, flip))
+    try:
+        np.save(MERGE_INDEX_PATH, merges)
+    except OSError:
+        pass
+    return merges
+
+
+def load_rsid_merges():
+    global RSID_MERGES
+    if RSID_MERGES:
+        return RSID_MERGES
+
+    sources = [p for p in MERGE_SOURCES if os.path.exists(p)]
+    if os.path.exists(MERGE_INDEX_PATH) and all(
+        os.path.getmtime(MERGE_INDEX_PATH) >= os.path.getmtime(p) for p in sources
+    ):
+        merges = np.load(MERGE_INDEX_PATH, mmap_mode="r")
+    elif sources:
+        merges = compile_rsid_merges()
+    else:
+        merges = np.zeros((3, 0), dtype=np.int64)
+
+    RSID_MERGES = {"old": merges[0], "current": merges[1], "flip": merges[2]}
+    return RSID_MERGES
+
+
+def remap_merged_rsids(genome, rsids, keys, genotypes):
+    """
+    Renames calls under merged rsIDs to the current rsID, in the genome
+    dict and in the parser's parallel lists / key array (all in place).
+    A call whose current rsID the file also carries keeps its old name.
+    Returns the number of calls renamed.
+    """
+    merges = load_rsid_merges()
+    if not len(merges["old"]) or not len(keys):
+        return 0
+
+    at, hits = join_sorted(merges["old"], keys)
+    renamed = 0
+    for i, current, flip in zip(hits.tolist(), merges["current"][at].tolist(), merges["flip"][at].tolist()):
+        new = key_to_rsid(current)
+        if new in genome:
+            continue
+        old = rsids[i]
+        if flip:
+            genotypes[i] = genotypes[i].translate(COMPLEMENT_LETTERS)
+        info = genome.pop(old, None)
+        if info is not None:
+            info["genotype"] = genotypes[i]
+            info["merged_from"] = old
+            genome[new] = info
+        rsids[i] = new
+        keys[i] = current
+        renamed += 1
+    return renamed
@@ -0,0 +1,171 @@
+"""
+Session-scoped genome handles.
+
+An upload is parsed once; the parsed genome and everything computed
+from it stay in process under its genome id (the same id genome_store
+persists it under), so follow-up requests (child prediction, partner
+simulation, PDF report) pass the id instead of re-sending files or
+result JSON:
+
+    { genome id: {
+        "genome":  parsed Genome,
+        "results": { name: computed result },
+        "bytes":   estimated size,
+        "touched": last use (time.time())
+    } }
+
+A genome id expires SESSION_TTL seconds after its last use: the session
+and its stored copy are dropped together (every use also counts for the
+store, see genome_store.STORE_TTL), and the id answers UnknownGenome
+from then on; delete_genome ends one on request. Under memory pressure the least recently
+used sessions go first (past MAX_SESSION_BYTES); such an id still
+resolves, the genome being rebuilt from the 2-bit store (no parsing)
+and only the results computed again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from utils.dna_parser import Genome
+from utils.genome_store import (
+    STORE_TTL,
+    delete_stored_genome,
+    load_stored_genome,
+    stored_arrays,
+    touch_stored_genome,
+)
+from utils.ld_proxies import fill_from_proxies
+
+SESSION_TTL = STORE_TTL
+MAX_SESSION_BYTES = 1 << 30
+MAX_SESSIONS = 64
+
+# rough per-call cost of the genome dict (entry, info dict, strings)
+DICT_ENTRY_BYTES = 420
+
+_SESSIONS = OrderedDict()
+_SESSION_LOCK = threading.Lock()
+
+
+class UnknownGenome(KeyError):
+    """A genome id that is neither in session nor in the store."""
+
+
+def genome_nbytes(genome):
+    arrays = getattr(genome, "arrays", None) or {}
+    return len(genome) * DICT_ENTRY_BYTES + sum(getattr(a, "nbytes", 0) for a in arrays.values())
+
+
+def _expire(genome_id):
+    """Ends a genome id: its session and its stored copy. False when it had neither."""
+    had_session = _SESSIONS.pop(genome_id, None) is not None
+    return delete_stored_genome(genome_id) or had_session
+
+
+def _evict(now):
+    """Expires idle genome ids, then drops the least recently used sessions while over budget."""
+    for genome_id in [g for g, s in _SESSIONS.items() if now - s["touched"] > SESSION_TTL]:
+        _expire(genome_id)
+    total = sum(s["bytes"] for s in _SESSIONS.values())
+    while _SESSIONS and (total > MAX_SESSION_BYTES or len(_SESSIONS) > MAX_SESSIONS):
+        _, session = _SESSIONS.popitem(last=False)
+        total -= session["bytes"]
+
+
+def _open(genome_id, genome, results):
+    now = time.time()
+    session = {
+        "genome": genome,
+        "results": dict(results or {}),
+        "bytes": genome_nbytes(genome),
+        "touched": now,
+    }
+    with _SESSION_LOCK:
+        _SESSIONS[genome_id] = session
+        _SESSIONS.move_to_end(genome_id)
+        _evict(now)
+    return session
+
+
+def open_session(genome_id, genome, results=None):
+    """Keeps a parsed genome (and results already computed for it) under its id."""
+    _open(genome_id, genome, results)
+    return genome_id
+
+
+def _restore(genome_id):
+    """
+    Session rebuilt from the persistent store: arrays, positional calls
+    and QC reports as at upload, proxies filled again.
+    """
+    try:
+        _, _, meta = load_stored_genome(genome_id)
+        arrays = stored_arrays(genome_id)
+    except KeyError:
+        raise UnknownGenome(genome_id)
+    build = meta.get("build")
+    source = "panel" if meta.get("source") == "panel" else "given"
+    genome = Genome.from_arrays(
+        arrays,
+        extra=meta.get("positional"),
+        build={"detected": build, "source": source, "positions": build, "unmapped": 0} if build else None,
+    )
+    genome.qc = meta.get("qc")
+    results = {"proxies": fill_from_proxies(genome)}
+    if meta.get("qc_reports") is not None:
+        results["qc"] = meta["qc_reports"]
+    return _open(genome_id, genome, results)
+
+
+def get_session(genome_id):
+    """The session of a genome id, reopened from the store if evicted. UnknownGenome otherwise."""
+    now = time.time()
+    with _SESSION_LOCK:
+        session = _SESSIONS.get(genome_id)
+        if session is not None and now - session["touched"] > SESSION_TTL:
+            _expire(genome_id)
+            raise UnknownGenome(genome_id)
+        if session is not None:
+            session["touched"] = now
+            _SESSIONS.move_to_end(genome_id)
+    if session is not None:
+        touch_stored_genome(genome_id)
+        return session
+
+    return _restore(genome_id)
+
+
+def touch_session(genome_id):
+    """Counts a use of a genome id that does not need its session (e.g. /snp lookups)."""
+    now = time.time()
+    with _SESSION_LOCK:
+        session = _SESSIONS.get(genome_id)
+        if session is not None and now - session["touched"] > SESSION_TTL:
+            _expire(genome_id)
+        elif session is not None:
+            session["touched"] = now
+
+
+def session_genome(genome_id):
+    return get_session(genome_id)["genome"]
+
+
+def session_result(genome_id, name, compute):
+    """Result `name` of a session, computed from its genome on first use."""
+    session = get_session(genome_id)
+    results = session["results"]
+    if name not in results:
+        results[name] = compute(session["genome"])
+    return results[name]
+
+
+def delete_genome(genome_id):
+    """Ends a genome id at its owner's request (see _expire)."""
+    with _SESSION_LOCK:
+        return _expire(genome_id)
+
+
+def close_session(genome_id):
+    with _SESSION_LOCK:
+        return _SESSIONS.pop(genome_id, None) is not None
@@ -0,0 +1,247 @@
+"""
+Sparse genomes for partners described by hand (a few traits or
+genotypes) instead of an uploaded file.
+
+A SparseGenome only holds the loci that were explicitly specified.
+Every other locus is either unknown or, when a population is attached,
+drawn from that population's allele frequencies whenever a gamete is
+formed (see child_predictor).
+"""
+
+import itertools
+import random
+
+import numpy as np
+
+from utils.allele_harmonizer import COMPLEMENT_LETTERS
+from utils.genome_arrays import ALLELE_LETTERS, genotype_codes
+from utils.hirisplex_model import HAIR_MODEL, SKIN_MODEL, predict_hair, predict_skin
+from utils.population_freqs import load_freq_table, resolve_population
+
+# ---------------------------------------------------------
+# Manual trait choices -> most likely genotypes at the driver loci
+# (options mirror the frontend ManualPartnerPage)
+# ---------------------------------------------------------
+TRAIT_GENOTYPES = {
+    "eye_color": {
+        "Blue": {"rs12913832": "G/G", "rs1129038": "T/T"},
+        "Green": {"rs12913832": "G/G", "rs1800407": "C/T"},
+        "Hazel": {"rs12913832": "A/G", "rs12203592": "C/T"},
+        "Brown": {"rs12913832": "A/A"},
+    },
+    "freckling": {
+        "High": {"rs12203592": "T/T"},
+        "Medium": {"rs12203592": "C/T"},
+        "Low": {"rs12203592": "C/C"},
+    },
+    "tanning": {
+        "Burns easily": {"rs1805007": "C/T", "rs1805008": "C/T"},
+        "Mixed": {"rs1805007": "C/T"},
+        "Tans easily": {"rs1805007": "C/C", "rs1805008": "C/C"},
+    },
+}
+
+# Hair and skin choices are derived from the HIrisPlex-S models (see
+# model_genotypes): trait -> (predictor, choice -> label, model loci)
+MODEL_TRAITS = {
+    "hair_color": (predict_hair, {"Red": "Red", "Blonde": "Blond", "Brown": "Brown", "Black": "Black"},
+                   [snp for model in HAIR_MODEL.values() for snp in model["snps"].items()]),
+    "skin_color": (predict_skin, {"Light": "Light", "Medium": "Medium", "Dark": "Dark"},
+                   list(SKIN_MODEL["snps"].items())),
+}
+
+# (trait, choice, fixed genotypes) -> { rsid: genotype } (see model_genotypes)
+MODEL_TRAIT_GENOTYPES = {}
+
+# Earlier traits win when two choices imply different genotypes
+TRAIT_PRIORITY = ["eye_color", "hair_color", "skin_color", "freckling", "tanning"]
+
+
+class SparseGenome(dict):
+    """
+    dict of explicitly specified loci (same shape as a parsed genome).
+
+    population: frequency column used to impute unspecified loci,
+                or None to leave them unknown.
+    """
+
+    def __init__(self, calls=None, population=None):
+        super().__init__(calls or {})
+        self.population = resolve_population(population) if population else None
+        # loci tuple -> [(rsid, alt freq, ref, alt)] for unspecified loci
+        self._impute_plans = {}
+
+    def sample_alleles(self, loci, rng=random):
+        """
+        Draws one allele per unspecified locus in `loci` from the
+        population frequencies. Loci that cannot be imputed are omitted.
+        """
+        if self.population is None:
+            return {}
+        plan = self._impute_plans.get(loci)
+        if plan is None:
+            plan = self._impute_plans[loci] = self._impute_plan(loci)
+        return {rsid: alt if rng.random() < p else ref for rsid, p, ref, alt in plan}
+
+    def _impute_plan(self, loci):
+        table = load_freq_table()
+        freqs = table["freqs"][self.population]
+        plan = []
+        for rsid in loci:
+            i = table["index"].get(rsid)
+            if rsid in self or i is None:
+                continue
+            plan.append((
+                rsid,
+                float(freqs[i]),
+                ALLELE_LETTERS[table["ref"][i]],
+                ALLELE_LETTERS[table["alt"][i]],
+            ))
+        return plan
+
+
+# ---------------------------------------------------------
+# Builders
+# ---------------------------------------------------------
+def _locus_genotypes(table, rsid, effect):
+    """
+    (genotype, pooled Hardy-Weinberg probability) for 0-2 copies of a
+    model's effect allele, on the table's strand; None when the table
+    lacks the locus or the effect allele fits neither of its alleles.
+    """
+    i = table["index"].get(rsid)
+    if i is None:
+        return None
+    ref, alt = ALLELE_LETTERS[table["ref"][i]], ALLELE_LETTERS[table["alt"][i]]
+    if effect not in (ref, alt):
+        effect = effect.translate(COMPLEMENT_LETTERS)
+    if effect not in (ref, alt):
+        return None
+    other = ref if effect == alt else alt
+    p = float(np.mean([f[i] for f in table["freqs"].values()]))
+    if effect == ref:
+        p = 1 - p
+    return [
+        ("/".join(sorted(other * (2 - d) + effect * d)), prob)
+        for d, prob in enumerate(((1 - p) ** 2, 2 * p * (1 - p), p ** 2))
+    ]
+
+
+def _model_loci(trait):
+    """rsid -> genotype options (see _locus_genotypes) of a trait model's usable loci."""
+    table = load_freq_table()
+    loci = {}
+    for rsid, (effect, _) in MODEL_TRAITS[trait][2]:
+        options = _locus_genotypes(table, rsid, effect)
+        if options and rsid not in loci:
+            loci[rsid] = options
+    return loci
+
+
+def _model_candidates(trait, choice, fixed):
+    """
+    Genotypes at a hair / skin model's loci that the model itself
+    predicts as `choice`, most likely (pooled Hardy-Weinberg) first.
+    Loci in `fixed` are kept and not returned.
+    """
+    predict, labels, _ = MODEL_TRAITS[trait]
+    loci = _model_loci(trait)
+    free = [rsid for rsid in loci if rsid not in fixed]
+    combos = sorted(
+        itertools.product(*(loci[rsid] for rsid in free)),
+        key=lambda combo: -np.prod([prob for _, prob in combo]),
+    )
+    for combo in combos:
+        genotypes = dict(zip(free, (genotype for genotype, _ in combo)))
+        calls = {rsid: fixed[rsid] for rsid in loci if rsid in fixed}
+        if predict(sparse_genome_from_calls({**calls, **genotypes}), marginalize=False)["result"] == labels[choice]:
+            yield genotypes
+
+
+def model_genotypes(trait, choice, fixed=None):
+    """
+    Most likely genotypes for a hair / skin choice (see
+    _model_candidates), so a partner described as blonde is predicted
+    blonde; None when no combination reaches it.
+    """
+    loci = _model_loci(trait)
+    fixed = {rsid: genotype for rsid, genotype in (fixed or {}).items() if rsid in loci}
+    key = (trait, choice, tuple(sorted(fixed.items())))
+    if key not in MODEL_TRAIT_GENOTYPES:
+        MODEL_TRAIT_GENOTYPES[key] = next(_model_candidates(trait, choice, fixed), None)
+    return MODEL_TRAIT_GENOTYPES[key]
+
+
+def _joint_model_genotypes(choices, fixed):
+    """
+    Genotypes for [(trait, choice), ...] in priority order such that
+    every choice is predicted: each trait takes its most likely
+    genotypes that leave the later choices reachable. None if none do.
+    """
+    if not choices:
+        return {}
+    (trait, choice), rest = choices[0], choices[1:]
+    if not rest:
+        return model_genotypes(trait, choice, fixed)
+    for genotypes in _model_candidates(trait, choice, fixed):
+        later = _joint_model_genotypes(rest, {**fixed, **genotypes})
+        if later is not None:
+            return {**genotypes, **later}
+    return None
+
+
+def sparse_genome_from_calls(genotypes, population=None):
+    """
+    { "rs12913832": "G/G", ... } -> SparseGenome with chrom/pos filled
+    in, plus ref/alt/dosage like a harmonized call where the genotype
+    fits the frequency table's alleles.
+    """
+    table = load_freq_table()
+    calls = {}
+    for rsid, genotype in genotypes.items():
+        i = table["index"].get(rsid)
+        calls[rsid] = {
+            "genotype": genotype,
+            "chrom": table["chroms"][i] if i is not None else None,
+            "pos": int(table["pos"][i]) if i is not None else 0,
+        }
+        codes = genotype_codes(genotype)
+        if i is not None and codes[0] and set(codes) <= {table["ref"][i], table["alt"][i]}:
+            calls[rsid].update(
+                ref=ALLELE_LETTERS[table["ref"][i]],
+                alt=ALLELE_LETTERS[table["alt"][i]],
+                dosage=codes.count(table["alt"][i]),
+            )
+    return SparseGenome(calls, population=population)
+
+
+def sparse_genome_from_traits(traits, population=None):
+    """
+    traits: { "eye_color": "Blue", "hair_color": "Red", ... }
+    Unrecognised traits or options are ignored.
+    """
+    traits = traits or {}
+    chosen = [(trait, traits.get(trait)) for trait in TRAIT_PRIORITY]
+    modelled = [(trait, choice) for trait, choice in chosen
+                if trait in MODEL_TRAITS and choice in MODEL_TRAITS[trait][1]]
+
+    genotypes = {}
+    for trait, choice in chosen:
+        if (trait, choice) in modelled:
+            if modelled[0] != (trait, choice):
+                continue
+            # hair / skin together, given the choices before them when possible
+            implied = _joint_model_genotypes(modelled, genotypes)
+            if implied is None:
+                implied = {}
+                for other in modelled:
+                    alone = model_genotypes(*other)
+                    if alone is None:
+                        raise ValueError(f"The {other[0]} model cannot predict '{other[1]}'")
+                    for rsid, genotype in alone.items():
+                        implied.setdefault(rsid, genotype)
+        else:
+            implied = TRAIT_GENOTYPES.get(trait, {}).get(choice, {})
+        for rsid, genotype in implied.items():
+            genotypes.setdefault(rsid, genotype)
+    return sparse_genome_from_calls(genotypes, population=population)
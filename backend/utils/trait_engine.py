@@ -1,14 +1,51 @@
-from utils.hirisplex_model import hirisplex_predict
+from utils.hirisplex_model import (
+    EYE_MODEL,
+    HAIR_MODEL,
+    SKIN_MODEL,
+    hirisplex_predict,
+    predict_eye,
+    predict_hair,
+    predict_skin,
+)
 from utils.apoe import compute_apoe_genotype
+from utils.allele_harmonizer import COMPLEMENT_CODES, call_dosage
+from utils.genome_arrays import ALLELE_CODES, genotype_codes
 
 # ---------------------------------------------------------
 #  Helper: count effect allele dosage
 # ---------------------------------------------------------
-def dosage(genotype: str, allele: str) -> int:
-    if not genotype:
-        return 0
-    g = genotype.replace("/", "").upper()
-    return g.count(allele.upper())
+def dosage(call, allele: str) -> int:
+    """call: genome entry (uses its harmonized dosage code) or genotype string."""
+    return call_dosage(call, allele)
+
+
+def allele_count(genome, rsid, allele, other):
+    """
+    Copies (0-2) of `allele` at a biallelic allele/other SNP, read on
+    whichever strand the call fits (harmonized calls answer from their
+    dosage code); None when the SNP is missing, uncalled or fits neither.
+    """
+    call = genome.get(rsid)
+    if not call:
+        return None
+    if call.get("dosage") is not None:
+        return call_dosage(call, allele)
+
+    a1, a2 = genotype_codes(call.get("genotype"))
+    if not a1:
+        return None
+    effect, wanted = ALLELE_CODES[allele], {ALLELE_CODES[allele], ALLELE_CODES[other]}
+    if not {a1, a2} <= wanted:
+        a1, a2 = int(COMPLEMENT_CODES[a1]), int(COMPLEMENT_CODES[a2])
+        if not {a1, a2} <= wanted:
+            return None
+    return (a1 == effect) + (a2 == effect)
+
+
+def dosage_label(genome, rsid, allele, other, labels):
+    """labels[n] for n copies of `allele` (see allele_count); "Unknown" if uncalled."""
+    count = allele_count(genome, rsid, allele, other)
+    return "Unknown" if count is None else labels[count]
 
 
 # ---------------------------------------------------------
@@ -25,15 +62,15 @@ def predict_freckling(genome):
     # MC1R red-hair pathway -> freckles
     for snp in ["rs1805007", "rs1805008", "rs1805009"]:
         if snp in genome:
-            score += dosage(genome[snp]["genotype"], "T") * 1.2
+            score += dosage(genome[snp], "T") * 1.2
 
     # IRF4 enhancer
     if "rs12203592" in genome:
-        score += dosage(genome["rs12203592"]["genotype"], "T") * 0.9
+        score += dosage(genome["rs12203592"], "T") * 0.9
 
     # OCA2 modifier
     if "rs12913832" in genome:
-        score += dosage(genome["rs12913832"]["genotype"], "G") * 0.4
+        score += dosage(genome["rs12913832"], "G") * 0.4
 
     if score < 1.0:
         return "Low"
@@ -58,14 +95,14 @@ def predict_tanning(genome):
 
     # Darker pigmentation SNPs -> easier tanning
     if "rs16891982" in genome:
-        score += dosage(genome["rs16891982"]["genotype"], "C") * 1.1
+        score += dosage(genome["rs16891982"], "C") * 1.1
     if "rs1426654" in genome:
-        score += dosage(genome["rs1426654"]["genotype"], "A") * 1.3
+        score += dosage(genome["rs1426654"], "A") * 1.3
 
     # MC1R -> burns easily
     for snp in ["rs1805007", "rs1805008", "rs1805009"]:
         if snp in genome:
-            score -= dosage(genome[snp]["genotype"], "T") * 1.2
+            score -= dosage(genome[snp], "T") * 1.2
 
     if score < -0.5:
         return "Burns Easily"
@@ -90,15 +127,15 @@ def predict_face(genome):
 
     # Nose width – rs4648379 GLI3
     if "rs4648379" in genome:
-        nose_score += dosage(genome["rs4648379"]["genotype"], "A") * 1.2
+        nose_score += dosage(genome["rs4648379"], "A") * 1.2
 
     # Lip fullness – rs11807848
     if "rs11807848" in genome:
-        lip_score += dosage(genome["rs11807848"]["genotype"], "T") * 1.1
+        lip_score += dosage(genome["rs11807848"], "T") * 1.1
 
     # Cheek prominence – rs3827760 EDAR
     if "rs3827760" in genome:
-        cheek_score += dosage(genome["rs3827760"]["genotype"], "G") * 1.4
+        cheek_score += dosage(genome["rs3827760"], "G") * 1.4
 
     def label(score, low, mid):
         if score < low:
@@ -122,17 +159,11 @@ def predict_lactose(genome):
     - T allele enables lactase persistence (tolerance)
     - CC associated with intolerance
     """
-    key = "rs4988235"
-    if key not in genome:
-        return "Unknown"
-    geno = (genome[key].get("genotype") or "").replace("/", "").upper()
-    if "T" in geno:
-        if geno.count("T") == 2:
-            return "Likely tolerant (TT)"
-        return "Tolerant carrier (CT)"
-    if geno == "CC":
-        return "Likely lactose sensitive (CC)"
-    return "Unknown"
+    # strand-independent: the call's dosage code reads T on the minus
+    # strand as A on the plus strand (see allele_harmonizer)
+    return dosage_label(genome, "rs4988235", "T", "C", [
+        "Likely lactose sensitive (CC)", "Tolerant carrier (CT)", "Likely tolerant (TT)",
+    ])
 
 
 # ---------------------------------------------------------
@@ -144,17 +175,9 @@ def predict_caffeine(genome):
     AC: intermediate
     CC: slow metabolizer (more sensitive)
     """
-    key = "rs762551"
-    if key not in genome:
-        return "Unknown"
-    geno = (genome[key].get("genotype") or "").replace("/", "").upper()
-    if geno == "AA":
-        return "Fast metabolizer"
-    if geno in ("AC", "CA"):
-        return "Intermediate"
-    if geno == "CC":
-        return "Slow / sensitive"
-    return "Unknown"
+    return dosage_label(genome, "rs762551", "A", "C", [
+        "Slow / sensitive", "Intermediate", "Fast metabolizer",
+    ])
 
 
 # ---------------------------------------------------------
@@ -166,17 +189,9 @@ def predict_muscle(genome):
     CT: mixed
     TT: endurance leaning
     """
-    key = "rs1815739"
-    if key not in genome:
-        return "Unknown"
-    geno = (genome[key].get("genotype") or "").replace("/", "").upper()
-    if geno == "CC":
-        return "Power / sprint"
-    if geno in ("CT", "TC"):
-        return "Mixed"
-    if geno == "TT":
-        return "Endurance leaning"
-    return "Unknown"
+    return dosage_label(genome, "rs1815739", "T", "C", [
+        "Power / sprint", "Mixed", "Endurance leaning",
+    ])
 
 
 # ---------------------------------------------------------
@@ -186,17 +201,9 @@ def predict_alcohol_flush(genome):
     """
     ALDH2*2 (A allele) reduces acetaldehyde clearance -> flushing.
     """
-    key = "rs671"
-    if key not in genome:
-        return "Unknown"
-    geno = (genome[key].get("genotype") or "").replace("/", "").upper()
-    if geno == "GG":
-        return "No flush predisposition"
-    if geno in ("AG", "GA"):
-        return "Likely flush (heterozygous)"
-    if geno == "AA":
-        return "Strong flush (homozygous)"
-    return "Unknown"
+    return dosage_label(genome, "rs671", "A", "G", [
+        "No flush predisposition", "Likely flush (heterozygous)", "Strong flush (homozygous)",
+    ])
 
 
 # ---------------------------------------------------------
@@ -208,17 +215,9 @@ def predict_nicotine(genome):
     AG: moderate
     GG: lower
     """
-    key = "rs16969968"
-    if key not in genome:
-        return "Unknown"
-    geno = (genome[key].get("genotype") or "").replace("/", "").upper()
-    if geno == "AA":
-        return "Higher dependence risk"
-    if geno in ("AG", "GA"):
-        return "Moderate dependence risk"
-    if geno == "GG":
-        return "Lower dependence risk"
-    return "Unknown"
+    return dosage_label(genome, "rs16969968", "A", "G", [
+        "Lower dependence risk", "Moderate dependence risk", "Higher dependence risk",
+    ])
 
 
 # ---------------------------------------------------------
@@ -230,17 +229,39 @@ def predict_folate(genome):
     CT: mildly reduced
     CC: typical
     """
-    key = "rs1801133"
-    if key not in genome:
-        return "Unknown"
-    geno = (genome[key].get("genotype") or "").replace("/", "").upper()
-    if geno == "TT":
-        return "Reduced activity (TT)"
-    if geno in ("CT", "TC"):
-        return "Slightly reduced (CT)"
-    if geno == "CC":
-        return "Typical activity (CC)"
-    return "Unknown"
+    return dosage_label(genome, "rs1801133", "T", "C", [
+        "Typical activity (CC)", "Slightly reduced (CT)", "Reduced activity (TT)",
+    ])
+
+
+# ---------------------------------------------------------
+#  Trait registry: model function + the loci it reads
+#  (lets simulators evaluate one trait on just its own loci)
+# ---------------------------------------------------------
+def _model_loci(*models):
+    return sorted({rsid for model in models for rsid in model["snps"]})
+
+
+MC1R_RED = ["rs1805007", "rs1805008", "rs1805009"]
+
+TRAIT_MODELS = {
+    "eye_color": (predict_eye, _model_loci(*EYE_MODEL.values())),
+    "hair_color": (predict_hair, _model_loci(*HAIR_MODEL.values())),
+    "skin_color": (predict_skin, _model_loci(SKIN_MODEL)),
+    "freckling": (predict_freckling, MC1R_RED + ["rs12203592", "rs12913832"]),
+    "tanning_response": (predict_tanning, MC1R_RED + ["rs16891982", "rs1426654"]),
+    "face_shape": (predict_face, ["rs4648379", "rs11807848", "rs3827760"]),
+    "lactose_tolerance": (predict_lactose, ["rs4988235"]),
+    "caffeine_metabolism": (predict_caffeine, ["rs762551"]),
+    "muscle_performance": (predict_muscle, ["rs1815739"]),
+    "alcohol_flush": (predict_alcohol_flush, ["rs671"]),
+    "nicotine_dependence": (predict_nicotine, ["rs16969968"]),
+    "folate_metabolism": (predict_folate, ["rs1801133"]),
+    "apoe_genotype": (compute_apoe_genotype, ["rs429358", "rs7412"]),
+}
+
+# Union of every locus the trait models read
+TRAIT_LOCI = sorted({rsid for _, loci in TRAIT_MODELS.values() for rsid in loci})
 
 
 # ---------------------------------------------------------
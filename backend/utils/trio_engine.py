@@ -0,0 +1,217 @@
+"""
+Trio consistency checks for families that upload a real child together
+with both parents:
+
+- Mendelian inconsistency counts (overall and per chromosome)
+- Parentage verification per parent (opposite-homozygote test)
+- Sample-swap detection (duplicates and swapped child/parent roles)
+
+All comparisons run on genotype codes from `genome_arrays`, aligned on
+the loci shared by the three files.
+"""
+
+import numpy as np
+
+from utils.genome_arrays import (
+    AUTOSOMES,
+    CHROM_NAMES,
+    align_genomes,
+    allele_masks,
+    encode_genome,
+)
+
+# Error-rate thresholds (fraction of informative autosomal loci).
+# Genotyping error on consumer arrays is well below 0.5%; unrelated
+# individuals produce several percent opposite homozygotes.
+CONSISTENT_RATE = 0.005
+EXCLUDED_RATE = 0.02
+# Genotype concordance above this means two files are the same person
+DUPLICATE_CONCORDANCE = 0.99
+
+MIN_LOCI_HIGH = 20000
+MIN_LOCI_MEDIUM = 2000
+
+
+# ---------------------------------------------------------
+# Vectorized primitives
+# ---------------------------------------------------------
+def _called(*codes):
+    ok = codes[0] != 0
+    for c in codes[1:]:
+        ok &= c != 0
+    return ok
+
+
+def _mendel_errors(parent_a, parent_b, child):
+    """
+    Boolean array: True where the child genotype cannot be formed from
+    one allele from each parent.
+    """
+    a_mask = allele_masks(parent_a[0], parent_a[1])
+    b_mask = allele_masks(parent_b[0], parent_b[1])
+    one = np.uint8(1)
+    c1 = one << child[0]
+    c2 = one << child[1]
+
+    ok = (((c1 & a_mask) != 0) & ((c2 & b_mask) != 0)) | \
+         (((c2 & a_mask) != 0) & ((c1 & b_mask) != 0))
+    return ~ok
+
+
+def _opposite_homozygotes(parent, child):
+    """True where parent and child share no allele at all."""
+    return (allele_masks(parent[0], parent[1]) & allele_masks(child[0], child[1])) == 0
+
+
+def _concordance(x, y):
+    same = ((x[0] == y[0]) & (x[1] == y[1])) | ((x[0] == y[1]) & (x[1] == y[0]))
+    return float(same.mean()) if same.size else 0.0
+
+
+def _rate(errors, total):
+    return round(errors / total, 6) if total else None
+
+
+# ---------------------------------------------------------
+# Classification helpers
+# ---------------------------------------------------------
+def _parentage_status(rate):
+    if rate is None:
+        return "Unknown"
+    if rate <= CONSISTENT_RATE:
+        return "Consistent"
+    if rate >= EXCLUDED_RATE:
+        return "Excluded"
+    return "Inconclusive"
+
+
+def _confidence(n_loci, rate):
+    if rate is None or n_loci < 200:
+        return "Low"
+    # rates right at a threshold are never a confident call
+    if CONSISTENT_RATE < rate < EXCLUDED_RATE:
+        return "Low"
+    if n_loci >= MIN_LOCI_HIGH:
+        return "High"
+    if n_loci >= MIN_LOCI_MEDIUM:
+        return "Medium"
+    return "Low"
+
+
+# ---------------------------------------------------------
+# Main entry
+# ---------------------------------------------------------
+def check_trio(parentA_genome, parentB_genome, child_genome):
+    """
+    Returns:
+    {
+      "loci_compared": 512034,
+      "mendelian_errors": 212,
+      "mendelian_error_rate": 0.000414,
+      "per_chromosome": { "1": {"loci": ..., "errors": ..., "error_rate": ...}, ... },
+      "parentage": { "parentA": {...}, "parentB": {...} },
+      "sample_swap": { "detected": False, "issues": [] },
+      "call": "Consistent trio",
+      "confidence": "High"
+    }
+    Only autosomes are scored; X/Y/MT inheritance depends on sex.
+    """
+    encoded = [encode_genome(g) for g in (parentA_genome, parentB_genome, child_genome)]
+    _, (ia, ib, ic) = align_genomes(*encoded)
+
+    chrom = encoded[2]["chrom"][ic]
+    gts = [
+        (enc["a1"][idx], enc["a2"][idx])
+        for enc, idx in zip(encoded, (ia, ib, ic))
+    ]
+
+    keep = np.isin(chrom, AUTOSOMES) & _called(*(a for g in gts for a in g))
+    chrom = chrom[keep]
+    parent_a, parent_b, child = [(g[0][keep], g[1][keep]) for g in gts]
+    n_loci = int(keep.sum())
+
+    errors = _mendel_errors(parent_a, parent_b, child)
+    n_errors = int(errors.sum())
+    rate = _rate(n_errors, n_loci)
+
+    # Per-chromosome error rates
+    loci_per_chrom = np.bincount(chrom, minlength=23)
+    errors_per_chrom = np.bincount(chrom, weights=errors, minlength=23)
+    per_chromosome = {}
+    for code in AUTOSOMES:
+        total = int(loci_per_chrom[code])
+        if total == 0:
+            continue
+        errs = int(errors_per_chrom[code])
+        per_chromosome[CHROM_NAMES[code]] = {
+            "loci": total,
+            "errors": errs,
+            "error_rate": _rate(errs, total),
+        }
+
+    # Duo checks: each parent against the child on its own
+    parentage = {}
+    for role, parent in (("parentA", parent_a), ("parentB", parent_b)):
+        oh = int(_opposite_homozygotes(parent, child).sum())
+        oh_rate = _rate(oh, n_loci)
+        parentage[role] = {
+            "opposite_homozygotes": oh,
+            "rate": oh_rate,
+            "status": _parentage_status(oh_rate),
+            "confidence": _confidence(n_loci, oh_rate),
+        }
+
+    # Sample-swap detection
+    issues = []
+    samples = {"parentA": parent_a, "parentB": parent_b, "child": child}
+    names = list(samples)
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            conc = _concordance(samples[names[i]], samples[names[j]])
+            if conc >= DUPLICATE_CONCORDANCE:
+                issues.append({
+                    "type": "duplicate_sample",
+                    "samples": [names[i], names[j]],
+                    "concordance": round(conc, 4),
+                })
+
+    # If the trio only works with a different file in the child role,
+    # the uploads were most likely swapped.
+    role_rates = {
+        "child": n_errors,
+        "parentA": int(_mendel_errors(child, parent_b, parent_a).sum()),
+        "parentB": int(_mendel_errors(parent_a, child, parent_b).sum()),
+    }
+    best_role = min(role_rates, key=role_rates.get)
+    if best_role != "child" and role_rates[best_role] < n_errors / 2:
+        issues.append({
+            "type": "role_swap",
+            "likely_child": best_role,
+            "mendelian_error_rate": _rate(role_rates[best_role], n_loci),
+        })
+
+    statuses = {parentage["parentA"]["status"], parentage["parentB"]["status"]}
+    if n_loci == 0:
+        call = "Insufficient overlap"
+    elif issues:
+        call = "Sample swap suspected"
+    elif rate <= CONSISTENT_RATE:
+        call = "Consistent trio"
+    elif statuses == {"Excluded"}:
+        call = "Neither parent consistent"
+    elif "Excluded" in statuses:
+        excluded = [r for r, p in parentage.items() if p["status"] == "Excluded"]
+        call = f"{excluded[0]} excluded"
+    else:
+        call = "Inconclusive"
+
+    return {
+        "loci_compared": n_loci,
+        "mendelian_errors": n_errors,
+        "mendelian_error_rate": rate,
+        "per_chromosome": per_chromosome,
+        "parentage": parentage,
+        "sample_swap": {"detected": bool(issues), "issues": issues},
+        "call": call,
+        "confidence": _confidence(n_loci, rate),
+    }
@@ -0,0 +1,677 @@
+"""
+VCF input (plain, gzip or bgzip) for whole-genome / exome files.
+
+Records are streamed one line at a time and never held in memory; only
+the calls that end up in the genome are kept. Unless asked for every
+record (panel=ALL_RECORDS), a VCF is read at the engines' loci only
+(default_panel), so memory is bounded by the panel, not the file. A
+bgzipped VCF with a tabix (.tbi) or CSI (.csi) index is read
+region by region: only the BGZF blocks overlapping panel positions are
+decompressed. A bgzipped VCF without an index gets a .tbi written next
+to it during the (single) streaming pass, so the next read of the same
+file can seek.
+
+Yields the same (rsid, chrom, pos, genotype) tuples as the consumer
+array parsers in dna_parser.
+"""
+
+import gzip
+import os
+import struct
+import zlib
+
+from utils.carrier_engine import DOMINANT_GENES, GENE_PANELS
+from utils.genome_arrays import CHROM_NAMES, chrom_code
+from utils.liftover import TARGET_BUILD, can_lift, lift_positions
+
+# panel value that reads every record of a VCF (see read_vcf)
+ALL_RECORDS = "all"
+
+# Panel positions closer than this are fetched as one region
+REGION_MERGE_BP = 100000
+
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+BGZF_BLOCK_DATA = 0xff00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+# tabix binning scheme (.tbi); CSI stores its own in the header
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+
+VCF_CHROM_ALIASES = {"M": "MT"}
+
+# (index path, mtime) -> parsed index
+VCF_INDEXES = {}
+
+# Built once per process (see default_panel)
+DEFAULT_PANEL = {}
+
+
+# ---------------------------------------------------------
+# BGZF
+# ---------------------------------------------------------
+def is_bgzf(path):
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16)
+    except OSError:
+        return False
+    return head[:4] == BGZF_MAGIC and head[12:14] == b"BC"
+
+
+class BgzfReader:
+    """
+    Block-wise reader over a BGZF file with htslib virtual offsets
+    (compressed block start << 16 | offset within the block).
+    """
+
+    def __init__(self, path):
+        self._f = open(path, "rb")
+        self._block_start = 0
+        self._next_block = 0
+        self._data = b""
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_block(self, start):
+        self._f.seek(start)
+        head = self._f.read(12)
+        if len(head) < 12:
+            self._block_start = self._next_block = start
+            self._data = b""
+            return False
+        if head[:4] != BGZF_MAGIC:
+            raise ValueError("Not a BGZF block")
+
+        xlen = struct.unpack("<H", head[10:12])[0]
+        extra = self._f.read(xlen)
+        bsize = None
+        i = 0
+        while i + 4 <= len(extra):
+            slen = struct.unpack("<H", extra[i + 2:i + 4])[0]
+            if extra[i:i + 2] == b"BC":
+                bsize = struct.unpack("<H", extra[i + 4:i + 6])[0]
+            i += 4 + slen
+        if bsize is None:
+            raise ValueError("BGZF block without size field")
+
+        rest = self._f.read(bsize + 1 - 12 - xlen)
+        self._data = zlib.decompress(rest[:-8], -15)
+        self._block_start = start
+        self._next_block = start + bsize + 1
+        return True
+
+    def blocks(self, voffset=0):
+        """Yields (block start, offset within block, data) from a virtual offset onwards."""
+        if not self._load_block(voffset >> 16):
+            return
+        data = self._data[voffset & 0xffff:]
+        start = self._block_start
+        within = voffset & 0xffff
+        while True:
+            yield start, within, data
+            if not self._load_block(self._next_block):
+                return
+            start, within, data = self._block_start, 0, self._data
+
+    def lines(self, voffset=0):
+        """
+        Yields (virtual offset of the line, line bytes without newline,
+        virtual offset just past the line).
+        """
+        pending = b""
+        pending_at = None
+        for start, within, data in self.blocks(voffset):
+            pos = 0
+            while True:
+                nl = data.find(b"\n", pos)
+                if nl < 0:
+                    if pos < len(data):
+                        if pending_at is None:
+                            pending_at = (start << 16) | (within + pos)
+                        pending += data[pos:]
+                    break
+                line_at = pending_at if pending_at is not None else (start << 16) | (within + pos)
+                end = (start << 16) | (within + nl + 1)
+                if nl + 1 == len(data):
+                    # line ends exactly at the block boundary
+                    end = self._next_block << 16
+                yield line_at, pending + data[pos:nl], end
+                pending, pending_at = b"", None
+                pos = nl + 1
+        if pending:
+            yield pending_at, pending, self._next_block << 16
+
+
+def _bgzf_compress(data):
+    out = []
+    for i in range(0, len(data), BGZF_BLOCK_DATA):
+        chunk = data[i:i + BGZF_BLOCK_DATA]
+        comp = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = comp.compress(chunk) + comp.flush()
+        out.append(BGZF_MAGIC + b"\0\0\0\0\0\xff\x06\0BC\x02\0")
+        out.append(struct.pack("<H", len(cdata) + 25))
+        out.append(cdata)
+        out.append(struct.pack("<II", zlib.crc32(chunk) & 0xffffffff, len(chunk)))
+    out.append(BGZF_EOF)
+    return b"".join(out)
+
+
+# ---------------------------------------------------------
+# tabix / CSI indexes
+# ---------------------------------------------------------
+def reg2bin(beg, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    """Smallest bin fully containing the 0-based half-open [beg, end)."""
+    end -= 1
+    level, shift = depth, min_shift
+    t = ((1 << depth * 3) - 1) // 7
+    while level > 0:
+        if beg >> shift == end >> shift:
+            return t + (beg >> shift)
+        level -= 1
+        shift += 3
+        t -= 1 << level * 3
+    return 0
+
+
+def reg2bins(beg, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    """All bins that may hold records overlapping [beg, end)."""
+    end -= 1
+    bins = []
+    t = 0
+    shift = min_shift + depth * 3
+    for level in range(depth + 1):
+        bins.extend(range(t + (beg >> shift), t + (end >> shift) + 1))
+        shift -= 3
+        t += 1 << level * 3
+    return bins
+
+
+def _parse_names(blob):
+    return [n.decode() for n in blob.split(b"\0") if n]
+
+
+def load_vcf_index(path):
+    """
+    Reads `path`.tbi or `path`.csi if present.
+
+    Returns
+    {
+      "min_shift": 14, "depth": 5,
+      "refs": { "chr1": {"bins": {bin: [(beg, end), ...]}, "linear": [voff, ...]} },
+    }
+    or None.
+    """
+    for suffix in (".tbi", ".csi"):
+        index_path = path + suffix
+        if not os.path.exists(index_path):
+            continue
+        try:
+            key = (index_path, os.path.getmtime(index_path))
+            if key not in VCF_INDEXES:
+                with gzip.open(index_path, "rb") as f:
+                    VCF_INDEXES[key] = _parse_index(f.read())
+            return VCF_INDEXES[key]
+        except (OSError, ValueError, struct.error):
+            continue
+    return None
+
+
+def _parse_index(raw):
+    magic = raw[:4]
+    off = 4
+    if magic == b"TBI\1":
+        min_shift, depth = TBI_MIN_SHIFT, TBI_DEPTH
+        n_ref = struct.unpack_from("<i", raw, off)[0]
+        off += 4 + 24
+        l_nm = struct.unpack_from("<i", raw, off)[0]
+        off += 4
+        names = _parse_names(raw[off:off + l_nm])
+        off += l_nm
+    elif magic == b"CSI\1":
+        min_shift, depth, l_aux = struct.unpack_from("<iii", raw, off)
+        off += 12
+        aux = raw[off:off + l_aux]
+        off += l_aux
+        names = _parse_names(aux[28:]) if l_aux >= 28 else []
+        n_ref = struct.unpack_from("<i", raw, off)[0]
+        off += 4
+    else:
+        raise ValueError("Unknown index format")
+
+    refs = {}
+    for r in range(n_ref):
+        n_bin = struct.unpack_from("<i", raw, off)[0]
+        off += 4
+        bins = {}
+        for _ in range(n_bin):
+            if magic == b"TBI\1":
+                b, n_chunk = struct.unpack_from("<Ii", raw, off)
+                off += 8
+            else:
+                b, _, n_chunk = struct.unpack_from("<IQi", raw, off)
+                off += 16
+            chunks = struct.unpack_from(f"<{2 * n_chunk}Q", raw, off)
+            off += 16 * n_chunk
+            bins[b] = list(zip(chunks[0::2], chunks[1::2]))
+        linear = []
+        if magic == b"TBI\1":
+            n_intv = struct.unpack_from("<i", raw, off)[0]
+            off += 4
+            linear = list(struct.unpack_from(f"<{n_intv}Q", raw, off))
+            off += 8 * n_intv
+        # CSI without names: keyed by contig number until the header is read
+        refs[names[r] if r < len(names) else r] = {"bins": bins, "linear": linear}
+
+    return {"min_shift": min_shift, "depth": depth, "refs": refs}
+
+
+class TabixBuilder:
+    """Accumulates a .tbi index while a BGZF VCF is streamed."""
+
+    def __init__(self):
+        self.names = []
+        self.refs = {}
+
+    def add(self, chrom, beg, end, start_voff, end_voff):
+        ref = self.refs.get(chrom)
+        if ref is None:
+            self.names.append(chrom)
+            ref = self.refs[chrom] = {"bins": {}, "linear": []}
+
+        chunks = ref["bins"].setdefault(reg2bin(beg, end), [])
+        if chunks and chunks[-1][1] == start_voff:
+            chunks[-1][1] = end_voff
+        else:
+            chunks.append([start_voff, end_voff])
+
+        linear = ref["linear"]
+        last = (end - 1) >> TBI_MIN_SHIFT
+        if len(linear) <= last:
+            linear.extend([None] * (last + 1 - len(linear)))
+        for w in range(beg >> TBI_MIN_SHIFT, last + 1):
+            if linear[w] is None:
+                linear[w] = start_voff
+
+    def to_bytes(self):
+        names = b"".join(n.encode() + b"\0" for n in self.names)
+        # format 2 = VCF, seq/beg/end columns 1/2/0, meta char '#', skip 0
+        out = [b"TBI\1", struct.pack("<8i", len(self.names), 2, 1, 2, 0, ord("#"), 0, len(names)), names]
+        for name in self.names:
+            ref = self.refs[name]
+            out.append(struct.pack("<i", len(ref["bins"])))
+            for b, chunks in ref["bins"].items():
+                out.append(struct.pack("<Ii", b, len(chunks)))
+                out.append(struct.pack(f"<{2 * len(chunks)}Q", *(v for c in chunks for v in c)))
+            linear = ref["linear"]
+            prev = 0
+            for i, v in enumerate(linear):
+                prev = linear[i] = v if v is not None else prev
+            out.append(struct.pack("<i", len(linear)))
+            out.append(struct.pack(f"<{len(linear)}Q", *linear))
+        return _bgzf_compress(b"".join(out))
+
+    def write(self, index_path):
+        tmp = index_path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(self.to_bytes())
+            os.replace(tmp, index_path)
+        except OSError:
+            # read-only upload dir: the index is only an optimisation
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def _region_chunks(index, chrom, beg, end):
+    """Merged (start, end) virtual-offset chunks that can overlap [beg, end)."""
+    ref = index["refs"].get(chrom)
+    if ref is None:
+        return []
+    min_off = 0
+    if ref["linear"]:
+        w = min(beg >> TBI_MIN_SHIFT, len(ref["linear"]) - 1)
+        min_off = ref["linear"][w]
+
+    chunks = []
+    for b in reg2bins(beg, end, index["min_shift"], index["depth"]):
+        chunks.extend(c for c in ref["bins"].get(b, ()) if c[1] > min_off)
+    chunks.sort()
+
+    merged = []
+    for start, stop in chunks:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+# ---------------------------------------------------------
+# Panels
+# ---------------------------------------------------------
+def default_panel():
+    """
+    Loci the engines read: every id of the panel manifest (see
+    panel_manifest), with its GRCh37 position where the reference tables
+    have one, plus the carrier / dominant gene panels. Loci without a
+    position are matched on the ID column only, so region reads skip them.
+    """
+    global DEFAULT_PANEL
+    if DEFAULT_PANEL:
+        return DEFAULT_PANEL
+
+    # imported here: panel_manifest imports dna_parser, which imports this module
+    from utils.panel_manifest import load_panel_manifest
+
+    manifest = load_panel_manifest()
+    positions = [
+        (ident, CHROM_NAMES[chrom], pos)
+        for ident, chrom, pos in zip(manifest["ids"], manifest["chrom"].tolist(), manifest["pos"].tolist())
+        if chrom in CHROM_NAMES and pos
+    ]
+    rsids = {ident for ident in manifest["ids"] if ident.startswith("rs")}
+    for panel in (GENE_PANELS, DOMINANT_GENES):
+        for snps in panel.values():
+            rsids.update(snps)
+    DEFAULT_PANEL = {"positions": positions, "rsids": rsids}
+    return DEFAULT_PANEL
+
+
+def make_panel(loci):
+    """
+    loci: iterable of rsIDs or (rsid, chrom, pos) tuples, or an already
+    built panel dict.
+    """
+    if isinstance(loci, dict):
+        return loci
+    positions, rsids = [], set()
+    for locus in loci:
+        if isinstance(locus, str):
+            rsids.add(locus)
+        else:
+            rsid, chrom, pos = locus
+            rsids.add(rsid)
+            if chrom and pos:
+                positions.append((rsid, str(chrom), int(pos)))
+    return {"positions": positions, "rsids": rsids}
+
+
+def _panel_sites(panel):
+    """{ (chrom, pos): rsid } for position lookups."""
+    return {(normalize_chrom(c), p): rsid for rsid, c, p in panel["positions"]}
+
+
+def _panel_regions(panel):
+    """Panel positions merged into (chrom, start, end) 1-based regions."""
+    by_chrom = {}
+    for _, chrom, pos in panel["positions"]:
+        by_chrom.setdefault(normalize_chrom(chrom), []).append(pos)
+
+    regions = []
+    for chrom, positions in by_chrom.items():
+        positions.sort()
+        start = prev = positions[0]
+        for pos in positions[1:]:
+            if pos - prev > REGION_MERGE_BP:
+                regions.append((chrom, start, prev))
+                start = pos
+            prev = pos
+        regions.append((chrom, start, prev))
+    return regions
+
+
+# ---------------------------------------------------------
+# Records
+# ---------------------------------------------------------
+def normalize_chrom(chrom):
+    c = str(chrom)
+    if c[:3].lower() == "chr":
+        c = c[3:]
+    c = c.upper()
+    return VCF_CHROM_ALIASES.get(c, c)
+
+
+def _allele_letters(alleles):
+    """
+    VCF REF + ALT alleles -> the A/C/G/T/D/I letters used by the array
+    formats (None for symbolic / missing / unrepresentable alleles, which
+    make a call a no-call). In indel records the shorter allele is the
+    deletion; records whose alleles are all multi-base (MNPs, or a
+    multi-base REF with ALT ".") or of more than two lengths have no
+    letters.
+    """
+    real = [a for a in alleles if a and a not in (".", "*") and not a.startswith("<")]
+    lengths = {len(a) for a in real}
+    if lengths == {1}:
+        return [a.upper() if a.upper() in "ACGT" else None for a in alleles]
+    if len(lengths) != 2:
+        return [None] * len(alleles)
+    shortest = min(lengths)
+    return [
+        None if a not in real else "D" if len(a) == shortest else "I"
+        for a in alleles
+    ]
+
+
+def parse_vcf_record(fields, sample_col=9):
+    """
+    fields: split VCF data line. Returns (rsid or None, chrom, pos,
+    genotype) or None for records without a usable call.
+    """
+    if len(fields) <= sample_col:
+        return None
+    fmt = fields[8].split(":")
+    if "GT" not in fmt:
+        return None
+    values = fields[sample_col].split(":")
+    gt_i = fmt.index("GT")
+    if gt_i >= len(values):
+        return None
+
+    gt = values[gt_i].replace("|", "/").split("/")
+    allele_letters = _allele_letters([fields[3]] + fields[4].split(","))
+    letters = []
+    for a in gt:
+        if not a.isdigit() or int(a) >= len(allele_letters):
+            return None
+        letter = allele_letters[int(a)]
+        if letter is None:
+            return None
+        letters.append(letter)
+    if len(letters) == 1:
+        letters.append(letters[0])
+
+    rsid = None
+    for ident in fields[2].split(";"):
+        if ident.startswith("rs"):
+            rsid = ident
+            break
+
+    return rsid, normalize_chrom(fields[0]), int(fields[1]), f"{letters[0]}/{letters[1]}"
+
+
+def _keep(record, panel, sites):
+    """
+    Final identifier for a record, or None if it is not wanted. Records
+    without an rsID are kept as "chrom:pos" (matched to reference rsIDs
+    by position later, see dna_parser.Genome).
+    """
+    rsid, chrom, pos, _ = record
+    if panel is None:
+        return rsid or f"{chrom}:{pos}"
+    if rsid in panel["rsids"]:
+        return rsid
+    return sites.get((chrom, pos))
+
+
+def iter_vcf_records(lines, panel=None):
+    """
+    Streams (rsid, chrom, pos, genotype) from VCF text lines.
+    panel: restrict to panel loci (by ID or by position); None keeps
+    every record.
+    """
+    sites = _panel_sites(panel) if panel else {}
+    for line in lines:
+        if not line or line[0] == "#":
+            continue
+        # cheap position check before splitting the sample columns
+        if panel is not None:
+            head = line.split("\t", 3)
+            if len(head) < 4 or not head[1].isdigit():
+                continue
+            if (normalize_chrom(head[0]), int(head[1])) not in sites and \
+                    not any(i in panel["rsids"] for i in head[2].split(";")):
+                continue
+        record = parse_vcf_record(line.rstrip("\n").split("\t"))
+        if record is None:
+            continue
+        rsid = _keep(record, panel, sites)
+        if rsid:
+            yield (rsid,) + record[1:]
+
+
+def _vcf_header_names(reader):
+    """Contig names from ##contig lines (for CSI indexes without names)."""
+    names = []
+    for _, line, _ in reader.lines(0):
+        if not line.startswith(b"#"):
+            break
+        if line.startswith(b"##contig=<ID="):
+            names.append(line[13:].split(b",")[0].rstrip(b">").decode())
+    return names
+
+
+def _read_regions(path, index, panel):
+    """Region reads through a tabix/CSI index."""
+    sites = _panel_sites(panel)
+    with BgzfReader(path) as reader:
+        if any(isinstance(name, int) for name in index["refs"]):
+            names = _vcf_header_names(reader)
+            index["refs"] = {
+                names[k] if isinstance(k, int) and k < len(names) else k: v
+                for k, v in index["refs"].items()
+            }
+        # index names as written in the file ("chr1" or "1")
+        file_names = {normalize_chrom(n): n for n in index["refs"] if isinstance(n, str)}
+
+        for chrom, start, end in _panel_regions(panel):
+            name = file_names.get(chrom)
+            if name is None:
+                continue
+            for chunk_start, chunk_end in _region_chunks(index, name, start - 1, end):
+                for voff, raw, _ in reader.lines(chunk_start):
+                    if voff >= chunk_end:
+                        break
+                    fields = raw.decode(errors="ignore").split("\t")
+                    if len(fields) < 2 or fields[0] != name:
+                        continue
+                    pos = int(fields[1])
+                    if pos > end:
+                        break
+                    if pos < start:
+                        continue
+                    record = parse_vcf_record(fields)
+                    if record is None:
+                        continue
+                    rsid = _keep(record, panel, sites)
+                    if rsid:
+                        yield (rsid,) + record[1:]
+
+
+def _stream_and_index(path, panel):
+    """Single streaming pass over a BGZF VCF that also builds its .tbi."""
+    builder = TabixBuilder()
+    with BgzfReader(path) as reader:
+        lines = reader.lines(0)
+
+        def text():
+            for voff, raw, end in lines:
+                line = raw.decode(errors="ignore")
+                if line and line[0] != "#":
+                    head = line.split("\t", 5)
+                    if len(head) >= 4:
+                        beg = int(head[1]) - 1
+                        builder.add(head[0], beg, beg + max(1, len(head[3])), voff, end)
+                yield line
+
+        yield from iter_vcf_records(text(), panel)
+
+    builder.write(path + ".tbi")
+
+
+def read_vcf_header(path):
+    """The ## meta lines of a VCF (plain, gzip or bgzip)."""
+    opener = gzip.open if path.endswith(".gz") or is_bgzf(path) else open
+    lines = []
+    with opener(path, "rt", errors="ignore") as f:
+        for line in f:
+            if not line.startswith("##"):
+                break
+            lines.append(line.rstrip("\n"))
+    return lines
+
+
+def panel_for_build(panel, build):
+    """
+    Panel positions (GRCh37) moved onto the file's build. Without a
+    chain file the positions are dropped and loci match by ID only.
+    """
+    if build in (None, TARGET_BUILD) or not panel["positions"]:
+        return panel
+    if not can_lift(TARGET_BUILD, build):
+        return {"positions": [], "rsids": panel["rsids"]}
+
+    rsids = [p[0] for p in panel["positions"]]
+    chrom = [chrom_code(p[1]) for p in panel["positions"]]
+    pos = [p[2] for p in panel["positions"]]
+    new_chrom, new_pos, _, mapped = lift_positions(chrom, pos, TARGET_BUILD, build)
+    positions = [
+        (rsid, CHROM_NAMES[c], p)
+        for rsid, c, p, ok in zip(rsids, new_chrom.tolist(), new_pos.tolist(), mapped.tolist())
+        if ok
+    ]
+    return {"positions": positions, "rsids": panel["rsids"]}
+
+
+def read_vcf(path, panel=None, build=None):
+    """
+    Streams (rsid, chrom, pos, genotype) from a VCF.
+
+    panel: loci to keep (see make_panel); None for `default_panel()`,
+    ALL_RECORDS for every record (memory then grows with the file).
+    build: the file's genome build, used to move panel positions
+    onto it before region reads (records are yielded as in the file).
+    """
+    if panel is None:
+        panel = default_panel()
+    elif isinstance(panel, str) and panel == ALL_RECORDS:
+        panel = None
+    else:
+        panel = make_panel(panel)
+    if panel is not None:
+        panel = panel_for_build(panel, build)
+
+    if is_bgzf(path):
+        index = load_vcf_index(path)
+        if index is not None and panel is not None and panel["positions"]:
+            # rsID-only panel loci have no position to seek to and are skipped
+            yield from _read_regions(path, index, panel)
+            return
+        if index is None:
+            yield from _stream_and_index(path, panel)
+            return
+        with gzip.open(path, "rt", errors="ignore") as f:
+            yield from iter_vcf_records(f, panel)
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="ignore") as f:
+        yield from iter_vcf_records(f, panel)
@@ -1,26 +1,15 @@
 "use client";
-import { useState } from 'react';
-import { uploadSingleDNA } from '@/lib/api';
-import { Button, Typography, CircularProgress, Card, CardContent, Stack, Chip } from '@mui/material';
+import FileUpload from '@/components/FileUpload';
+import { Typography, Card, CardContent, Stack, Chip } from '@mui/material';
 import UploadFileIcon from "@mui/icons-material/UploadFile";
 import VerifiedIcon from "@mui/icons-material/Verified";
 import { useRouter } from 'next/navigation';
 
 export default function UploadPage() {
   const router = useRouter();
-  const [loading, setLoading] = useState(false);
-  const [file, setFile] = useState(null);
 
-  async function handleUpload() {
-    if (!file) return;
-
-    setLoading(true);
-    const formData = new FormData();
-    formData.append("file", file);
-
-    const data = await uploadSingleDNA(formData);
+  function handleUploaded(data) {
     sessionStorage.setItem("reportData", JSON.stringify(data));
-    setLoading(false);
     router.push("/report");
   }
 
@@ -39,22 +28,7 @@ export default function UploadPage() {
             <Chip icon={<UploadFileIcon />} label="No data leaves your browser" variant="outlined" />
           </Stack>
 
-          <input 
-            type='file' 
-            accept='.txt,.csv' 
-            onChange={(e)=>setFile(e.target.files[0])}
-            style={{ marginTop: 10 }}
-          />
-
-          <Button 
-            startIcon={loading ? null : <UploadFileIcon />}
-            variant='contained' 
-            sx={{ mt:2, alignSelf: "flex-start" }} 
-            disabled={!file || loading} 
-            onClick={handleUpload}
-          >
-            {loading ? <CircularProgress size={24}/> : "Analyze & show genotypes"}
-          </Button>
+          <FileUpload onUploaded={handleUploaded} />
         </CardContent>
       </Card>
     </div>
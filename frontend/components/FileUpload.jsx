@@ -1,14 +1,44 @@
 "use client";
-import { Button } from '@mui/material';
+import { useState } from 'react';
+import { Button, CircularProgress, Stack, Typography } from '@mui/material';
+import UploadFileIcon from "@mui/icons-material/UploadFile";
+import { uploadDNAFile } from '@/lib/api';
+
+const STAGES = {
+  extracting: "Reading the markers we need…",
+  uploading: "Analyzing…",
+};
+
+// Picks a raw DNA file and uploads it (its extracted panel when possible, see uploadDNAFile)
+export default function FileUpload({ onUploaded, label = "Analyze & show genotypes" }) {
+  const [file, setFile] = useState(null);
+  const [stage, setStage] = useState(null);
+
+  async function handleUpload() {
+    if (!file) return;
+    const data = await uploadDNAFile(file, setStage);
+    setStage(null);
+    onUploaded(data);
+  }
 
-export default function FileUpload({ onSelect }) {
   return (
-    <div>
-      <input 
-        type='file' 
-        accept='.txt,.csv'
-        onChange={(e)=>onSelect(e.target.files[0])}
+    <Stack spacing={2} alignItems="flex-start">
+      <input
+        type='file'
+        accept='.txt,.csv,.gz,.zip,.vcf'
+        onChange={(e)=>setFile(e.target.files[0])}
+        style={{ marginTop: 10 }}
       />
-    </div>
+
+      <Button
+        startIcon={stage ? null : <UploadFileIcon />}
+        variant='contained'
+        disabled={!file || !!stage}
+        onClick={handleUpload}
+      >
+        {stage ? <CircularProgress size={24}/> : label}
+      </Button>
+      {stage && <Typography variant='body2' color="text.secondary">{STAGES[stage]}</Typography>}
+    </Stack>
   );
 }
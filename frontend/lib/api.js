@@ -24,3 +24,75 @@ export async function generatePDF(json) {
   });
   return await res.blob();
 }
+
+// Loci the backend reads; cached across visits and revalidated by version
+export async function fetchPanelManifest() {
+  const cached = JSON.parse(localStorage.getItem("panelManifest") || "null");
+  const res = await fetch(`${BACKEND_URL}/panel_manifest`, {
+    headers: cached ? { "If-None-Match": `"${cached.version}"` } : {}
+  });
+  if (res.status === 304 && cached) return cached;
+  if (!res.ok) throw new Error(`panel manifest: HTTP ${res.status}`);
+
+  const { version, ids } = await res.json();
+  const manifest = { version, ids };
+  try {
+    localStorage.setItem("panelManifest", JSON.stringify(manifest));
+  } catch (e) {
+    // storage full or disabled: fetch again next time
+  }
+  return manifest;
+}
+
+export async function uploadPanel(payload, name) {
+  const res = await fetch(`${BACKEND_URL}/upload_panel?name=${encodeURIComponent(name)}`, {
+    method: "POST",
+    headers: { "Content-Type": "application/octet-stream" },
+    body: payload
+  });
+  return { status: res.status, data: await res.json() };
+}
+
+// Runs lib/panelWorker.js on a file: { payload, found, rows } or { payload: null }
+export function extractPanel(file, manifest) {
+  return new Promise((resolve) => {
+    const worker = new Worker(new URL("./panelWorker.js", import.meta.url));
+    worker.onmessage = ({ data }) => {
+      worker.terminate();
+      resolve(data);
+    };
+    worker.onerror = (e) => {
+      worker.terminate();
+      resolve({ payload: null, reason: e.message });
+    };
+    worker.postMessage({ file, manifest });
+  });
+}
+
+/*
+ * Uploads a raw DNA file: only its panel (extracted in a worker) when the
+ * browser and file allow it, otherwise the whole file to /upload_dna.
+ * onStage("extracting" | "uploading") reports progress.
+ */
+export async function uploadDNAFile(file, onStage = () => {}) {
+  if (typeof Worker !== "undefined" && typeof TextDecoderStream !== "undefined") {
+    try {
+      onStage("extracting");
+      const manifest = await fetchPanelManifest();
+      const { payload } = await extractPanel(file, manifest);
+      if (payload) {
+        onStage("uploading");
+        const { status, data } = await uploadPanel(payload, file.name);
+        // 409: the manifest changed since it was cached; the next upload refreshes it
+        if (status === 200) return data;
+      }
+    } catch (e) {
+      // fall back to the full file
+    }
+  }
+
+  onStage("uploading");
+  const formData = new FormData();
+  formData.append("file", file);
+  return uploadSingleDNA(formData);
+}
@@ -0,0 +1,111 @@
+/*
+ * Extracts the backend's panel (see backend/utils/panel_manifest.py) from a
+ * raw DNA file, off the main thread, so only a few KB are uploaded.
+ *
+ * in:  { file, manifest: { version, ids } }
+ * out: { payload: ArrayBuffer, found, rows } or { payload: null, reason }
+ *      when the file is not a text export we can read (the caller then
+ *      uploads the whole file).
+ *
+ * Reads 23andMe / AncestryDNA (tab separated) and MyHeritage / FTDNA
+ * (quoted CSV) exports, plain or .gz.
+ */
+
+const PAYLOAD_MAGIC = [0x44, 0x4e, 0x41, 0x50]; // "DNAP"
+const PAYLOAD_FORMAT = 1;
+const ALLELE_CODES = { A: 1, C: 2, G: 3, T: 4, D: 5, I: 6 };
+const CHROM_NAMES = { 23: "X", 24: "Y", 25: "X", 26: "MT", M: "MT", XY: "X" };
+
+function normalizeChrom(chrom) {
+  const c = chrom.toUpperCase().replace(/^CHR/, "");
+  return CHROM_NAMES[c] || c;
+}
+
+// (allele 1 << 3) | allele 2, 0 for no-calls; haploid calls are homozygous
+function genotypeCode(genotype) {
+  let g = genotype.replace(/[/|]/g, "").toUpperCase();
+  if (g.length === 1) g += g;
+  if (g.length !== 2) return 0;
+  const a1 = ALLELE_CODES[g[0]];
+  const a2 = ALLELE_CODES[g[1]];
+  return a1 && a2 ? (a1 << 3) | a2 : 0;
+}
+
+// [id, chrom, pos, genotype] of a data row, null for headers / comments
+function parseRow(line) {
+  if (!line || line[0] === "#") return null;
+  const cols = line.split(line.includes("\t") ? "\t" : ",").map((c) => c.trim().replace(/^"|"$/g, ""));
+  if (cols.length < 4 || !/^\d+$/.test(cols[2])) return null;
+  // AncestryDNA splits the genotype in two columns
+  const genotype = cols.length >= 5 && cols[3].length === 1 && cols[4].length === 1 ? cols[3] + cols[4] : cols[3];
+  return [cols[0], normalizeChrom(cols[1]), cols[2], genotype];
+}
+
+async function* lines(file) {
+  let stream = file.stream();
+  if (file.name.toLowerCase().endsWith(".gz")) {
+    stream = stream.pipeThrough(new DecompressionStream("gzip"));
+  }
+  const reader = stream.pipeThrough(new TextDecoderStream()).getReader();
+  let rest = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    const chunk = rest + value;
+    const parts = chunk.split(/\r?\n/);
+    rest = parts.pop();
+    yield* parts;
+  }
+  if (rest) yield rest;
+}
+
+function encodePayload(version, entries) {
+  entries.sort((a, b) => a[0] - b[0]);
+  const count = entries.length;
+  const buffer = new ArrayBuffer(25 + 5 * count);
+  const bytes = new Uint8Array(buffer);
+  const view = new DataView(buffer);
+
+  bytes.set(PAYLOAD_MAGIC, 0);
+  view.setUint8(4, PAYLOAD_FORMAT);
+  for (let i = 0; i < 16; i++) view.setUint8(5 + i, version.charCodeAt(i) || 0);
+  view.setUint32(21, count, true);
+  entries.forEach(([index, code], i) => {
+    view.setUint32(25 + 4 * i, index, true);
+    view.setUint8(25 + 4 * count + i, code);
+  });
+  return buffer;
+}
+
+async function extractPanel(file, manifest) {
+  const name = file.name.toLowerCase();
+  if (name.endsWith(".zip") || /\.vcf(\.gz)?$/.test(name)) {
+    return { payload: null, reason: "unsupported format" };
+  }
+
+  const position = new Map(manifest.ids.map((id, i) => [id, i]));
+  const found = new Map();
+  let rows = 0;
+  for await (const line of lines(file)) {
+    const row = parseRow(line);
+    if (!row) continue;
+    rows++;
+    const [id, chrom, pos, genotype] = row;
+    const index = position.has(id) ? position.get(id) : position.get(`${chrom}:${pos}`);
+    if (index === undefined || found.has(index)) continue;
+    found.set(index, genotypeCode(genotype));
+  }
+
+  if (!rows) return { payload: null, reason: "no genotype rows" };
+  const payload = encodePayload(manifest.version, [...found.entries()]);
+  return { payload, found: found.size, rows };
+}
+
+self.onmessage = async ({ data }) => {
+  try {
+    const result = await extractPanel(data.file, data.manifest);
+    self.postMessage(result, result.payload ? [result.payload] : []);
+  } catch (e) {
+    self.postMessage({ payload: null, reason: String(e) });
+  }
+};
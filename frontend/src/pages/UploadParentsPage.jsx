@@ -32,11 +32,10 @@ export default function UploadParentsPage() {
       const data = await res.json();
 
       if (data.status === "ok") {
-        const count = Object.keys(data.genotypes).length;
-
         setParent({
           fileName: file.name,
-          snpCount: count,
+          snpCount: data.snp_count,
+          genomeId: data.genome_id,
           genotypes: data.genotypes,
         });
       } else {
@@ -54,8 +53,9 @@ export default function UploadParentsPage() {
   const handleNext = () => {
     navigate("/childResults", {
       state: {
-        parent1: parent1.genotypes,
-        parent2: parent2.genotypes,
+        // handles of the parsed uploads; the backend keeps the genomes
+        parent1: parent1.genomeId,
+        parent2: parent2.genomeId,
         mode,
       },
     });